@@ -3,6 +3,231 @@ from py_animus.manifest_management import *
 from py_animus import get_logger
 import traceback
 import boto3
+import os
+import threading
+import heapq
+import itertools
+import collections
+
+
+# Characters used to split a large key range in smaller ranges, in ascending order
+_LISTING_SPLIT_CHARACTERS = '-.0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz~'
+
+
+def _new_listing_segment(prefix: str, start_after: str=None, end_at: str=None, skip_prefix: str=None, keys: list=None)->dict:
+    # A segment holds the keys of the range (start_after, end_at] under a prefix. Segments never overlap.
+    segment = {
+        'Prefix': prefix,
+        'StartAfter': start_after,
+        'EndAt': end_at,
+        'SkipPrefix': skip_prefix,
+        'Keys': collections.deque(),
+        'Done': False,
+        'Claimed': False,
+        'Children': list(),
+    }
+    if keys is not None:
+        segment['Keys'].extend(keys)
+        segment['Done'] = True
+        segment['Claimed'] = True
+    return segment
+
+
+def _split_listing_segment(segment: dict, page_keys: list, max_children: int=16)->list:
+    # The part of the range after the last listed key is split at the characters following the common prefix of the last
+    # page of keys. Ranges that are still large are split again once they have been listed for a while.
+    if len(page_keys) < 2:
+        return list()
+    last_key = page_keys[-1]
+    common_prefix = os.path.commonprefix([page_keys[0], last_key])
+    boundaries = list()
+    for character in _LISTING_SPLIT_CHARACTERS:
+        boundary = '{}{}'.format(common_prefix, character)
+        if boundary > last_key and (segment['EndAt'] is None or boundary < segment['EndAt']):
+            boundaries.append(boundary)
+    if len(boundaries) == 0:
+        return list()
+    boundaries = boundaries[::(len(boundaries) + max_children - 2) // (max_children - 1)]
+    children = list()
+    start_after = last_key
+    for boundary in boundaries:
+        children.append(_new_listing_segment(prefix=segment['Prefix'], start_after=start_after, end_at=boundary))
+        start_after = boundary
+    children.append(_new_listing_segment(prefix=segment['Prefix'], start_after=start_after, end_at=segment['EndAt']))
+    return children
+
+
+def _list_s3_keys_partitioned(client: object, bucket_name: str, prefix: str='', max_workers: int=8, page_size: int=1000, split_after_pages: int=4, max_buffered_keys: int=500000):
+    # The top level prefixes (found with a "/" delimiter) are listed concurrently, and prefixes with many keys are split
+    # further while they are listed. Keys are yielded in the same order as a single list_objects_v2 listing.
+    condition = threading.Condition()
+    state = {
+        'Pending': list(),
+        'Counter': itertools.count(),
+        'Active': 0,
+        'BufferedKeys': 0,
+        'Current': None,
+        'Stop': False,
+        'Error': None,
+    }
+
+    def schedule(segments: list):
+        for segment in segments:
+            if segment['Claimed'] is False:
+                sort_key = segment['StartAfter'] if segment['StartAfter'] is not None else segment['Prefix']
+                heapq.heappush(state['Pending'], (sort_key, next(state['Counter']), segment))
+        condition.notify_all()
+
+    def list_segment(segment: dict):
+        parameters = {'Bucket': bucket_name, 'Prefix': segment['Prefix'], 'MaxKeys': page_size}
+        if segment['StartAfter'] is not None:
+            parameters['StartAfter'] = segment['StartAfter']
+        pages = 0
+        while True:
+            with condition:
+                # Segments that are not consumed yet stop listing when too many keys are waiting in memory
+                while state['Stop'] is False and state['BufferedKeys'] >= max_buffered_keys and state['Current'] is not segment:
+                    condition.wait(timeout=1.0)
+                if state['Stop'] is True:
+                    return
+            response = client.list_objects_v2(**parameters)
+            pages += 1
+            page_keys = list()
+            end_reached = response.get('IsTruncated', False) is False
+            for key_data in response.get('Contents', list()):
+                if segment['EndAt'] is not None and key_data['Key'] > segment['EndAt']:
+                    end_reached = True
+                    break
+                if segment['SkipPrefix'] is not None and key_data['Key'].startswith(segment['SkipPrefix']) is True:
+                    continue
+                page_keys.append(key_data)
+            children = list()
+            if end_reached is False and pages >= split_after_pages:
+                with condition:
+                    workers_idle = len(state['Pending']) == 0
+                if workers_idle is True:
+                    children = _split_listing_segment(segment=segment, page_keys=[key_data['Key'] for key_data in page_keys])
+            with condition:
+                segment['Keys'].extend(page_keys)
+                state['BufferedKeys'] += len(page_keys)
+                if end_reached is True or len(children) > 0:
+                    segment['Children'] = children
+                    segment['Done'] = True
+                    schedule(segments=children)
+                    return
+                condition.notify_all()
+            parameters['ContinuationToken'] = response['NextContinuationToken']
+
+    def worker():
+        try:
+            while True:
+                with condition:
+                    while state['Stop'] is False and len(state['Pending']) == 0 and state['Active'] > 0:
+                        condition.wait(timeout=1.0)
+                    if state['Stop'] is True or (len(state['Pending']) == 0 and state['Active'] == 0):
+                        return
+                    if len(state['Pending']) == 0:
+                        continue
+                    segment = heapq.heappop(state['Pending'])[2]
+                    if segment['Claimed'] is True:
+                        continue
+                    segment['Claimed'] = True
+                    state['Active'] += 1
+                try:
+                    list_segment(segment=segment)
+                finally:
+                    with condition:
+                        state['Active'] -= 1
+                        condition.notify_all()
+        except BaseException as e:
+            with condition:
+                state['Error'] = e
+                state['Stop'] = True
+                condition.notify_all()
+
+    def consume(segment: dict):
+        with condition:
+            state['Current'] = segment
+            condition.notify_all()
+            list_inline = segment['Claimed'] is False
+            if list_inline is True:
+                # No worker picked up the segment yet, so rather list it here than wait
+                segment['Claimed'] = True
+                state['Active'] += 1
+        if list_inline is True:
+            try:
+                list_segment(segment=segment)
+            finally:
+                with condition:
+                    state['Active'] -= 1
+                    condition.notify_all()
+        while True:
+            with condition:
+                while len(segment['Keys']) == 0 and segment['Done'] is False and state['Error'] is None:
+                    condition.wait(timeout=1.0)
+                if state['Error'] is not None:
+                    raise state['Error']
+                finished = segment['Done']
+                batch = list(segment['Keys'])
+                segment['Keys'].clear()
+                state['BufferedKeys'] -= len(batch)
+                condition.notify_all()
+            for key_data in batch:
+                yield key_data
+            if finished is True:
+                break
+        for child in segment['Children']:
+            yield from consume(segment=child)
+
+    # Discover the top level prefixes. Keys directly under the prefix are returned by the same requests.
+    root = _new_listing_segment(prefix=prefix, keys=list())
+    parameters = {'Bucket': bucket_name, 'Prefix': prefix, 'Delimiter': '/', 'MaxKeys': page_size}
+    direct_keys = list()
+    pages = 0
+    while True:
+        response = client.list_objects_v2(**parameters)
+        pages += 1
+        items = [(key_data['Key'], key_data) for key_data in response.get('Contents', list())]
+        items += [(common_prefix['Prefix'], None) for common_prefix in response.get('CommonPrefixes', list())]
+        items.sort(key=lambda item: item[0])
+        for name, key_data in items:
+            if key_data is not None:
+                direct_keys.append(key_data)
+                continue
+            if len(direct_keys) > 0:
+                root['Children'].append(_new_listing_segment(prefix=prefix, keys=direct_keys))
+                direct_keys = list()
+            root['Children'].append(_new_listing_segment(prefix=name))
+        if len(direct_keys) > 0:
+            root['Children'].append(_new_listing_segment(prefix=prefix, keys=direct_keys))
+            direct_keys = list()
+        if response.get('IsTruncated', False) is False or len(items) == 0:
+            break
+        if pages >= split_after_pages:
+            # Mostly keys directly under the prefix - the remainder is listed without a delimiter, so that it can be split
+            last_name, last_key_data = items[-1]
+            if last_key_data is not None:
+                root['Children'].append(_new_listing_segment(prefix=prefix, start_after=last_name))
+            else:
+                root['Children'].append(_new_listing_segment(prefix=prefix, start_after='{}\U0010FFFF'.format(last_name), skip_prefix=last_name))
+            break
+        parameters['ContinuationToken'] = response['NextContinuationToken']
+
+    with condition:
+        schedule(segments=root['Children'])
+    threads = list()
+    for worker_number in range(max(1, max_workers - 1)):   # The consumer also lists segments that no worker started yet
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        threads.append(thread)
+    try:
+        yield from consume(segment=root)
+    finally:
+        with condition:
+            state['Stop'] = True
+            condition.notify_all()
+        for thread in threads:
+            thread.join()
 
 
 class AwsBoto3S3Bucket(ManifestBase):
@@ -160,24 +385,51 @@ Since the introduction of environments and variables, it will be possible to use
         except:
             self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
 
-    def _get_s3_keys(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->list:
+    def _get_list_workers(self)->int:
+        list_workers = 1
+        if 'listWorkers' in self.spec:
+            try:
+                if int(self.spec['listWorkers']) > 0:
+                    list_workers = int(self.spec['listWorkers'])
+                else:
+                    self.log(message='The "listWorkers" parameter must be a positive number - using the default value of {}'.format(list_workers), level='warning')
+            except:
+                self.log(message='The "listWorkers" parameter value "{}" is not a number - using the default value of {}'.format(self.spec['listWorkers'], list_workers), level='warning')
+        return list_workers
+
+    def _get_s3_keys(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default', max_keys: int=None)->list:
         keys = list()
         try:
             client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
-            response = client.list_objects_v2(Bucket=self.spec['name'],MaxKeys=100)
-            self.log(message='response={}'.format(json.dumps(response, default=str)), level='debug')
-            if 'Contents' in response:
-                for content in response['Contents']:
-                    if 'Key' in content:
-                        keys.append({'Key': content['Key']})
+            if max_keys is not None:
+                response = client.list_objects_v2(Bucket=self.spec['name'],MaxKeys=max_keys)
+                self.log(message='response={}'.format(json.dumps(response, default=str)), level='debug')
+                if 'Contents' in response:
+                    for content in response['Contents']:
+                        if 'Key' in content:
+                            keys.append({'Key': content['Key']})
+                return keys
+            list_workers = self._get_list_workers()
+            if list_workers > 1:
+                contents = _list_s3_keys_partitioned(client=client, bucket_name=self.spec['name'], max_workers=list_workers)
+            else:
+                paginator = client.get_paginator('list_objects_v2')
+                contents = (content for page in paginator.paginate(Bucket=self.spec['name']) for content in page.get('Contents', list()))
+            for content in contents:
+                keys.append({'Key': content['Key']})
+            self.log(message='Listed {} keys in bucket "{}" using {} listing workers'.format(len(keys), self.spec['name'], list_workers), level='info')
         except:
             self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            if max_keys is None:
+                # A partial listing would end the EMPTY_BUCKET_FIRST delete loop before the bucket is empty
+                raise Exception('Failed to list the keys in bucket "{}"'.format(self.spec['name']))
         return keys
 
     def _delete_keys_batch(self, keys: list, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->list:
         client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
-        response = client.delete_objects(Bucket=self.spec['name'],Delete={'Objects': keys})
-        self.log(message='response={}'.format(json.dumps(response, default=str)), level='debug')
+        for idx in range(0, len(keys), 1000):     # At most 1000 keys can be deleted with one request
+            response = client.delete_objects(Bucket=self.spec['name'],Delete={'Objects': keys[idx:idx+1000]})
+            self.log(message='response={}'.format(json.dumps(response, default=str)), level='debug')
         return self._get_s3_keys(variable_cache=variable_cache, target_environment=target_environment)
 
 
@@ -212,7 +464,7 @@ Since the introduction of environments and variables, it will be possible to use
                     loop_count += 1
                     self.log(message='        Deleting {} keys from bucket "{}" in environment "{}")'.format(len(keys), self.spec['name'], target_environment), level='info')
                     if loop_count % 10 == 0:
-                        self.log(message='            Number of Loops now {} - still carrying on. The process will give up after 1000 loops (100,000 keys)'.format(loop_count), level='info')
+                        self.log(message='            Number of Loops now {} - still carrying on. The process will give up after 1000 loops'.format(loop_count), level='info')
                     keys = self._delete_keys_batch(keys=copy.deepcopy(keys), variable_cache=variable_cache, target_environment=target_environment)
                     if loop_count > 999 and len(keys) > 0:
                         self.log(message='            MAX LOOP COUNT REACHED - QUITTING', level='error')
@@ -221,13 +473,13 @@ Since the introduction of environments and variables, it will be possible to use
                 self._set_variables(exists=False, variable_cache=variable_cache, target_environment=target_environment)
                 self.log(message='    Bucket "{}" in environment "{}" was deleted (uSING "{}" STRATEGY)'.format(self.spec['name'], target_environment, delete_strategy), level='info')
             elif delete_strategy == 'ONLY_IF_ALREADY_EMPTY':
-                keys = self._get_s3_keys(variable_cache=variable_cache, target_environment=target_environment)
+                keys = self._get_s3_keys(variable_cache=variable_cache, target_environment=target_environment, max_keys=100)
                 if len(keys) == 0:
                     self._delete_bucket(variable_cache=variable_cache, target_environment=target_environment)
                     self._set_variables(exists=False, variable_cache=variable_cache, target_environment=target_environment)
                     self.log(message='    Bucket "{}" in environment "{}" was deleted (uSING "{}" STRATEGY)'.format(self.spec['name'], target_environment, delete_strategy), level='info')
             elif delete_strategy == 'IGNORE_WITH_WARNING_IF_NOT_EMPTY':
-                keys = self._get_s3_keys(variable_cache=variable_cache, target_environment=target_environment)
+                keys = self._get_s3_keys(variable_cache=variable_cache, target_environment=target_environment, max_keys=100)
                 if len(keys) == 0:
                     self._delete_bucket(variable_cache=variable_cache, target_environment=target_environment)
                     self._set_variables(exists=False, variable_cache=variable_cache, target_environment=target_environment)
@@ -235,7 +487,7 @@ Since the introduction of environments and variables, it will be possible to use
                 else:
                     self.log(message='    Bucket "{}" in environment "{}" was NOT deleted (bucket NOT empty, deleteStrategy={})'.format(self.spec['name'], target_environment, delete_strategy), level='warning')
             elif delete_strategy == 'EXCEPTION_IF_NOT_EMPTY':
-                keys = self._get_s3_keys(variable_cache=variable_cache, target_environment=target_environment)
+                keys = self._get_s3_keys(variable_cache=variable_cache, target_environment=target_environment, max_keys=100)
                 if len(keys) == 0:
                     self._delete_bucket(variable_cache=variable_cache, target_environment=target_environment)
                     self._set_variables(exists=False, variable_cache=variable_cache, target_environment=target_environment)
@@ -1,29 +1,568 @@
 import traceback
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 import os
 import shutil
 import tempfile
 from pathlib import Path
 import re
 import hashlib
+import base64
+import concurrent.futures
+import itertools
+import sqlite3
+import mmap
+import time
+import threading
+import queue
+import heapq
+import array
+import sys
+import gzip
+import tarfile
+import zlib
+import io
+import collections
+import functools
+import ctypes
+import ctypes.util
+import select
+import struct
+import copy
+import multiprocessing
+import multiprocessing.connection
 from py_animus.manifest_management import *
 from py_animus import get_logger, get_utc_timestamp
 from py_animus.file_io import *
 
 
+def _sha256_file(file_path: str, mmap_threshold: int=1048576)->str:
+    # Module level function so that it can be used by the hashing process pool
+    try:
+        checksum = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size >= mmap_threshold:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    checksum.update(m)
+            elif file_size > 0:
+                checksum.update(f.read())
+        return checksum.hexdigest()
+    except:
+        return None
+
+
+def _sha256_files(file_paths: list)->list:
+    return [(file_path, _sha256_file(file_path=file_path)) for file_path in file_paths]
+
+
+def _key_shard(key: str, shard_count: int)->int:
+    # Keys are partitioned into equal ranges of the first 64 bits of the SHA256 digest of the key
+    return (int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big') * shard_count) >> 64
+
+
+def _bundle_groups(members: list, files_per_bundle: int, maximum_bundle_size: int)->list:
+    # Members are (key, ...) tuples sorted by key. A bundle ends after a key of which the hash selects it as a boundary,
+    # so that adding or removing a file only changes the bundle it belongs to, and not all the bundles that follow.
+    groups = list()
+    group = list()
+    group_size = 0
+    for member in members:
+        group.append(member)
+        group_size += 512 + (member[2] + 511) // 512 * 512     # The tar header and the padded content
+        if group_size >= maximum_bundle_size or int.from_bytes(hashlib.sha256(member[0].encode('utf-8')).digest()[-8:], 'big') % files_per_bundle == 0:
+            groups.append(group)
+            group = list()
+            group_size = 0
+    if len(group) > 0:
+        groups.append(group)
+    return groups
+
+
+# The sync plan is kept as parallel arrays instead of a dict per file, as a plan for hundreds of thousands of files
+# would otherwise consume several GB of memory. Checksums are stored as 32 byte binary digests.
+_SYNC_PLAN_HAS_CHECKSUM = 0x01
+_SYNC_PLAN_CHECKSUM_MISMATCH = 0x02
+_SYNC_PLAN_EMPTY_DIGEST = bytes(32)
+
+
+def _new_sync_plan()->dict:
+    return {
+        'Keys': list(),
+        'LocalFullPaths': list(),
+        'Sizes': array.array('Q'),
+        'Digests': bytearray(),
+        'Flags': bytearray(),
+        'DeleteKeys': list(),
+        'CopySources': dict(),
+        'CopySourceCandidates': list(),
+    }
+
+
+def _sync_plan_add_upload(sync_plan: dict, key_data: dict):
+    flags = 0
+    digest = _SYNC_PLAN_EMPTY_DIGEST
+    if key_data['ContentChecksumSha256'] is not None:
+        flags |= _SYNC_PLAN_HAS_CHECKSUM
+        digest = bytes.fromhex(key_data['ContentChecksumSha256'])
+    if key_data.get('ChecksumMismatch', False) is True:
+        flags |= _SYNC_PLAN_CHECKSUM_MISMATCH
+    sync_plan['Keys'].append(key_data['Key'])
+    sync_plan['LocalFullPaths'].append(key_data['LocalFullPath'])
+    sync_plan['Sizes'].append(key_data['Size'])
+    sync_plan['Digests'] += digest
+    sync_plan['Flags'].append(flags)
+
+
+def _sync_plan_add_delete(sync_plan: dict, key: str):
+    sync_plan['DeleteKeys'].append(sys.intern(key))
+
+
+def _sync_plan_upload_jobs(sync_plan: dict):
+    # Largest files first to shorten the total run time
+    for idx in sorted(range(len(sync_plan['Keys'])), key=sync_plan['Sizes'].__getitem__, reverse=True):
+        content_checksum_sha256 = None
+        if sync_plan['Flags'][idx] & _SYNC_PLAN_HAS_CHECKSUM:
+            content_checksum_sha256 = sync_plan['Digests'][idx*32:(idx+1)*32].hex()
+        if idx in sync_plan['CopySources']:
+            yield {'Action': 'COPY', 'Key': sync_plan['Keys'][idx], 'CopySource': sync_plan['CopySources'][idx], 'LocalFullPath': sync_plan['LocalFullPaths'][idx], 'Size': sync_plan['Sizes'][idx], 'ContentChecksumSha256': content_checksum_sha256}
+            continue
+        yield {'Action': 'UPLOAD', 'Key': sync_plan['Keys'][idx], 'LocalFullPath': sync_plan['LocalFullPaths'][idx], 'ContentChecksumSha256': content_checksum_sha256}
+
+
+def _sync_plan_checksum_differences_detected(sync_plan: dict)->bool:
+    for flags in sync_plan['Flags']:
+        if flags & _SYNC_PLAN_CHECKSUM_MISMATCH:
+            return True
+    return False
+
+
+def _path_pattern_to_regex(pattern: str):
+    # Translates one .gitignore style pattern to a tuple (compiled regex, negated, directory only), or None for comments and blank lines
+    pattern = pattern.rstrip('\n').rstrip(' ')
+    if len(pattern) == 0 or pattern.startswith('#') is True:
+        return None
+    negated = pattern.startswith('!')
+    if negated is True:
+        pattern = pattern[1:]
+    directory_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    anchored = '/' in pattern     # A slash at the start or in the middle anchors the pattern to the base directory
+    pattern = pattern.lstrip('/')
+    regex = ''
+    idx = 0
+    while idx < len(pattern):
+        if pattern[idx:idx+3] == '**/':
+            regex += '(?:.*/)?'
+            idx += 3
+        elif pattern[idx:idx+2] == '**':
+            regex += '.*'
+            idx += 2
+        elif pattern[idx] == '*':
+            regex += '[^/]*'
+            idx += 1
+        elif pattern[idx] == '?':
+            regex += '[^/]'
+            idx += 1
+        elif pattern[idx] == '[' and pattern.find(']', idx + 2) != -1:
+            end = pattern.find(']', idx + 2)
+            character_class = pattern[idx+1:end].replace('\\', '\\\\')
+            if character_class.startswith('!') is True:
+                character_class = '^{}'.format(character_class[1:])
+            regex += '[{}]'.format(character_class)
+            idx = end + 1
+        elif pattern[idx] == '\\' and idx + 1 < len(pattern):
+            regex += re.escape(pattern[idx+1])
+            idx += 2
+        else:
+            regex += re.escape(pattern[idx])
+            idx += 1
+    if anchored is False:
+        regex = '(?:.*/)?{}'.format(regex)
+    return (re.compile('^{}$'.format(regex)), negated, directory_only)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_path_patterns(patterns: tuple)->tuple:
+    rules = list()
+    for pattern in patterns:
+        rule = _path_pattern_to_regex(pattern=pattern)
+        if rule is not None:
+            rules.append(rule)
+    return tuple(rules)
+
+
+def _path_matches_patterns(relative_path: str, is_directory: bool, rules: tuple)->bool:
+    # As with .gitignore files, the last matching pattern decides and a "!" pattern reverses the match
+    matched = False
+    for regex, negated, directory_only in rules:
+        if directory_only is True and is_directory is False:
+            continue
+        if regex.match(relative_path) is not None:
+            matched = not negated
+    return matched
+
+
+def _path_is_included(relative_path: str, rules: tuple)->bool:
+    # Directory patterns in the include list include all the files below the directory
+    if _path_matches_patterns(relative_path=relative_path, is_directory=False, rules=rules) is True:
+        return True
+    parts = relative_path.split('/')
+    for depth in range(1, len(parts)):
+        if _path_matches_patterns(relative_path='/'.join(parts[:depth]), is_directory=True, rules=rules) is True:
+            return True
+    return False
+
+
+def _directory_is_excluded(relative_directory: str, exclude_rules: tuple)->bool:
+    # A directory is excluded when the directory itself or one of its parent directories matches an exclude pattern
+    parts = relative_directory.split('/')
+    for depth in range(1, len(parts) + 1):
+        if _path_matches_patterns(relative_path='/'.join(parts[:depth]), is_directory=True, rules=exclude_rules) is True:
+            return True
+    return False
+
+
+def _path_is_selected(relative_path: str, exclude_rules: tuple, include_rules: tuple)->bool:
+    if '/' in relative_path and _directory_is_excluded(relative_directory=relative_path.rsplit('/', 1)[0], exclude_rules=exclude_rules) is True:
+        return False
+    if _path_matches_patterns(relative_path=relative_path, is_directory=False, rules=exclude_rules) is True:
+        return False
+    if len(include_rules) > 0:
+        return _path_is_included(relative_path=relative_path, rules=include_rules)
+    return True
+
+
+def _directory_already_visited(directory: str, visited_directories: set)->bool:
+    # Directories are identified by device and inode, so that a directory reached again through a symbolic link is recognised
+    try:
+        directory_stat = os.stat(directory)
+    except OSError:
+        return False
+    directory_id = (directory_stat.st_dev, directory_stat.st_ino)
+    if directory_id in visited_directories:
+        return True
+    visited_directories.add(directory_id)
+    return False
+
+
+# inotify is used through ctypes, to avoid an additional dependency. Where inotify is not available, watch mode polls instead.
+_INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_INOTIFY_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+
+def _inotify_open()->dict:
+    if sys.platform.startswith('linux') is False:
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except:
+        return None
+    if fd < 0:
+        return None
+    return {'Libc': libc, 'Fd': fd, 'Directories': dict(), 'Descriptors': dict()}
+
+
+def _inotify_close(watcher: dict):
+    os.close(watcher['Fd'])
+
+
+def _inotify_add_watch(watcher: dict, directory: str)->bool:
+    if directory in watcher['Descriptors']:
+        return True
+    wd = watcher['Libc'].inotify_add_watch(watcher['Fd'], os.fsencode(directory), _INOTIFY_WATCH_MASK)
+    if wd < 0:
+        return False
+    watcher['Directories'][wd] = directory
+    watcher['Descriptors'][directory] = wd
+    return True
+
+
+def _inotify_remove_watches(watcher: dict, directory: str):
+    # Removes the watches of a directory that was moved or deleted, and of all the directories below it
+    directory_prefix = '{}{}'.format(directory, os.sep)
+    for watched_directory in [d for d in watcher['Descriptors'] if d == directory or d.startswith(directory_prefix) is True]:
+        wd = watcher['Descriptors'].pop(watched_directory)
+        watcher['Directories'].pop(wd, None)
+        watcher['Libc'].inotify_rm_watch(watcher['Fd'], wd)
+
+
+def _inotify_read_events(watcher: dict, timeout: float)->list:
+    # Returns a list of (path, mask) tuples, waiting at most timeout seconds for the first event. A path of None means events were lost.
+    readable, _, _ = select.select([watcher['Fd'],], [], [], timeout)
+    if len(readable) == 0:
+        return list()
+    try:
+        buffer = os.read(watcher['Fd'], 1048576)
+    except BlockingIOError:
+        return list()
+    events = list()
+    offset = 0
+    while offset + _INOTIFY_EVENT_HEADER.size <= len(buffer):
+        wd, mask, cookie, name_length = _INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+        offset += _INOTIFY_EVENT_HEADER.size
+        name = buffer[offset:offset+name_length].rstrip(b'\0')
+        offset += name_length
+        if mask & _IN_Q_OVERFLOW:
+            events.append((None, mask))
+            continue
+        directory = watcher['Directories'].get(wd, None)
+        if mask & _IN_IGNORED:
+            if directory is not None and watcher['Descriptors'].get(directory, None) == wd:
+                watcher['Descriptors'].pop(directory)
+            watcher['Directories'].pop(wd, None)
+            continue
+        if directory is None or len(name) == 0:
+            continue
+        events.append(('{}{}{}'.format(directory, os.sep, os.fsdecode(name)), mask))
+    return events
+
+
+# Characters used to split a large key range in smaller ranges, in ascending order
+_LISTING_SPLIT_CHARACTERS = '-.0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz~'
+
+
+def _new_listing_segment(prefix: str, start_after: str=None, end_at: str=None, skip_prefix: str=None, keys: list=None)->dict:
+    # A segment holds the keys of the range (start_after, end_at] under a prefix. Segments never overlap.
+    segment = {
+        'Prefix': prefix,
+        'StartAfter': start_after,
+        'EndAt': end_at,
+        'SkipPrefix': skip_prefix,
+        'Keys': collections.deque(),
+        'Done': False,
+        'Claimed': False,
+        'Children': list(),
+    }
+    if keys is not None:
+        segment['Keys'].extend(keys)
+        segment['Done'] = True
+        segment['Claimed'] = True
+    return segment
+
+
+def _split_listing_segment(segment: dict, page_keys: list, max_children: int=16)->list:
+    # The part of the range after the last listed key is split at the characters following the common prefix of the last
+    # page of keys. Ranges that are still large are split again once they have been listed for a while.
+    if len(page_keys) < 2:
+        return list()
+    last_key = page_keys[-1]
+    common_prefix = os.path.commonprefix([page_keys[0], last_key])
+    boundaries = list()
+    for character in _LISTING_SPLIT_CHARACTERS:
+        boundary = '{}{}'.format(common_prefix, character)
+        if boundary > last_key and (segment['EndAt'] is None or boundary < segment['EndAt']):
+            boundaries.append(boundary)
+    if len(boundaries) == 0:
+        return list()
+    boundaries = boundaries[::(len(boundaries) + max_children - 2) // (max_children - 1)]
+    children = list()
+    start_after = last_key
+    for boundary in boundaries:
+        children.append(_new_listing_segment(prefix=segment['Prefix'], start_after=start_after, end_at=boundary))
+        start_after = boundary
+    children.append(_new_listing_segment(prefix=segment['Prefix'], start_after=start_after, end_at=segment['EndAt']))
+    return children
+
+
+def _list_s3_keys_partitioned(client: object, bucket_name: str, prefix: str='', max_workers: int=8, page_size: int=1000, split_after_pages: int=4, max_buffered_keys: int=500000):
+    # The top level prefixes (found with a "/" delimiter) are listed concurrently, and prefixes with many keys are split
+    # further while they are listed. Keys are yielded in the same order as a single list_objects_v2 listing.
+    condition = threading.Condition()
+    state = {
+        'Pending': list(),
+        'Counter': itertools.count(),
+        'Active': 0,
+        'BufferedKeys': 0,
+        'Current': None,
+        'Stop': False,
+        'Error': None,
+    }
+
+    def schedule(segments: list):
+        for segment in segments:
+            if segment['Claimed'] is False:
+                sort_key = segment['StartAfter'] if segment['StartAfter'] is not None else segment['Prefix']
+                heapq.heappush(state['Pending'], (sort_key, next(state['Counter']), segment))
+        condition.notify_all()
+
+    def list_segment(segment: dict):
+        parameters = {'Bucket': bucket_name, 'Prefix': segment['Prefix'], 'MaxKeys': page_size}
+        if segment['StartAfter'] is not None:
+            parameters['StartAfter'] = segment['StartAfter']
+        pages = 0
+        while True:
+            with condition:
+                # Segments that are not consumed yet stop listing when too many keys are waiting in memory
+                while state['Stop'] is False and state['BufferedKeys'] >= max_buffered_keys and state['Current'] is not segment:
+                    condition.wait(timeout=1.0)
+                if state['Stop'] is True:
+                    return
+            response = client.list_objects_v2(**parameters)
+            pages += 1
+            page_keys = list()
+            end_reached = response.get('IsTruncated', False) is False
+            for key_data in response.get('Contents', list()):
+                if segment['EndAt'] is not None and key_data['Key'] > segment['EndAt']:
+                    end_reached = True
+                    break
+                if segment['SkipPrefix'] is not None and key_data['Key'].startswith(segment['SkipPrefix']) is True:
+                    continue
+                page_keys.append(key_data)
+            children = list()
+            if end_reached is False and pages >= split_after_pages:
+                with condition:
+                    workers_idle = len(state['Pending']) == 0
+                if workers_idle is True:
+                    children = _split_listing_segment(segment=segment, page_keys=[key_data['Key'] for key_data in page_keys])
+            with condition:
+                segment['Keys'].extend(page_keys)
+                state['BufferedKeys'] += len(page_keys)
+                if end_reached is True or len(children) > 0:
+                    segment['Children'] = children
+                    segment['Done'] = True
+                    schedule(segments=children)
+                    return
+                condition.notify_all()
+            parameters['ContinuationToken'] = response['NextContinuationToken']
+
+    def worker():
+        try:
+            while True:
+                with condition:
+                    while state['Stop'] is False and len(state['Pending']) == 0 and state['Active'] > 0:
+                        condition.wait(timeout=1.0)
+                    if state['Stop'] is True or (len(state['Pending']) == 0 and state['Active'] == 0):
+                        return
+                    if len(state['Pending']) == 0:
+                        continue
+                    segment = heapq.heappop(state['Pending'])[2]
+                    if segment['Claimed'] is True:
+                        continue
+                    segment['Claimed'] = True
+                    state['Active'] += 1
+                try:
+                    list_segment(segment=segment)
+                finally:
+                    with condition:
+                        state['Active'] -= 1
+                        condition.notify_all()
+        except BaseException as e:
+            with condition:
+                state['Error'] = e
+                state['Stop'] = True
+                condition.notify_all()
+
+    def consume(segment: dict):
+        with condition:
+            state['Current'] = segment
+            condition.notify_all()
+            list_inline = segment['Claimed'] is False
+            if list_inline is True:
+                # No worker picked up the segment yet, so rather list it here than wait
+                segment['Claimed'] = True
+                state['Active'] += 1
+        if list_inline is True:
+            try:
+                list_segment(segment=segment)
+            finally:
+                with condition:
+                    state['Active'] -= 1
+                    condition.notify_all()
+        while True:
+            with condition:
+                while len(segment['Keys']) == 0 and segment['Done'] is False and state['Error'] is None:
+                    condition.wait(timeout=1.0)
+                if state['Error'] is not None:
+                    raise state['Error']
+                finished = segment['Done']
+                batch = list(segment['Keys'])
+                segment['Keys'].clear()
+                state['BufferedKeys'] -= len(batch)
+                condition.notify_all()
+            for key_data in batch:
+                yield key_data
+            if finished is True:
+                break
+        for child in segment['Children']:
+            yield from consume(segment=child)
+
+    # Discover the top level prefixes. Keys directly under the prefix are returned by the same requests.
+    root = _new_listing_segment(prefix=prefix, keys=list())
+    parameters = {'Bucket': bucket_name, 'Prefix': prefix, 'Delimiter': '/', 'MaxKeys': page_size}
+    direct_keys = list()
+    pages = 0
+    while True:
+        response = client.list_objects_v2(**parameters)
+        pages += 1
+        items = [(key_data['Key'], key_data) for key_data in response.get('Contents', list())]
+        items += [(common_prefix['Prefix'], None) for common_prefix in response.get('CommonPrefixes', list())]
+        items.sort(key=lambda item: item[0])
+        for name, key_data in items:
+            if key_data is not None:
+                direct_keys.append(key_data)
+                continue
+            if len(direct_keys) > 0:
+                root['Children'].append(_new_listing_segment(prefix=prefix, keys=direct_keys))
+                direct_keys = list()
+            root['Children'].append(_new_listing_segment(prefix=name))
+        if len(direct_keys) > 0:
+            root['Children'].append(_new_listing_segment(prefix=prefix, keys=direct_keys))
+            direct_keys = list()
+        if response.get('IsTruncated', False) is False or len(items) == 0:
+            break
+        if pages >= split_after_pages:
+            # Mostly keys directly under the prefix - the remainder is listed without a delimiter, so that it can be split
+            last_name, last_key_data = items[-1]
+            if last_key_data is not None:
+                root['Children'].append(_new_listing_segment(prefix=prefix, start_after=last_name))
+            else:
+                root['Children'].append(_new_listing_segment(prefix=prefix, start_after='{}\U0010FFFF'.format(last_name), skip_prefix=last_name))
+            break
+        parameters['ContinuationToken'] = response['NextContinuationToken']
+
+    with condition:
+        schedule(segments=root['Children'])
+    threads = list()
+    for worker_number in range(max(1, max_workers - 1)):   # The consumer also lists segments that no worker started yet
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        threads.append(thread)
+    try:
+        yield from consume(segment=root)
+    finally:
+        with condition:
+            state['Stop'] = True
+            condition.notify_all()
+        for thread in threads:
+            thread.join()
+
+
 class AwsBoto3S3Files(ManifestBase):
     """Synchronizes files to an S3 bucket (apply action) or deletes the files in an S3 bucket (delete action).
 
 It is important that the bucket remain under control of Animus (both through `AwsBoto3S3Bucket` amd `AwsBoto3S3Files`)
 to avoid inconsistencies or loss of dat or data corruption.
 
-The intent of this facility is to keep file synchronized that are required for IaC activities. Ir was not really meant
-for uploading or synchronizing a large amount of files. Consider using the AWS CLI tool
-[aws s3 sync](https://docs.aws.amazon.com/cli/latest/reference/s3/sync.html) for bulk file uploads (1000+ files)
+The intent of this facility is to keep files synchronized that are required for IaC activities, but it also scales to
+large trees of hundreds of thousands of files. For large syncs, consider the `streaming` sync mode or the `sortMerge`
+diff engine (constant memory use), the `checksumCache`, `remoteIndex` and `listWorkers` parameters (fewer requests and
+faster listings), and the `sharding` parameter to spread one sync over several worker processes or hosts.
 
 When the apply action is complete the following variable will be set:
 
-* `:SYNC_RESULT` - Set to the string `ALL_OK`` when done.
+* `:SYNC_RESULT` - Set to the string `ALL_OK`` when done, or `NOT_OK` if one or more files could not be uploaded or deleted.
 * `:CHECKSUM_DIFFERENCES_DETECTED` - Boolean value which will only be present if some files or directories had the `verifyChecksums` parameter set to `true`. If this variable is `true`, it means some of the files evaluated did have a mismatch in checksum and was re-uploaded. If the `verifyChecksums` parameter was never used, this variable may be absent or have a value of `False`
 
 Both individual files, or entire directory contents can be uploaded.
@@ -43,19 +582,43 @@ Restrictions:
 
     def __init__(self, logger=get_logger(), post_parsing_method: object=None, version: str='v1', supported_versions: tuple=(['v1'])):
         super().__init__(logger=logger, post_parsing_method=post_parsing_method, version=version, supported_versions=supported_versions)
+        self.sync_plans = dict()
+        self.transaction_log = None
+        self.s3_clients = dict()
+        self.bucket_names = dict()
+        self.transfer_tuning = None
+        self.rate_limiting = None
+        self.sync_journal = None
+        self.remote_index = None
+        self.destination = None
+        self.local_source_memo = None
+        self.shard = None
+        self.bundles = None
 
     def _var_name(self, target_environment: str='default'):
-        return '{}:{}:{}'.format(
+        var_name = '{}:{}:{}'.format(
             self.__class__.__name__,
             self.metadata['name'],
             target_environment
         )
+        if self.destination is not None:
+            # Each destination of a manifest with additional destinations has its own results
+            var_name = '{}:{}'.format(var_name, self.destination['s3Bucket'])
+        return var_name
+
+    def _reset_run_cache(self):
+        # Clients and bucket names are re-used for the duration of one apply or delete run, so that a session that was
+        # re-connected between runs is always picked up
+        self.s3_clients = dict()
+        self.bucket_names = dict()
 
     def _get_boto3_s3_client(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
         boto3_session_base_name = 'AwsBoto3Session:{}:{}'.format(
             self.spec['awsBoto3Session'],
             target_environment
         )
+        if boto3_session_base_name in self.s3_clients:
+            return self.s3_clients[boto3_session_base_name]
         if variable_cache.get_value(
             variable_name='{}:CONNECTED'.format(boto3_session_base_name),
             value_if_expired=False,
@@ -73,7 +636,12 @@ Restrictions:
             raise_exception_on_not_found=False
         )
         if boto3_session:
-            return boto3_session.client('s3')
+            # The standard retry mode retries throttled requests (503 SlowDown) with an exponential backoff
+            client = boto3_session.client('s3', config=Config(retries={'mode': 'standard', 'max_attempts': 10}))
+            client.meta.events.register('before-send.s3', self._before_s3_request)
+            client.meta.events.register('response-received.s3', self._after_s3_response)
+            self.s3_clients[boto3_session_base_name] = client
+            return self.s3_clients[boto3_session_base_name]
         raise Exception('Unable to create S3 client')
 
     def _set_variables(self, all_ok: bool=True, checksum_differences_detected: bool=False, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
@@ -98,6 +666,8 @@ Restrictions:
         )
 
     def _get_bucket_name(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->str:
+        if target_environment in self.bucket_names:
+            return self.bucket_names[target_environment]
         bucket_name = variable_cache.get_value(
             variable_name='AwsBoto3S3Bucket:{}:{}:NAME'.format(self.spec['s3Bucket'], target_environment),
             value_if_expired=None,
@@ -108,6 +678,7 @@ Restrictions:
         if bucket_name is not None:
             if isinstance(bucket_name, str):
                 if len(bucket_name) > 0:
+                    self.bucket_names[target_environment] = bucket_name
                     return bucket_name
         raise Exception('Bucket name not found')
 
@@ -123,87 +694,688 @@ Restrictions:
             self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
         return False
 
-    def _get_all_s3_keys(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default', continuation_token: str=None, start_after: str=None)->dict:
-        keys = dict()
+    def _get_s3_key_prefix(self)->str:
+        prefix = ''
+        if 'destinationDirectory' in self.spec:
+            if self.spec['destinationDirectory'] is not None:
+                prefix = self.spec['destinationDirectory'].strip('/')
+        if len(prefix) > 0:
+            prefix = '{}/'.format(prefix)
+        return prefix
+
+    def _iterate_s3_keys(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default', page_size: int=1000, use_remote_index: bool=True, raise_on_error: bool=False):
+        if use_remote_index is True and self.remote_index is not None:
+            yield from self._iterate_remote_index_keys(page_size=page_size)
+            return
+        if use_remote_index is True and self._remote_index_enabled() is True:
+            remote_index_entries = self._read_remote_index_object(
+                client=self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment),
+                bucket_name=self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+            )
+            if remote_index_entries is not None:
+                yield from remote_index_entries
+                return
+        prefix = self._get_s3_key_prefix()
+        list_workers = self._get_list_workers()
+        key_count = 0
+        contents = None
         try:
             client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
-            response = None
-            if continuation_token is not None:
-                if start_after is not None:
-                    response = client.list_objects_v2(
-                        Bucket=self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment),
-                        MaxKeys=100,
-                        ContinuationToken=continuation_token,
-                        StartAfter=start_after
-                    )
-                else:
-                    response = client.list_objects_v2(
-                        Bucket=self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment),
-                        MaxKeys=100,
-                        ContinuationToken=continuation_token
-                    )
+            bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+            if list_workers > 1:
+                contents = _list_s3_keys_partitioned(client=client, bucket_name=bucket_name, prefix=prefix, max_workers=list_workers, page_size=page_size)
             else:
-                response = client.list_objects_v2(
-                    Bucket=self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment),
-                    MaxKeys=100
-                )
-            if 'ContinuationToken' in response:
-                new_continuation_token = response['ContinuationToken']
-                new_start_after = None
-                if 'StartAfter' in response:
-                    new_start_after = response['StartAfter']
-                keys = {**keys, **self._get_all_s3_keys(variable_cache=variable_cache, target_environment=target_environment, continuation_token=new_continuation_token, start_after=new_start_after)}
-            if 'Contents' in response:
-                for key_data in response['Contents']:
-                    key_checksum = hashlib.sha256(key_data['Key'].encode('utf-8')).hexdigest()
-                    keys[key_checksum] = dict()
-                    keys[key_checksum]['Key'] = key_data['Key']
-                    keys[key_checksum]['Size'] = key_data['Size']
-                    keys[key_checksum]['ContentChecksumSha256'] = None
+                paginator = client.get_paginator('list_objects_v2')
+                contents = (key_data for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, PaginationConfig={'PageSize': page_size}) for key_data in page.get('Contents', list()))
+            for key_data in contents:
+                if self._is_remote_index_key(key=key_data['Key']) is True:
+                    continue
+                if self._key_in_shard(key=key_data['Key']) is False:
+                    continue
+                key_count += 1
+                yield {
+                    'Key': key_data['Key'],
+                    'Size': key_data['Size'],
+                    'LastModified': key_data['LastModified'].timestamp(),
+                    'ContentChecksumSha256': None,
+                }
+        except GeneratorExit:   # The consumer stopped early, for example when a dry run found the first difference
+            raise
         except:
             self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
-        return keys
+            if raise_on_error is True:
+                raise
+        finally:
+            if contents is not None:
+                contents.close()
+        self.log(message='Listed {} S3 keys with prefix "{}" using {} listing workers'.format(key_count, prefix, list_workers), level='info')
 
-    def _delete_s3_key(self, key: str, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
+    def _delete_s3_keys(self, keys: list, variable_cache: VariableCache=VariableCache(), target_environment: str='default', client: object=None, bucket_name: str=None)->list:
+        if bucket_name is None:
+            bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+        failed_keys = dict()
+        start_time = time.monotonic()
         try:
-            client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
-            client.delete_object(
-                Bucket=self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment),
-                Key=key
+            if client is None:
+                client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+            response = client.delete_objects(
+                Bucket=bucket_name,
+                Delete={
+                    'Objects': [{'Key': key} for key in keys],
+                    'Quiet': True,
+                }
             )
-            self._write_transaction_log(message='SUCCESSFULLY Deleted S3 key "s3://{}/{}"'.format(
-                    self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment),
-                    key
-                )
+            if 'Errors' in response:
+                for error in response['Errors']:
+                    failed_keys[error['Key']] = '{}: {}'.format(error.get('Code', 'Unknown'), error.get('Message', ''))
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            for key in keys:
+                failed_keys[key] = 'Request failed'
+        duration = time.monotonic() - start_time
+        messages = list()
+        for key in keys:
+            if key in failed_keys:
+                self.log(message='Failed to delete S3 key "{}": {}'.format(key, failed_keys[key]), level='error')
+                messages.append(self._transaction_log_entry(message='FAILED Deleting S3 key "s3://{}/{}" ({})'.format(bucket_name, key, failed_keys[key]), action='DELETE', succeeded=False, bucket_name=bucket_name, key=key, duration=duration))
+            else:
+                messages.append(self._transaction_log_entry(message='SUCCESSFULLY Deleted S3 key "s3://{}/{}"'.format(bucket_name, key), action='DELETE', succeeded=True, bucket_name=bucket_name, key=key, duration=duration))
+        self._write_transaction_log(messages=messages)
+        self._remote_index_record_deletes(keys=[key for key in keys if key not in failed_keys])
+        return list(failed_keys.keys())
+
+    def _delete_jobs(self, keys: object, batch_size: int=1000):
+        batch = list()
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= batch_size:
+                yield {'Action': 'DELETE_BATCH', 'Keys': batch}
+                batch = list()
+        if len(batch) > 0:
+            yield {'Action': 'DELETE_BATCH', 'Keys': batch}
+
+    def _remote_index_enabled(self)->bool:
+        if 'remoteIndex' in self.spec:
+            return self.spec['remoteIndex'] is True
+        return False
+
+    def _remote_index_key(self)->str:
+        if self.shard is not None:
+            # Every shard keeps the index of its own keys
+            return '{}.animus-index.shard-{}-of-{}.jsonl.gz'.format(self._get_s3_key_prefix(), self.shard['Index'], self.shard['Count'])
+        return '{}.animus-index.jsonl.gz'.format(self._get_s3_key_prefix())
+
+    def _is_remote_index_key(self, key: str)->bool:
+        return key.startswith('{}.animus-index.'.format(self._get_s3_key_prefix())) and key.endswith('.jsonl.gz')
+
+    def _read_remote_index_object(self, client: object, bucket_name: str)->object:
+        # Returns an iterator over the index entries, or None if there is no usable index in the bucket
+        index_key = self._remote_index_key()
+        try:
+            response = client.get_object(Bucket=bucket_name, Key=index_key)
+        except client.exceptions.NoSuchKey:
+            self.log(message='No remote index found at S3 key "s3://{}/{}"'.format(bucket_name, index_key), level='info')
+            return None
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            return None
+        try:
+            index_stream = io.TextIOWrapper(gzip.GzipFile(fileobj=response['Body'], mode='rb'), encoding='utf-8')
+            header = json.loads(index_stream.readline())
+            if header.get('Version', None) != 1 or header.get('Prefix', None) != self._get_s3_key_prefix():
+                self.log(message='The remote index at S3 key "s3://{}/{}" is not compatible with this manifest - ignoring the index'.format(bucket_name, index_key), level='warning')
+                index_stream.close()
+                return None
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            self.log(message='The remote index at S3 key "s3://{}/{}" could not be read - ignoring the index'.format(bucket_name, index_key), level='warning')
+            return None
+        self.log(message='Reading {} S3 keys from the remote index at S3 key "s3://{}/{}"'.format(header.get('Keys', 'unknown number of'), bucket_name, index_key), level='info')
+        return self._iterate_remote_index_stream(index_stream=index_stream)
+
+    def _iterate_remote_index_stream(self, index_stream: object):
+        with index_stream:
+            for line in index_stream:
+                key, size, content_checksum_sha256, last_modified = json.loads(line)
+                yield {
+                    'Key': key,
+                    'Size': size,
+                    'LastModified': last_modified,
+                    'ContentChecksumSha256': content_checksum_sha256,
+                }
+
+    def _open_remote_index(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default', seed_from_listing: bool=True):
+        # During a sync the index is kept in a temporary SQLite database that is updated after every upload and delete.
+        # Without an index in the bucket, the database is seeded from a full listing so that a new index can be written.
+        self.remote_index = None
+        if self._remote_index_enabled() is False:
+            return
+        client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+        bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+        source = 'index'
+        entries = self._read_remote_index_object(client=client, bucket_name=bucket_name)
+        if entries is None:
+            if seed_from_listing is False:
+                return
+            source = 'listing'
+            # A partial listing must never be written as the index, so listing errors abort the seeding
+            entries = self._iterate_s3_keys(variable_cache=variable_cache, target_environment=target_environment, use_remote_index=False, raise_on_error=True)
+        database_handle, database_file = tempfile.mkstemp(prefix='animus-remote-index-', suffix='.sqlite')
+        os.close(database_handle)
+        try:
+            connection = sqlite3.connect(database_file, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=OFF')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE remote_keys (key TEXT PRIMARY KEY, size INTEGER, sha256 TEXT, last_modified REAL) WITHOUT ROWID')
+            if self._server_side_copy_enabled() is True:
+                connection.execute('CREATE INDEX remote_keys_sha256 ON remote_keys (sha256)')     # Finds copy sources by content
+            connection.executemany(
+                'INSERT OR REPLACE INTO remote_keys (key, size, sha256, last_modified) VALUES (?, ?, ?, ?)',
+                ((key_data['Key'], key_data['Size'], key_data['ContentChecksumSha256'], key_data['LastModified']) for key_data in entries)
+            )
+            connection.commit()
+            key_count = connection.execute('SELECT COUNT(*) FROM remote_keys').fetchone()[0]
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            self.log(message='The remote index could not be loaded - the bucket will be listed instead', level='warning')
+            delete_directory(dir=database_file)
+            return
+        self.remote_index = {
+            'Connection': connection,
+            'Lock': threading.Lock(),
+            'File': database_file,
+            'Source': source,
+            'ObjectRemoved': False,
+            'Changed': False,
+            'Failed': False,
+        }
+        self.log(message='Loaded {} S3 keys from the {}'.format(key_count, {'index': 'remote index', 'listing': 'bucket listing'}[source]), level='info')
+
+    def _close_remote_index(self, write: bool=True, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
+        remote_index = self.remote_index
+        if remote_index is None:
+            return
+        self.remote_index = None
+        try:
+            if write is True and remote_index['Failed'] is True:
+                self.log(message='Not all uploads and deletes succeeded - the remote index will be rebuilt from a bucket listing during the next sync', level='warning')
+            elif write is True and (remote_index['Changed'] is True or remote_index['Source'] == 'listing'):
+                self._write_remote_index_object(remote_index=remote_index, variable_cache=variable_cache, target_environment=target_environment)
+            remote_index['Connection'].close()
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+        delete_directory(dir=remote_index['File'])
+
+    def _write_remote_index_object(self, remote_index: dict, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
+        # The complete index is uploaded with a single PUT request, so readers either get the previous index or the new index
+        client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+        bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+        index_key = self._remote_index_key()
+        index_file = '{}.jsonl.gz'.format(remote_index['File'])
+        try:
+            with remote_index['Lock']:
+                key_count = remote_index['Connection'].execute('SELECT COUNT(*) FROM remote_keys').fetchone()[0]
+                with gzip.open(index_file, 'wt', encoding='utf-8') as f:
+                    f.write('{}\n'.format(json.dumps({'Version': 1, 'Prefix': self._get_s3_key_prefix(), 'Keys': key_count, 'Created': time.time()})))
+                    for row in remote_index['Connection'].execute('SELECT key, size, sha256, last_modified FROM remote_keys ORDER BY key'):
+                        f.write('{}\n'.format(json.dumps(row)))
+            with open(index_file, 'rb') as f:
+                client.put_object(Bucket=bucket_name, Key=index_key, Body=f, ContentType='application/gzip', ChecksumAlgorithm='SHA256')
+            self.log(message='Wrote the remote index with {} S3 keys to S3 key "s3://{}/{}"'.format(key_count, bucket_name, index_key), level='info')
+        finally:
+            if os.path.exists(index_file):
+                os.remove(index_file)
+
+    def _remove_remote_index_object(self, client: object, bucket_name: str):
+        # The index in the bucket is removed before the first change, so that an interrupted sync never leaves a stale index behind
+        remote_index = self.remote_index
+        if remote_index is None:
+            return
+        with remote_index['Lock']:
+            if remote_index['Source'] != 'index' or remote_index['ObjectRemoved'] is True:
+                return
+            remote_index['ObjectRemoved'] = True
+            client.delete_object(Bucket=bucket_name, Key=self._remote_index_key())
+        self.log(message='Removed the remote index from the bucket until the sync completes', level='info')
+
+    def _iterate_remote_index_keys(self, page_size: int=1000):
+        remote_index = self.remote_index
+        last_key = ''
+        while True:
+            with remote_index['Lock']:
+                rows = remote_index['Connection'].execute('SELECT key, size, sha256, last_modified FROM remote_keys WHERE key > ? ORDER BY key LIMIT ?', (last_key, page_size)).fetchall()
+            if len(rows) == 0:
+                return
+            for key, size, content_checksum_sha256, last_modified in rows:
+                yield {
+                    'Key': key,
+                    'Size': size,
+                    'LastModified': last_modified,
+                    'ContentChecksumSha256': content_checksum_sha256,
+                }
+            last_key = rows[-1][0]
+
+    def _remote_index_lookup(self, key: str)->dict:
+        remote_index = self.remote_index
+        with remote_index['Lock']:
+            row = remote_index['Connection'].execute('SELECT size, sha256, last_modified FROM remote_keys WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'Key': key,
+            'Size': row[0],
+            'LastModified': row[2],
+            'ContentChecksumSha256': row[1],
+        }
+
+    def _remote_index_record_upload(self, key: str, size: int, content_checksum_sha256: str):
+        remote_index = self.remote_index
+        if remote_index is None:
+            return
+        with remote_index['Lock']:
+            remote_index['Connection'].execute('INSERT OR REPLACE INTO remote_keys (key, size, sha256, last_modified) VALUES (?, ?, ?, ?)', (key, size, content_checksum_sha256, time.time()))
+            remote_index['Changed'] = True
+
+    def _remote_index_record_deletes(self, keys: list):
+        remote_index = self.remote_index
+        if remote_index is None or len(keys) == 0:
+            return
+        with remote_index['Lock']:
+            remote_index['Connection'].executemany('DELETE FROM remote_keys WHERE key = ?', [(key,) for key in keys])
+            remote_index['Changed'] = True
+
+    def _checksum_cache_file(self, target_environment: str='default')->str:
+        if 'localStagingDirectory' not in self.spec:
+            return None
+        if 'checksumCache' in self.spec:
+            if self.spec['checksumCache'] is False:
+                return None
+        return '{}{}animus-checksum-cache-{}.sqlite'.format(
+            self.spec['localStagingDirectory'],
+            os.sep,
+            re.sub(r'[^A-Za-z0-9_.-]', '_', '{}-{}'.format(self.metadata['name'], target_environment))
+        )
+
+    def _open_checksum_cache(self, target_environment: str='default')->dict:
+        if self.destination is not None:
+            return None     # The local sources were already hashed once for all destinations
+        cache_file = self._checksum_cache_file(target_environment=target_environment)
+        if cache_file is None:
+            return None
+        try:
+            connection = sqlite3.connect(cache_file, check_same_thread=False)
+            connection.execute('CREATE TABLE IF NOT EXISTS file_checksums (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, sha256 TEXT, run_id INTEGER)')
+            self.log(message='Using local checksum cache "{}"'.format(cache_file), level='info')
+            return {
+                'Connection': connection,
+                'Lock': threading.Lock(),
+                'RunId': time.time_ns(),
+                'Hits': 0,
+                'Misses': 0,
+            }
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            self.log(message='Local checksum cache "{}" could not be opened - all local file checksums will be calculated'.format(cache_file), level='warning')
+        return None
+
+    def _close_checksum_cache(self, checksum_cache: dict, prune: bool=True):
+        if checksum_cache is None:
+            return
+        try:
+            if prune is True:
+                # Files not seen in this run no longer exists (or are no longer part of the sources)
+                cursor = checksum_cache['Connection'].execute('DELETE FROM file_checksums WHERE run_id != ?', (checksum_cache['RunId'],))
+                self.log(message='Pruned {} entries from the local checksum cache'.format(cursor.rowcount), level='info')
+            checksum_cache['Connection'].commit()
+            checksum_cache['Connection'].close()
+            self.log(message='Local checksum cache hits: {}   misses: {}'.format(checksum_cache['Hits'], checksum_cache['Misses']), level='info')
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+
+    def _get_cached_checksum(self, file_full_path: str, file_stat: os.stat_result, checksum_cache: dict=None)->str:
+        local_source_memo = self.local_source_memo
+        if local_source_memo is not None:
+            with local_source_memo['Lock']:
+                entry = local_source_memo['Checksums'].get(file_full_path, None)
+            if entry is not None:
+                if entry[0] == file_stat.st_size and entry[1] == file_stat.st_mtime_ns and entry[2] == file_stat.st_ino:
+                    return entry[3]
+        if checksum_cache is None:
+            return None
+        connection = checksum_cache['Connection']
+        with checksum_cache['Lock']:
+            row = connection.execute('SELECT size, mtime_ns, inode, sha256 FROM file_checksums WHERE path = ?', (file_full_path,)).fetchone()
+            if row is not None:
+                if row[0] == file_stat.st_size and row[1] == file_stat.st_mtime_ns and row[2] == file_stat.st_ino and row[3] is not None:
+                    checksum_cache['Hits'] += 1
+                    connection.execute('UPDATE file_checksums SET run_id = ? WHERE path = ?', (checksum_cache['RunId'], file_full_path))
+                    if local_source_memo is not None:
+                        with local_source_memo['Lock']:
+                            local_source_memo['Checksums'][file_full_path] = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, row[3])
+                    return row[3]
+            checksum_cache['Misses'] += 1
+        return None
+
+    def _store_cached_checksum(self, file_full_path: str, file_stat: os.stat_result, checksum: str, checksum_cache: dict=None):
+        if checksum is not None and self.local_source_memo is not None:
+            with self.local_source_memo['Lock']:
+                self.local_source_memo['Checksums'][file_full_path] = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, checksum)
+        if checksum_cache is None or checksum is None:
+            return
+        with checksum_cache['Lock']:
+            checksum_cache['Connection'].execute(
+                'INSERT OR REPLACE INTO file_checksums (path, size, mtime_ns, inode, sha256, run_id) VALUES (?, ?, ?, ?, ?, ?)',
+                (file_full_path, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, checksum, checksum_cache['RunId'])
             )
+
+    def _sync_journal_file(self, target_environment: str='default')->str:
+        if 'resumableSync' not in self.spec:
+            return None
+        if self.spec['resumableSync'] is not True:
+            return None
+        if 'localStagingDirectory' not in self.spec:
+            self.log(message='The "resumableSync" parameter requires the "localStagingDirectory" parameter - an interrupted sync can not be resumed', level='warning')
+            return None
+        return '{}{}animus-sync-journal-{}.sqlite'.format(
+            self.spec['localStagingDirectory'],
+            os.sep,
+            re.sub(r'[^A-Za-z0-9_.-]', '_', '{}-{}'.format(self.metadata['name'], target_environment))
+        )
+
+    def _open_sync_journal(self, target_environment: str='default'):
+        # The journal only exists while a sync is running, so finding one means the previous sync was interrupted
+        self.sync_journal = None
+        journal_file = self._sync_journal_file(target_environment=target_environment)
+        if journal_file is None:
+            return
+        try:
+            os.makedirs(self.spec['localStagingDirectory'], exist_ok=True)
+            connection = sqlite3.connect(journal_file, check_same_thread=False, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS pending_jobs (seq INTEGER PRIMARY KEY, action TEXT, key TEXT, local_path TEXT, size INTEGER, sha256 TEXT, flags INTEGER, copy_source TEXT)')
+            connection.execute('CREATE TABLE IF NOT EXISTS completed_jobs (key TEXT, action TEXT, size INTEGER, mtime_ns INTEGER, PRIMARY KEY (key, action))')
+            connection.execute('CREATE TABLE IF NOT EXISTS multipart_uploads (key TEXT PRIMARY KEY, upload_id TEXT, local_path TEXT, size INTEGER, mtime_ns INTEGER, part_size INTEGER, sha256 TEXT)')
+            resumed = False
+            for table_name in ('pending_jobs', 'completed_jobs', 'multipart_uploads'):
+                if connection.execute('SELECT COUNT(*) FROM {}'.format(table_name)).fetchone()[0] > 0:
+                    resumed = True
+            self.sync_journal = {
+                'Connection': connection,
+                'Lock': threading.Lock(),
+                'File': journal_file,
+                'Resumed': resumed,
+            }
+            if resumed is True:
+                self.log(message='Found the sync journal "{}" of an interrupted sync - finished work will be skipped'.format(journal_file), level='warning')
+            else:
+                self.log(message='Using sync journal "{}"'.format(journal_file), level='info')
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            self.log(message='Sync journal "{}" could not be opened - the sync will not be resumable'.format(journal_file), level='warning')
+
+    def _close_sync_journal(self, completed: bool, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
+        sync_journal = self.sync_journal
+        if sync_journal is None:
+            return
+        try:
+            if completed is True:
+                # Multipart uploads still in the journal failed during this run, and nothing will resume them anymore
+                for key, upload_id in self._journal_execute(statement='SELECT key, upload_id FROM multipart_uploads'):
+                    self._abort_multipart_upload(key=key, upload_id=upload_id, variable_cache=variable_cache, target_environment=target_environment)
+            self.sync_journal = None
+            sync_journal['Connection'].close()
+            if completed is True:
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists('{}{}'.format(sync_journal['File'], suffix)):
+                        os.remove('{}{}'.format(sync_journal['File'], suffix))
+            else:
+                self.log(message='The sync did not complete - the sync journal "{}" is kept so that the next run can resume the sync'.format(sync_journal['File']), level='warning')
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+        self.sync_journal = None
+
+    def _journal_execute(self, statement: str, parameters: object=(), many: bool=False)->list:
+        sync_journal = self.sync_journal
+        if sync_journal is None:
+            return list()
+        try:
+            with sync_journal['Lock']:
+                if many is True:
+                    sync_journal['Connection'].execute('BEGIN')
+                    try:
+                        sync_journal['Connection'].executemany(statement, parameters)
+                    except:
+                        sync_journal['Connection'].execute('ROLLBACK')
+                        raise
+                    sync_journal['Connection'].execute('COMMIT')
+                    return list()
+                return sync_journal['Connection'].execute(statement, parameters).fetchall()
         except:
+            # A journal that can not be written only means that the sync may not be resumable - the sync itself continues
             self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
-            self._write_transaction_log(message='FAILED Deleting S3 key "s3://{}/{}"'.format(
-                    self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment),
-                    key
+        return list()
+
+    def _journal_record_completed_job(self, job: dict, failed_keys: list):
+        if self.sync_journal is None:
+            return
+        if job['Action'] in ('UPLOAD', 'COPY'):
+            if len(failed_keys) == 0:
+                try:
+                    file_stat = os.stat(job['LocalFullPath'])
+                except:
+                    return
+                self._journal_execute(
+                    statement='INSERT OR REPLACE INTO completed_jobs (key, action, size, mtime_ns) VALUES (?, ?, ?, ?)',
+                    parameters=(job['Key'], 'UPLOAD', file_stat.st_size, file_stat.st_mtime_ns)
                 )
+        elif job['Action'] == 'DELETE_BATCH':
+            failed_keys = set(failed_keys)
+            self._journal_execute(
+                statement='INSERT OR REPLACE INTO completed_jobs (key, action, size, mtime_ns) VALUES (?, ?, NULL, NULL)',
+                parameters=[(key, 'DELETE') for key in job['Keys'] if key not in failed_keys],
+                many=True
             )
 
-    def _retrieve_local_file_meta_data(self, base_directory: str, file_name_portion: str, verify_checksums: bool=False)->dict:
+    def _journal_upload_completed(self, key: str, local_file_path: str)->bool:
+        # An upload only counts as finished if the local file did not change since it was uploaded
+        if self.sync_journal is None:
+            return False
+        if self.sync_journal['Resumed'] is False:
+            return False
+        rows = self._journal_execute(statement='SELECT size, mtime_ns FROM completed_jobs WHERE key = ? AND action = ?', parameters=(key, 'UPLOAD'))
+        if len(rows) == 0:
+            return False
+        try:
+            file_stat = os.stat(local_file_path)
+        except:
+            return False
+        return rows[0][0] == file_stat.st_size and rows[0][1] == file_stat.st_mtime_ns
+
+    def _journal_store_sync_plan(self, sync_plan: dict):
+        if self.sync_journal is None:
+            return
+        self._journal_execute(statement='DELETE FROM pending_jobs')
+        self._journal_execute(statement='DELETE FROM completed_jobs')
+        pending_jobs = list()
+        for idx in range(len(sync_plan['Keys'])):
+            content_checksum_sha256 = None
+            if sync_plan['Flags'][idx] & _SYNC_PLAN_HAS_CHECKSUM:
+                content_checksum_sha256 = sync_plan['Digests'][idx*32:(idx+1)*32].hex()
+            if idx in sync_plan['CopySources']:
+                # Planned copies must stay copies when the sync is resumed, instead of uploading the local file again
+                pending_jobs.append(('COPY', sync_plan['Keys'][idx], sync_plan['LocalFullPaths'][idx], sync_plan['Sizes'][idx], content_checksum_sha256, sync_plan['Flags'][idx], sync_plan['CopySources'][idx]))
+                continue
+            pending_jobs.append(('UPLOAD', sync_plan['Keys'][idx], sync_plan['LocalFullPaths'][idx], sync_plan['Sizes'][idx], content_checksum_sha256, sync_plan['Flags'][idx], None))
+        for key in sync_plan['DeleteKeys']:
+            pending_jobs.append(('DELETE', key, None, None, None, 0, None))
+        self._journal_execute(
+            statement='INSERT INTO pending_jobs (action, key, local_path, size, sha256, flags, copy_source) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            parameters=pending_jobs,
+            many=True
+        )
+
+    def _journal_load_sync_plan(self)->dict:
+        # Rebuilds the remaining work of an interrupted sync, so that the local files and S3 keys do not have to be compared again
+        if self.sync_journal is None:
+            return None
+        if self.sync_journal['Resumed'] is False:
+            return None
+        rows = self._journal_execute(statement='SELECT action, key, local_path, size, sha256, flags, copy_source FROM pending_jobs ORDER BY seq')
+        if len(rows) == 0:
+            return None
+        completed_deletes = set([row[0] for row in self._journal_execute(statement='SELECT key FROM completed_jobs WHERE action = ?', parameters=('DELETE',))])
+        sync_plan = _new_sync_plan()
+        completed_jobs = 0
+        for action, key, local_path, size, content_checksum_sha256, flags, copy_source in rows:
+            if action in ('UPLOAD', 'COPY'):
+                # Completed copies are recorded as uploads of the local file
+                if self._journal_upload_completed(key=key, local_file_path=local_path) is True:
+                    completed_jobs += 1
+                    continue
+                if action == 'COPY':
+                    sync_plan['CopySources'][len(sync_plan['Keys'])] = copy_source
+                _sync_plan_add_upload(sync_plan=sync_plan, key_data={
+                    'Key': key,
+                    'LocalFullPath': local_path,
+                    'Size': size,
+                    'ContentChecksumSha256': content_checksum_sha256,
+                    'ChecksumMismatch': (flags & _SYNC_PLAN_CHECKSUM_MISMATCH) != 0,
+                })
+            elif action == 'DELETE':
+                if key in completed_deletes:
+                    completed_jobs += 1
+                    continue
+                _sync_plan_add_delete(sync_plan=sync_plan, key=key)
+        self.log(message='Resuming the interrupted sync: {} of {} jobs were already completed'.format(completed_jobs, len(rows)), level='info')
+        return sync_plan
+
+    def _get_hash_workers(self)->int:
+        hash_workers = os.cpu_count() or 1
+        if 'hashWorkers' in self.spec:
+            try:
+                if int(self.spec['hashWorkers']) > 0:
+                    hash_workers = int(self.spec['hashWorkers'])
+                else:
+                    self.log(message='The "hashWorkers" parameter must be a positive number - using the default value of {}'.format(hash_workers), level='warning')
+            except:
+                self.log(message='The "hashWorkers" parameter value "{}" is not a number - using the default value of {}'.format(self.spec['hashWorkers'], hash_workers), level='warning')
+        return hash_workers
+
+    def _get_list_workers(self)->int:
+        list_workers = 1
+        if 'listWorkers' in self.spec:
+            try:
+                if int(self.spec['listWorkers']) > 0:
+                    list_workers = int(self.spec['listWorkers'])
+                else:
+                    self.log(message='The "listWorkers" parameter must be a positive number - using the default value of {}'.format(list_workers), level='warning')
+            except:
+                self.log(message='The "listWorkers" parameter value "{}" is not a number - using the default value of {}'.format(self.spec['listWorkers'], list_workers), level='warning')
+        return list_workers
+
+    def _hash_batches(self, file_paths: list, file_sizes: dict, max_batch_files: int=256, max_batch_bytes: int=33554432, mmap_threshold: int=1048576)->list:
+        # Large files are hashed one per job, small files are grouped to limit the inter process communication overhead
+        batches = list()
+        batch = list()
+        batch_bytes = 0
+        for file_path in sorted(file_paths, key=lambda x: file_sizes[x], reverse=True):
+            if file_sizes[file_path] >= mmap_threshold:
+                batches.append([file_path,])
+                continue
+            batch.append(file_path)
+            batch_bytes += file_sizes[file_path]
+            if len(batch) >= max_batch_files or batch_bytes >= max_batch_bytes:
+                batches.append(batch)
+                batch = list()
+                batch_bytes = 0
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+
+    def _calculate_pending_checksums(self, pending_checksums: list, checksum_cache: dict=None, min_parallel_bytes: int=67108864):
+        if len(pending_checksums) == 0:
+            return
+        pending_by_path = dict()
+        file_sizes = dict()
+        for result, file_stat in pending_checksums:
+            if result['LocalFullPath'] not in pending_by_path:
+                pending_by_path[result['LocalFullPath']] = list()
+            pending_by_path[result['LocalFullPath']].append((result, file_stat))
+            file_sizes[result['LocalFullPath']] = file_stat.st_size
+        hash_workers = self._get_hash_workers()
+        total_bytes = sum(file_sizes.values())
+        checksums = dict()
+        if hash_workers > 1 and len(file_sizes) > 1 and total_bytes >= min_parallel_bytes:
+            self.log(message='Calculating checksums of {} local files ({} bytes) using {} processes'.format(len(file_sizes), total_bytes, hash_workers), level='info')
+            try:
+                # Forking a process that runs other threads could copy locks held by those threads, so the workers are spawned
+                with concurrent.futures.ProcessPoolExecutor(max_workers=hash_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                    for batch_result in executor.map(_sha256_files, self._hash_batches(file_paths=list(file_sizes.keys()), file_sizes=file_sizes)):
+                        for file_path, checksum in batch_result:
+                            checksums[file_path] = checksum
+            except:
+                self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+                self.log(message='Parallel checksum calculation failed - calculating the remaining checksums in the current process', level='warning')
+        for file_path in file_sizes.keys():
+            if file_path not in checksums:
+                checksums[file_path] = _sha256_file(file_path=file_path)
+        for file_path, pending_entries in pending_by_path.items():
+            for result, file_stat in pending_entries:
+                result['ContentChecksumSha256'] = checksums[file_path]
+                self._store_cached_checksum(file_full_path=file_path, file_stat=file_stat, checksum=checksums[file_path], checksum_cache=checksum_cache)
+
+    def _calculate_local_file_checksum(self, file_full_path: str)->str:
+        # The checksum is shared between destinations, so that a file uploaded to more than one bucket is hashed once
+        if self.local_source_memo is None:
+            return _sha256_file(file_path=file_full_path)
+        try:
+            file_stat = os.stat(file_full_path)
+        except:
+            return _sha256_file(file_path=file_full_path)
+        checksum = self._get_cached_checksum(file_full_path=file_full_path, file_stat=file_stat)
+        if checksum is None:
+            checksum = _sha256_file(file_path=file_full_path)
+            self._store_cached_checksum(file_full_path=file_full_path, file_stat=file_stat, checksum=checksum)
+        return checksum
+
+    def _local_file_key(self, file_name_portion: str)->str:
+        return '{}{}'.format(self._get_s3_key_prefix(), file_name_portion.lstrip('/'))
+
+    def _retrieve_local_file_meta_data(self, base_directory: str, file_name_portion: str, compare_policy: str='name', checksum_cache: dict=None, pending_checksums: list=None)->dict:
         result = dict()
         file_full_path = '{}{}{}'.format(base_directory, os.sep, file_name_portion)
         self.log(message='Attempting to add file "{}"'.format(file_full_path), level='info')
-        file_size = get_file_size(file_path=file_full_path)
+        file_stat = None
+        file_size = None
+        try:
+            file_stat = os.stat(file_full_path)
+            file_size = file_stat.st_size
+        except:
+            pass
 
-        final_file_name_portion = file_name_portion
-        if 'destinationDirectory' in self.spec:
-            final_file_name_portion = '/{}/{}'.format(self.spec['destinationDirectory'], file_name_portion)
-            final_file_name_portion = final_file_name_portion.replace('//', '/')
-            if final_file_name_portion.startswith('/'):
-                final_file_name_portion = final_file_name_portion[1:]
+        final_file_name_portion = self._local_file_key(file_name_portion=file_name_portion)
 
         if file_size is not None:
+            if compare_policy in ('size', 'size+mtime') and self._compression_selected(key=final_file_name_portion, size=file_size) is True:
+                # The size of a compressed S3 object differs from the local file size, so the recorded checksum is compared instead
+                compare_policy = 'checksum'
             result['Key'] = final_file_name_portion
             result['LocalFullPath'] = file_full_path
             result['BaseDirectory'] = base_directory
             result['Size'] = file_size
-            result['ContentChecksumSha256'] = calculate_file_checksum(file_path=file_full_path, checksum_algorithm='sha256', _known_size=file_size)
-            result['VerifyS3Checksum'] = verify_checksums
+            result['ModifiedTime'] = file_stat.st_mtime
+            result['ComparePolicy'] = compare_policy
+            result['ContentChecksumSha256'] = None
+            result['VerifyS3Checksum'] = compare_policy == 'checksum'
+            if result['VerifyS3Checksum'] is True:  # Other policies do not need to read the file content
+                result['ContentChecksumSha256'] = self._get_cached_checksum(file_full_path=file_full_path, file_stat=file_stat, checksum_cache=checksum_cache)
+            if result['VerifyS3Checksum'] is True and result['ContentChecksumSha256'] is None:
+                if pending_checksums is not None:
+                    pending_checksums.append((result, file_stat))   # The checksum will be calculated in the hashing stage
+                else:
+                    result['ContentChecksumSha256'] = _sha256_file(file_path=file_full_path)
+                    self._store_cached_checksum(file_full_path=file_full_path, file_stat=file_stat, checksum=result['ContentChecksumSha256'], checksum_cache=checksum_cache)
         else:
             self.log(message='Failed to get filesize for file "{}" - skipping file. Please ensure it exists.'.format(file_full_path), level='warning')
             if 'onError' in self.spec:
@@ -214,277 +1386,2663 @@ Restrictions:
             return None
         return result
 
-    def _get_all_local_files(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->dict:
-        files = dict()
-        if 'sources' in self.spec:
-            for source_definition in self.spec['sources']:
-                if 'sourceType' in source_definition and 'baseDirectory' in source_definition:
-                    verify_checksums = False
-                    base_directory = source_definition['baseDirectory']
-                    if 'verifyChecksums' in source_definition:
-                        verify_checksums = source_definition['verifyChecksums']
-                    if source_definition['sourceType'].lower() == 'localfiles':
-                        if 'files' in source_definition:
-                            for file_name in source_definition['files']:
-                                file_full_path = '{}{}{}'.format(base_directory, os.sep, file_name)
-                                target_key_checksum = hashlib.sha256(file_name.encode('utf-8')).hexdigest()
-                                local_file_metadata = self._retrieve_local_file_meta_data(base_directory=base_directory, file_name_portion=file_name, verify_checksums=verify_checksums)
-                                if local_file_metadata is not None:
-                                    files[target_key_checksum] = local_file_metadata
-                        else:
-                            self.log(message='No actual files found. Ignoring this section: Problematic source_definition={}'.format(json.dumps(source_definition)), level='warning')
-                    elif source_definition['sourceType'].lower() == 'localdirectories':
-                        recurse = False
-                        if 'recurse' in source_definition:
-                            recurse = source_definition['recurse']
-                        if 'verifyChecksums' in source_definition:
-                            verify_checksums = source_definition['verifyChecksums']
-                        directory_list = list()
-                        if 'directories' in source_definition:
-                            for dir in source_definition['directories']:
-                                directory_list.append('{}{}{}'.format(base_directory, os.sep, dir))
+    def _walk_directory(self, directory: str, recurse: bool=False, base_directory: str=None, exclude_rules: tuple=tuple(), include_rules: tuple=tuple()):
+        # Patterns are matched against the path relative to the base directory. Excluded directories are never entered.
+        # Symbolic links to directories are followed, but every directory is entered only once, so link cycles end the walk.
+        relative_path_start = 0
+        if base_directory is not None:
+            relative_path_start = len(base_directory.rstrip(os.sep)) + len(os.sep)
+        directories = [directory.rstrip(os.sep),]
+        visited_directories = set()
+        while len(directories) > 0:
+            current_directory = directories.pop()
+            file_paths = list()
+            try:
+                if _directory_already_visited(directory=current_directory, visited_directories=visited_directories) is True:
+                    self.log(message='Skipping directory "{}" - the directory was already scanned through another path'.format(current_directory), level='warning')
+                    continue
+                with os.scandir(current_directory) as entries:
+                    for entry in entries:
+                        entry_path = '{}{}{}'.format(current_directory, os.sep, entry.name)
+                        relative_path = None
+                        if len(exclude_rules) > 0 or len(include_rules) > 0:
+                            relative_path = entry_path[relative_path_start:].replace(os.sep, '/')
+                        if entry.is_dir() is True:
+                            if recurse is True:
+                                if len(exclude_rules) > 0 and _path_matches_patterns(relative_path=relative_path, is_directory=True, rules=exclude_rules) is True:
+                                    self.log(message='Skipping excluded directory "{}"'.format(entry_path), level='debug')
+                                    continue
+                                directories.append(entry_path)
                         else:
-                            directory_list.append(base_directory)
-                        for dir in directory_list:
-                            file_list_data = list_files(directory=dir, recurse=recurse)
-                            for file_full_path in list(file_list_data.keys()):
-                                full_base_dir = '{}{}'.format(base_directory, os.sep)
-                                file_name = copy.deepcopy(file_full_path).replace(full_base_dir, '')
-                                target_key_checksum = hashlib.sha256(file_name.encode('utf-8')).hexdigest()
-                                local_file_metadata = self._retrieve_local_file_meta_data(base_directory=base_directory, file_name_portion=file_name, verify_checksums=verify_checksums)
-                                if local_file_metadata is not None:
-                                    files[target_key_checksum] = local_file_metadata
-                    else:
-                        self.log(message='Unsupported source type "{}" SKIPPED'.format(source_definition['sourceType']), level='warning')
-                else:
-                    self.log(message='Not all required fields present. Problematic source_definition={}'.format(json.dumps(source_definition)), level='warning')
+                            if len(exclude_rules) > 0 and _path_matches_patterns(relative_path=relative_path, is_directory=False, rules=exclude_rules) is True:
+                                continue
+                            if len(include_rules) > 0 and _path_is_included(relative_path=relative_path, rules=include_rules) is False:
+                                continue
+                            file_paths.append(entry_path)
+            except:
+                self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            for file_path in file_paths:
+                yield file_path
+
+    def _get_compare_policy(self, source_definition: dict)->str:
+        if 'comparePolicy' in source_definition:
+            if source_definition['comparePolicy'] is not None:
+                if source_definition['comparePolicy'].lower() in ('name', 'size', 'size+mtime', 'checksum'):
+                    return source_definition['comparePolicy'].lower()
+                self.log(message='Unsupported "comparePolicy" value "{}" - using the "verifyChecksums" setting'.format(source_definition['comparePolicy']), level='warning')
+        if 'verifyChecksums' in source_definition:
+            if source_definition['verifyChecksums'] is True:
+                return 'checksum'
+        return 'name'
+
+    def _get_source_path_rules(self, source_definition: dict, field_name: str)->tuple:
+        if field_name not in source_definition or source_definition[field_name] is None:
+            return tuple()
+        if isinstance(source_definition[field_name], list) is False or len([pattern for pattern in source_definition[field_name] if isinstance(pattern, str) is False]) > 0:
+            self.log(message='The "{}" source parameter must be a list of patterns - ignoring the value "{}"'.format(field_name, source_definition[field_name]), level='warning')
+            return tuple()
+        return _compile_path_patterns(patterns=tuple(source_definition[field_name]))
+
+    def _iterate_local_source_files(self):
+        # With additional destinations or shards the sources are scanned once, and the list of files is shared
+        local_source_memo = self.local_source_memo
+        if local_source_memo is None:
+            files = self._scan_local_source_files()
         else:
+            with local_source_memo['Lock']:
+                if local_source_memo['Files'] is None:
+                    local_source_memo['Files'] = list(self._scan_local_source_files())
+                files = local_source_memo['Files']
+        if self.shard is None:
+            yield from files
+            return
+        for base_directory, file_name, compare_policy in files:
+            if self._key_in_shard(key=self._local_file_key(file_name_portion=file_name)) is True:
+                yield (base_directory, file_name, compare_policy)
+
+    def _scan_local_source_files(self):
+        if self._bundling_enabled() is False:
+            yield from self._scan_source_definitions()
+            return
+        if 'localStagingDirectory' not in self.spec:
+            self.log(message='The "bundling" parameter requires the "localStagingDirectory" parameter - all files are uploaded individually', level='warning')
+            yield from self._scan_source_definitions()
+            return
+        yield from self._bundle_local_source_files(files=self._scan_source_definitions())
+
+    def _scan_source_definitions(self):
+        if 'sources' not in self.spec:
             self.log(message='NO SOURCES found in Spec - Nothing to do', level='warning')
-        return files
+            return
+        for source_definition in self.spec['sources']:
+            if 'sourceType' in source_definition and 'baseDirectory' in source_definition:
+                base_directory = source_definition['baseDirectory']
+                compare_policy = self._get_compare_policy(source_definition=source_definition)
+                if source_definition['sourceType'].lower() == 'localfiles':
+                    if 'files' in source_definition:
+                        for file_name in source_definition['files']:
+                            yield (base_directory, file_name, compare_policy)
+                    else:
+                        self.log(message='No actual files found. Ignoring this section: Problematic source_definition={}'.format(json.dumps(source_definition)), level='warning')
+                elif source_definition['sourceType'].lower() == 'localdirectories':
+                    recurse = False
+                    if 'recurse' in source_definition:
+                        recurse = source_definition['recurse']
+                    directory_list = list()
+                    if 'directories' in source_definition:
+                        for dir in source_definition['directories']:
+                            directory_list.append('{}{}{}'.format(base_directory, os.sep, dir))
+                    else:
+                        directory_list.append(base_directory)
+                    full_base_dir = '{}{}'.format(base_directory, os.sep)
+                    exclude_rules = self._get_source_path_rules(source_definition=source_definition, field_name='exclude')
+                    include_rules = self._get_source_path_rules(source_definition=source_definition, field_name='include')
+                    for dir in directory_list:
+                        for file_full_path in self._walk_directory(directory=dir, recurse=recurse, base_directory=base_directory, exclude_rules=exclude_rules, include_rules=include_rules):
+                            yield (base_directory, file_full_path.replace(full_base_dir, ''), compare_policy)
+                else:
+                    self.log(message='Unsupported source type "{}" SKIPPED'.format(source_definition['sourceType']), level='warning')
+            else:
+                self.log(message='Not all required fields present. Problematic source_definition={}'.format(json.dumps(source_definition)), level='warning')
+
+    def _bundling_enabled(self)->bool:
+        if 'bundling' in self.spec:
+            if isinstance(self.spec['bundling'], dict):
+                return self.spec['bundling'].get('enabled', False) is True
+        return False
+
+    def _get_bundling_setting(self, setting_name: str, default_value: int, minimum_value: int=1)->int:
+        if setting_name in self.spec['bundling'] and self.spec['bundling'][setting_name] is not None:
+            try:
+                value = int(self.spec['bundling'][setting_name])
+                if value >= minimum_value:
+                    return value
+            except:
+                pass
+            self.log(message='The "bundling.{}" parameter value "{}" is not valid - using the default value of {}'.format(setting_name, self.spec['bundling'][setting_name], default_value), level='warning')
+        return default_value
+
+    def _get_bundling_exclude_rules(self)->tuple:
+        patterns = self.spec['bundling'].get('exclude', None)
+        if patterns is None:
+            return tuple()
+        if isinstance(patterns, list) is False or len([pattern for pattern in patterns if isinstance(pattern, str) is False]) > 0:
+            self.log(message='The "bundling.exclude" parameter must be a list of patterns - ignoring the value "{}"'.format(patterns), level='warning')
+            return tuple()
+        return _compile_path_patterns(patterns=tuple(patterns))
+
+    def _bundle_directory(self)->str:
+        return '{}{}animus-bundles-{}'.format(self.spec['localStagingDirectory'], os.sep, re.sub(r'[^A-Za-z0-9_.-]', '_', self.metadata['name']))
 
-    def _download_s3_key(self, key: str, work_dir: str, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->str:
-        local_file_name = hashlib.sha256(key.encode('utf-8')).hexdigest()
-        saved_file_path = '{}{}{}'.format(work_dir, os.sep, local_file_name)
+    def _bundle_index_key(self)->str:
+        return '{}.animus-bundles/index.jsonl.gz'.format(self._get_s3_key_prefix())
+
+    def _bundle_local_source_files(self, files: object):
+        # Small local files are packed into tar archives in the staging directory, and the archives and a bundle index are
+        # synchronized instead of the individual files. Archives are written with fixed member attributes, so that an
+        # archive only changes (and is uploaded again) when one of its files is added, removed or changed.
+        maximum_file_size = self._get_bundling_setting(setting_name='maximumFileSize', default_value=65536, minimum_value=0)
+        exclude_rules = self._get_bundling_exclude_rules()
+        prefix = self._get_s3_key_prefix()
+        members = dict()
+        for base_directory, file_name, compare_policy in files:
+            key = self._local_file_key(file_name_portion=file_name)
+            file_full_path = '{}{}{}'.format(base_directory, os.sep, file_name)
+            try:
+                file_stat = os.stat(file_full_path)
+            except:
+                file_stat = None
+            if file_stat is None or file_stat.st_size > maximum_file_size or _path_matches_patterns(relative_path=key[len(prefix):], is_directory=False, rules=exclude_rules) is True:
+                members.pop(key, None)
+                yield (base_directory, file_name, compare_policy)
+                continue
+            members[key] = (key, file_full_path, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+
+        bundle_directory = self._bundle_directory()
+        os.makedirs('{}{}.animus-bundles'.format(bundle_directory, os.sep), exist_ok=True)
+        state_file = '{}{}animus-bundle-state.json'.format(bundle_directory, os.sep)
+        previous_state = dict()
         try:
-            client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
-            with open(saved_file_path, 'wb') as f:
-                client.download_fileobj(self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment), key, f)
-            self.log(message='Downloaded S3 key "{}" to local file "{}"'.format(key, saved_file_path), level='info')
+            if os.path.isfile(state_file) is True:
+                with open(state_file, 'r', encoding='utf-8') as f:
+                    previous_state = json.load(f)
         except:
             self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
-            return None
-        return saved_file_path
+            self.log(message='The bundle state file "{}" could not be read - all bundles will be created again'.format(state_file), level='warning')
 
-    def _files_to_transfer(self, current_s3_keys: dict, local_files: dict, work_dir: str, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->dict:
-        files_to_transfer = dict()
-        for local_key, key_data in local_files.items():
-            if local_key not in current_s3_keys:
-                files_to_transfer[local_key] = copy.deepcopy(key_data)
-                self.log(message='Local file "{}" not found in S3 - marked for UPLOAD'.format(key_data['LocalFullPath']), level='info')
+        state = dict()
+        index_entries = list()
+        for group in _bundle_groups(members=sorted(members.values()), files_per_bundle=self._get_bundling_setting(setting_name='filesPerBundle', default_value=1000), maximum_bundle_size=self._get_bundling_setting(setting_name='maximumBundleSize', default_value=67108864)):
+            bundle_file_name = '.animus-bundles/bundle-{}.tar'.format(hashlib.sha256(group[0][0].encode('utf-8')).hexdigest()[:16])
+            bundle_file = '{}{}{}'.format(bundle_directory, os.sep, bundle_file_name)
+            signature = hashlib.sha256(json.dumps(group).encode('utf-8')).hexdigest()
+            if bundle_file_name in previous_state and previous_state[bundle_file_name]['Signature'] == signature and os.path.isfile(bundle_file) is True:
+                bundle_members = previous_state[bundle_file_name]['Members']
             else:
-                if key_data['Key'] != current_s3_keys[local_key]['Key']:
-                    files_to_transfer[local_key] = copy.deepcopy(key_data)
-                    self.log(message='Local file "{}" not found in S3 - marked for UPLOAD ("Key" attribute mismatched)'.format(key_data['LocalFullPath']), level='info')
-                elif 'VerifyS3Checksum' in key_data and 'ContentChecksumSha256' in key_data:
-                    if key_data['VerifyS3Checksum'] is True:
-                        downloaded_file_path = self._download_s3_key(key=current_s3_keys[local_key]['Key'], work_dir=work_dir, variable_cache=variable_cache, target_environment=target_environment)
-                        downloaded_file_checksum = calculate_file_checksum(file_path=downloaded_file_path, checksum_algorithm='sha256')
-                        if key_data['ContentChecksumSha256'] != downloaded_file_checksum:
-                            files_to_transfer[local_key] = copy.deepcopy(key_data)
-                            self.log(message='Local file "{}" found in S3 and checksums mismatch - marked for UPLOAD'.format(key_data['LocalFullPath']), level='info')
-                        else:
-                            if 'ifFileExists' in self.spec:
-                                if self.spec['ifFileExists']['overWrite'] is True:
-                                    files_to_transfer[local_key] = copy.deepcopy(key_data)
-                                    self.log(message='Local file "{}" marked for UPLOAD ("ifFileExists" is set to "{}")'.format(key_data['LocalFullPath'], self.spec['ifFileExists']['overWrite']), level='info')
-                                else:
-                                    self.log(message='Local file "{}" found in S3 and checksums match - ignoring file ("ifFileExists" is set to "{}")'.format(key_data['LocalFullPath'], self.spec['ifFileExists']['overWrite']), level='info')
-                            else:
-                                self.log(message='Local file "{}" found in S3 and checksums match - ignoring file'.format(key_data['LocalFullPath']), level='info')
-                    else:
-                        if 'ifFileExists' in self.spec:
-                            if self.spec['ifFileExists']['overWrite'] is True:
-                                files_to_transfer[local_key] = copy.deepcopy(key_data)
-                                self.log(message='Local file "{}" marked for UPLOAD ("ifFileExists" is set to "{}")'.format(key_data['LocalFullPath'], self.spec['ifFileExists']['overWrite']), level='info')
-                            else:
-                                self.log(message='Local file "{}" found in S3 and checksums match - ignoring file ("ifFileExists" is set to "{}")'.format(key_data['LocalFullPath'], self.spec['ifFileExists']['overWrite']), level='info')
-                        else:
-                            self.log(message='Local file "{}" found in S3 - ignoring file'.format(key_data['LocalFullPath']), level='info')
-        return files_to_transfer
+                bundle_members = self._write_bundle(bundle_file=bundle_file, group=group, prefix=prefix)
+                self.log(message='Created bundle "{}" with {} files'.format(bundle_file, len(bundle_members)), level='info')
+            state[bundle_file_name] = {'Signature': signature, 'Members': bundle_members}
+            for member in bundle_members:
+                index_entries.append({'Key': member[0], 'Bundle': '{}{}'.format(prefix, bundle_file_name), 'Offset': member[1], 'Size': member[2], 'ContentChecksumSha256': member[3]})
 
-    def _remote_files_to_delete(self, current_s3_keys: dict, local_files: dict, work_dir: str, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->dict:
-        files_to_delete = dict()
-        if 'actionExtraFilesOnS3' in self.spec:
-            if self.spec['actionExtraFilesOnS3'].lower() == 'keep':
-                self.log(message='All remote keys will be kept as "actionExtraFilesOnS3" is set to "{}"'.format(self.spec['actionExtraFilesOnS3'].lower()), level='info')
-                return files_to_delete
-        for remote_key, remote_key_data in current_s3_keys.items():
-            if remote_key not in local_files:
-                files_to_delete[remote_key] = copy.deepcopy(remote_key_data)
-                self.log(message='Remote key "{}" will be deleted (not found in local files collection)'.format(remote_key_data['Key']), level='info')
-            else:
-                if remote_key_data['Key'] != local_files[remote_key]['Key']:
-                    files_to_delete[remote_key] = copy.deepcopy(remote_key_data)
-                    self.log(message='Remote key "{}" will be deleted (found in local files collection, but remote location mismatch on "Key" attributes)'.format(remote_key_data['Key']), level='info')
-        return files_to_delete
+        file_names = set(state.keys())
+        if len(index_entries) > 0:
+            file_names.add(self._bundle_index_key()[len(prefix):])
+            self._write_bundle_index(index_file='{}{}{}'.format(bundle_directory, os.sep, self._bundle_index_key()[len(prefix):]), index_entries=index_entries, prefix=prefix, bundle_count=len(state))
+        for file_name in os.listdir('{}{}.animus-bundles'.format(bundle_directory, os.sep)):
+            if '.animus-bundles/{}'.format(file_name) not in file_names:
+                os.remove('{}{}.animus-bundles{}{}'.format(bundle_directory, os.sep, os.sep, file_name))     # Bundles that no longer exist
+        with open(state_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        self.bundles = {
+            'FileNames': file_names,
+            'MemberKeys': set([index_entry['Key'] for index_entry in index_entries]),
+        }
+        self.log(message='Bundled {} small local files into {} bundles'.format(len(index_entries), len(state)), level='info')
+        for file_name in sorted(file_names):
+            yield (bundle_directory, file_name, 'checksum')
 
-    def _create_temporary_working_directory(self)->str:
-        work_dir = ''
-        if 'localStagingDirectory' in self.spec:
-            work_dir = self.spec['localStagingDirectory']
-            create_directory(path=work_dir)
-        else:
-            work_dir = create_temp_directory()
-        return work_dir
+    def _write_bundle(self, bundle_file: str, group: list, prefix: str)->list:
+        # Returns [key, offset of the content in the archive, size, SHA256 checksum] for every member
+        bundle_members = list()
+        with tarfile.open(name='{}.tmp'.format(bundle_file), mode='w', format=tarfile.PAX_FORMAT) as tar:
+            for key, file_full_path, size, mtime_ns, inode in group:
+                try:
+                    with open(file_full_path, 'rb') as f:
+                        data = f.read()
+                except:
+                    self.log(message='Failed to read local file "{}" - the file is not bundled'.format(file_full_path), level='warning')
+                    if self.spec.get('onError', 'warn').lower() == 'exception':
+                        raise Exception('The "onError" parameter was set to "exception" - Further operations halted')
+                    continue
+                tar_info = tarfile.TarInfo(name=key[len(prefix):])
+                tar_info.size = len(data)
+                tar_info.mtime = 0
+                tar_info.mode = 0o644
+                tar.addfile(tarinfo=tar_info, fileobj=io.BytesIO(data))
+                bundle_members.append([key, tar.offset - (len(data) + 511) // 512 * 512, len(data), hashlib.sha256(data).hexdigest()])
+        os.replace('{}.tmp'.format(bundle_file), bundle_file)
+        return bundle_members
 
-    def implemented_manifest_differ_from_this_manifest(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders())->bool:
-        if target_environment not in self.metadata['environments']:
-            return False
+    def _write_bundle_index(self, index_file: str, index_entries: list, prefix: str, bundle_count: int):
+        # The index is only written when it changed, so that its cached checksum remains valid
+        lines = [json.dumps({'Version': 1, 'Prefix': prefix, 'Bundles': bundle_count, 'Files': len(index_entries)}),] + [json.dumps(index_entry) for index_entry in index_entries]
+        content = gzip.compress('\n'.join(lines).encode('utf-8') + b'\n', mtime=0)
+        if os.path.isfile(index_file) is True:
+            with open(index_file, 'rb') as f:
+                if f.read() == content:
+                    return
+        with open('{}.tmp'.format(index_file), 'wb') as f:
+            f.write(content)
+        os.replace('{}.tmp'.format(index_file), index_file)
 
-        work_dir = self._create_temporary_working_directory()
+    def _get_all_local_files(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default', checksum_cache: dict=None)->dict:
+        files = dict()
+        pending_checksums = list()
+        for base_directory, file_name, compare_policy in self._iterate_local_source_files():
+            local_file_metadata = self._retrieve_local_file_meta_data(base_directory=base_directory, file_name_portion=file_name, compare_policy=compare_policy, checksum_cache=checksum_cache, pending_checksums=pending_checksums)
+            if local_file_metadata is not None:
+                target_key_checksum = hashlib.sha256(local_file_metadata['Key'].encode('utf-8')).digest()
+                files[target_key_checksum] = local_file_metadata
+        self._calculate_pending_checksums(pending_checksums=pending_checksums, checksum_cache=checksum_cache)
+        return files
 
-        s3_keys = self._get_all_s3_keys(variable_cache=variable_cache, target_environment=target_environment)
-        local_files = self._get_all_local_files(variable_cache=variable_cache, target_environment=target_environment)
-        files_to_transfer = self._files_to_transfer(current_s3_keys=s3_keys, local_files=local_files, work_dir=work_dir, variable_cache=variable_cache, target_environment=target_environment)
-        files_to_delete = self._remote_files_to_delete(current_s3_keys=s3_keys, local_files=local_files, work_dir=work_dir, variable_cache=variable_cache, target_environment=target_environment)
+    def _is_local_source_key(self, key: str)->bool:
+        # The reverse of _iterate_local_source_files(): determine if a remote key maps to a file that exists in one of the local sources
+        prefix = self._get_s3_key_prefix()
+        if key.startswith(prefix) is False or 'sources' not in self.spec:
+            return False
+        file_name = key[len(prefix):]
+        if self.bundles is not None:
+            if file_name in self.bundles['FileNames']:
+                return True     # A bundle or the bundle index
+            if key in self.bundles['MemberKeys']:
+                return False    # Bundled files are not stored as individual S3 keys
+        for source_definition in self.spec['sources']:
+            if 'sourceType' not in source_definition or 'baseDirectory' not in source_definition:
+                continue
+            file_full_path = '{}{}{}'.format(source_definition['baseDirectory'], os.sep, file_name)
+            if source_definition['sourceType'].lower() == 'localfiles':
+                if file_name in [listed_file_name.lstrip('/') for listed_file_name in source_definition.get('files', list())]:
+                    if os.path.isfile(file_full_path) is True:
+                        return True
+            elif source_definition['sourceType'].lower() == 'localdirectories':
+                if self._source_file_name_selected(source_definition=source_definition, file_name=file_name) is True:
+                    if os.path.isfile(file_full_path) is True:
+                        return True
+        return False
+
+    def _source_file_name_selected(self, source_definition: dict, file_name: str)->bool:
+        # Determines if a file name, relative to the base directory of a directory source, is one of the files of the source
+        recurse = source_definition.get('recurse', False)
+        for dir in source_definition.get('directories', ['',]):
+            dir_prefix = '{}/'.format(dir.strip('/'))
+            if dir_prefix == '/':
+                dir_prefix = ''
+            if file_name.startswith(dir_prefix) is False:
+                continue
+            if recurse is False and '/' in file_name[len(dir_prefix):]:
+                continue
+            if _path_is_selected(relative_path=file_name, exclude_rules=self._get_source_path_rules(source_definition=source_definition, field_name='exclude'), include_rules=self._get_source_path_rules(source_definition=source_definition, field_name='include')) is False:
+                continue
+            return True
+        return False
+
+    def _is_filtered_source_key(self, key: str)->bool:
+        # Remote keys matching the exclude/include filters of a source are left alone, even when extra remote files are deleted
+        prefix = self._get_s3_key_prefix()
+        if key.startswith(prefix) is False or 'sources' not in self.spec:
+            return False
+        file_name = key[len(prefix):]
+        for source_definition in self.spec['sources']:
+            if source_definition.get('sourceType', '').lower() != 'localdirectories':
+                continue
+            exclude_rules = self._get_source_path_rules(source_definition=source_definition, field_name='exclude')
+            include_rules = self._get_source_path_rules(source_definition=source_definition, field_name='include')
+            if len(exclude_rules) == 0 and len(include_rules) == 0:
+                continue
+            for dir in source_definition.get('directories', ['',]):
+                dir_prefix = '{}/'.format(dir.strip('/'))
+                if dir_prefix == '/':
+                    dir_prefix = ''
+                if file_name.startswith(dir_prefix) is True and _path_is_selected(relative_path=file_name, exclude_rules=exclude_rules, include_rules=include_rules) is False:
+                    return True
+        return False
+
+    def _get_diff_engine(self)->str:
+        if 'diffEngine' in self.spec:
+            if self.spec['diffEngine'] is not None:
+                if self.spec['diffEngine'].lower() in ('hash', 'sortmerge'):
+                    return self.spec['diffEngine'].lower()
+                self.log(message='Unsupported "diffEngine" value "{}" - using "hash"'.format(self.spec['diffEngine']), level='warning')
+        return 'hash'
+
+    def _keep_extra_remote_keys(self)->bool:
+        if 'actionExtraFilesOnS3' in self.spec:
+            if self.spec['actionExtraFilesOnS3'].lower() == 'keep':
+                return True
+        return False
+
+    def _write_sorted_run(self, entries: list, work_dir: str, run_number: int)->str:
+        run_file = '{}{}animus-sorted-run-{}.jsonl'.format(work_dir, os.sep, run_number)
+        entries.sort(key=lambda entry: entry[0])
+        with open(run_file, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write('{}\n'.format(json.dumps(entry)))
+        return run_file
+
+    def _read_sorted_run(self, run_file: str):
+        with open(run_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield tuple(json.loads(line))
+
+    def _iterate_sorted_local_source_files(self, work_dir: str, run_size: int=100000):
+        """Yield the local source files as (key, base_directory, file_name, compare_policy) tuples in S3 key order
+
+        Python compares strings by code point, which is the same order as the UTF-8 byte order S3 uses for listings. When
+        there are more than run_size files, sorted runs are spilled to the working directory and merged from disk.
+        """
+        entries = list()
+        run_files = list()
+        for base_directory, file_name, compare_policy in self._iterate_local_source_files():
+            entries.append((self._local_file_key(file_name_portion=file_name), base_directory, file_name, compare_policy))
+            if len(entries) >= run_size:
+                run_files.append(self._write_sorted_run(entries=entries, work_dir=work_dir, run_number=len(run_files)))
+                entries = list()
+        try:
+            if len(run_files) > 0:
+                if len(entries) > 0:
+                    run_files.append(self._write_sorted_run(entries=entries, work_dir=work_dir, run_number=len(run_files)))
+                    entries = list()
+                self.log(message='Merging {} sorted runs of local files'.format(len(run_files)), level='info')
+                sorted_entries = heapq.merge(*[self._read_sorted_run(run_file=run_file) for run_file in run_files], key=lambda entry: entry[0])
+            else:
+                entries.sort(key=lambda entry: entry[0])
+                sorted_entries = iter(entries)
+            # Both sorts are stable, so when more than one source maps to the same key the last source wins, as with the hash engine
+            previous_entry = None
+            for entry in sorted_entries:
+                if previous_entry is not None and previous_entry[0] != entry[0]:
+                    yield previous_entry
+                previous_entry = entry
+            if previous_entry is not None:
+                yield previous_entry
+        finally:
+            for run_file in run_files:
+                try:
+                    os.remove(run_file)
+                except:
+                    self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+
+    def _merge_join(self, local_entries: object, remote_entries: object):
+        # Both inputs must be sorted by key. Yields (local_entry, remote_key_data) pairs, with None for the missing side
+        local_entries = iter(local_entries)
+        remote_entries = iter(remote_entries)
+        local_entry = next(local_entries, None)
+        remote_key_data = next(remote_entries, None)
+        while local_entry is not None or remote_key_data is not None:
+            if remote_key_data is None or (local_entry is not None and local_entry[0] < remote_key_data['Key']):
+                yield (local_entry, None)
+                local_entry = next(local_entries, None)
+            elif local_entry is None or remote_key_data['Key'] < local_entry[0]:
+                yield (None, remote_key_data)
+                remote_key_data = next(remote_entries, None)
+            else:
+                yield (local_entry, remote_key_data)
+                local_entry = next(local_entries, None)
+                remote_key_data = next(remote_entries, None)
+
+    def _sort_merge_diff(self, sync_plan: dict, work_dir: str, checksum_cache: dict=None, variable_cache: VariableCache=VariableCache(), target_environment: str='default', batch_size: int=10000):
+        # Matched files are decided in batches, so that memory use does not grow with the number of files
+        keep_extra_files = self._keep_extra_remote_keys()
+        candidates = list()
+        pending_checksums = list()
+
+        def decide_batch():
+            self._calculate_pending_checksums(pending_checksums=pending_checksums, checksum_cache=checksum_cache)
+            remote_checksums = self._get_s3_key_checksums(
+                keys=[remote_key_data['Key'] for key_data, remote_key_data in candidates if remote_key_data is not None and remote_key_data['ContentChecksumSha256'] is None and key_data['VerifyS3Checksum'] is True],
+                variable_cache=variable_cache,
+                target_environment=target_environment
+            )
+            for key_data, remote_key_data in candidates:
+                remote_checksum = remote_checksums.get(key_data['Key'], None)
+                if remote_key_data is not None and remote_key_data['ContentChecksumSha256'] is not None:
+                    remote_checksum = remote_key_data['ContentChecksumSha256']
+                if self._local_file_needs_upload(
+                    key_data=key_data,
+                    remote_key_data=remote_key_data,
+                    remote_checksum=remote_checksum,
+                    remote_checksum_fallback_function=lambda: self._get_streamed_s3_key_checksum(key=key_data['Key'], variable_cache=variable_cache, target_environment=target_environment)
+                ) is True:
+                    _sync_plan_add_upload(sync_plan=sync_plan, key_data=key_data)
+            candidates.clear()
+            pending_checksums.clear()
+
+        for local_entry, remote_key_data in self._merge_join(
+            local_entries=self._iterate_sorted_local_source_files(work_dir=work_dir),
+            remote_entries=self._iterate_diff_s3_keys(sync_plan=sync_plan, variable_cache=variable_cache, target_environment=target_environment)
+        ):
+            if local_entry is None:
+                if keep_extra_files is False and self._is_filtered_source_key(key=remote_key_data['Key']) is False:
+                    _sync_plan_add_delete(sync_plan=sync_plan, key=remote_key_data['Key'])
+                    self.log(message='Remote key "{}" will be deleted (not found in local files collection)'.format(remote_key_data['Key']), level='info')
+                continue
+            key, base_directory, file_name, compare_policy = local_entry
+            key_data = self._retrieve_local_file_meta_data(base_directory=base_directory, file_name_portion=file_name, compare_policy=compare_policy, checksum_cache=checksum_cache, pending_checksums=pending_checksums)
+            if key_data is not None:
+                candidates.append((key_data, remote_key_data))
+            if len(candidates) >= batch_size:
+                decide_batch()
+        decide_batch()
+
+    def _head_s3_key(self, key: str, client: object, bucket_name: str)->dict:
+        try:
+            response = client.head_object(Bucket=bucket_name, Key=key, ChecksumMode='ENABLED')
+        except client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        key_data = {
+            'Key': key,
+            'Size': response['ContentLength'],
+            'LastModified': response['LastModified'].timestamp(),
+            'ContentChecksumSha256': None,
+        }
+        if 'animus-sha256' in response.get('Metadata', dict()):
+            key_data['ContentChecksumSha256'] = response['Metadata']['animus-sha256']
+        elif 'ChecksumSHA256' in response:
+            # Checksums of multipart uploads are checksums of the part checksums and can not be compared with a file checksum
+            if response.get('ChecksumType', 'FULL_OBJECT') == 'FULL_OBJECT' and '-' not in response['ChecksumSHA256']:
+                key_data['ContentChecksumSha256'] = base64.b64decode(response['ChecksumSHA256']).hex()
+        return key_data
+
+    def _get_s3_key_checksum(self, key: str, client: object, bucket_name: str)->str:
+        try:
+            key_data = self._head_s3_key(key=key, client=client, bucket_name=bucket_name)
+            if key_data is not None:
+                return key_data['ContentChecksumSha256']
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+        return None
+
+    def _get_checksum_download_setting(self, setting_name: str, default_value: int)->int:
+        if 'checksumDownload' in self.spec:
+            if isinstance(self.spec['checksumDownload'], dict):
+                if setting_name in self.spec['checksumDownload'] and self.spec['checksumDownload'][setting_name] is not None:
+                    try:
+                        if int(self.spec['checksumDownload'][setting_name]) > 0:
+                            return int(self.spec['checksumDownload'][setting_name])
+                    except:
+                        pass
+                    self.log(message='The "checksumDownload.{}" parameter must be a positive number - using the default value of {}'.format(setting_name, default_value), level='warning')
+        return default_value
+
+    def _get_streamed_s3_key_checksum(self, key: str, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->str:
+        # Objects uploaded without a recorded checksum must still be read to calculate the checksum. The content is hashed while
+        # it is received and is never written to disk.
+        concurrency = self._get_checksum_download_setting(setting_name='concurrency', default_value=1)
+        range_size = self._get_checksum_download_setting(setting_name='rangeSize', default_value=8388608)
+        checksum = hashlib.sha256()
+        decompressors = list()
+
+        def update(data: bytes, content_encoding: str=None):
+            # Objects stored with a gzip content encoding are hashed by their uncompressed content, as local files are
+            if content_encoding != 'gzip':
+                checksum.update(data)
+                return
+            if len(decompressors) == 0:
+                decompressors.append(zlib.decompressobj(wbits=31))
+            checksum.update(decompressors[0].decompress(data, 1048576))
+            while len(decompressors[0].unconsumed_tail) > 0:
+                checksum.update(decompressors[0].decompress(decompressors[0].unconsumed_tail, 1048576))
+
+        try:
+            client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+            bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+            if concurrency == 1:
+                response = client.get_object(Bucket=bucket_name, Key=key)
+                for chunk in response['Body'].iter_chunks(chunk_size=1048576):
+                    update(data=chunk, content_encoding=response.get('ContentEncoding', None))
+            else:
+                self._hash_s3_key_ranges(update=update, key=key, client=client, bucket_name=bucket_name, concurrency=concurrency, range_size=range_size)
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            return None
+        self.log(message='Calculated the checksum of S3 key "{}" from the streamed content'.format(key), level='info')
+        return checksum.hexdigest()
+
+    def _hash_s3_key_ranges(self, update: callable, key: str, client: object, bucket_name: str, concurrency: int, range_size: int):
+        # Byte ranges are retrieved concurrently, but hashed in order. At most concurrency + 1 ranges are kept in memory.
+        # The first range also returns the object size and ETag, and the ETag ensures all ranges are from the same object version.
+        try:
+            response = client.get_object(Bucket=bucket_name, Key=key, Range='bytes=0-{}'.format(range_size - 1))
+        except client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == 'InvalidRange':
+                return      # Empty objects have no satisfiable byte range
+            raise
+        content_encoding = response.get('ContentEncoding', None)
+        update(data=response['Body'].read(), content_encoding=content_encoding)
+        if 'ContentRange' not in response:
+            return      # The range was ignored and the complete object was returned
+        size = int(response['ContentRange'].rsplit('/', 1)[1])
+        etag = response['ETag']
+
+        def get_range(start: int)->bytes:
+            end = min(start + range_size, size) - 1
+            data = client.get_object(Bucket=bucket_name, Key=key, Range='bytes={}-{}'.format(start, end), IfMatch=etag)['Body'].read()
+            if len(data) != end - start + 1:
+                raise Exception('Received {} bytes instead of {} bytes for range {}-{} of S3 key "{}"'.format(len(data), end - start + 1, start, end, key))
+            return data
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = collections.deque()
+            for start in range(range_size, size, range_size):
+                pending.append(executor.submit(get_range, start))
+                if len(pending) > concurrency:
+                    update(data=pending.popleft().result(), content_encoding=content_encoding)
+            while len(pending) > 0:
+                update(data=pending.popleft().result(), content_encoding=content_encoding)
+
+    def _get_s3_key_checksums(self, keys: list, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->dict:
+        checksums = dict()
+        if len(keys) == 0:
+            return checksums
+        client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+        bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._get_max_concurrency()) as executor:
+            for key, checksum in zip(keys, executor.map(lambda key: self._get_s3_key_checksum(key=key, client=client, bucket_name=bucket_name), keys)):
+                checksums[key] = checksum
+        self.log(message='Retrieved recorded checksums for {} of {} S3 keys'.format(len([c for c in checksums.values() if c is not None]), len(keys)), level='info')
+        return checksums
+
+    def _files_to_transfer(self, sync_plan: dict, current_s3_keys: dict, local_files: dict, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
+        keys_to_verify = list()
+        for local_key, key_data in local_files.items():
+            if local_key in current_s3_keys and key_data['VerifyS3Checksum'] is True:
+                if current_s3_keys[local_key]['ContentChecksumSha256'] is None:     # Checksums recorded in the remote index need no request
+                    keys_to_verify.append(current_s3_keys[local_key]['Key'])
+        remote_checksums = self._get_s3_key_checksums(keys=keys_to_verify, variable_cache=variable_cache, target_environment=target_environment)
+        for local_key, key_data in local_files.items():
+            remote_key_data = current_s3_keys.get(local_key, None)
+            remote_checksum = None
+            if remote_key_data is not None:
+                remote_checksum = remote_key_data['ContentChecksumSha256']
+                if remote_checksum is None:
+                    remote_checksum = remote_checksums.get(remote_key_data['Key'], None)
+            if self._local_file_needs_upload(
+                key_data=key_data,
+                remote_key_data=remote_key_data,
+                remote_checksum=remote_checksum,
+                remote_checksum_fallback_function=lambda: self._get_streamed_s3_key_checksum(key=remote_key_data['Key'], variable_cache=variable_cache, target_environment=target_environment)
+            ) is True:
+                _sync_plan_add_upload(sync_plan=sync_plan, key_data=key_data)
+
+    def _local_file_needs_upload(self, key_data: dict, remote_key_data: dict, remote_checksum: str=None, remote_checksum_fallback_function: callable=None)->bool:
+        if remote_key_data is None:
+            self.log(message='Local file "{}" not found in S3 - marked for UPLOAD'.format(key_data['LocalFullPath']), level='info')
+            return True
+        overwrite = None
+        if 'ifFileExists' in self.spec:
+            overwrite = self.spec['ifFileExists']['overWrite']
+        compare_policy = key_data.get('ComparePolicy', 'name')
+        match_description = ''
+        if compare_policy == 'checksum':
+            if remote_checksum is None and remote_checksum_fallback_function is not None:
+                remote_checksum = remote_checksum_fallback_function()
+            if key_data['ContentChecksumSha256'] != remote_checksum:
+                key_data['ChecksumMismatch'] = True
+                self.log(message='Local file "{}" found in S3 and checksums mismatch - marked for UPLOAD'.format(key_data['LocalFullPath']), level='info')
+                return True
+            match_description = ' and checksums match'
+        elif compare_policy in ('size', 'size+mtime'):
+            if key_data['Size'] != remote_key_data['Size']:
+                self.log(message='Local file "{}" found in S3 and sizes differ - marked for UPLOAD'.format(key_data['LocalFullPath']), level='info')
+                return True
+            match_description = ' and sizes match'
+            if compare_policy == 'size+mtime':
+                # The S3 last modified time is the time the key was uploaded, so a later local modification means the file changed.
+                # S3 only records the time in whole seconds, and therefore the local time is then also truncated to whole seconds.
+                # The remote index records the upload time with fractions of a second, which is compared with the exact local time.
+                local_modified_time = key_data['ModifiedTime']
+                if remote_key_data.get('LastModified', None) is not None and float(remote_key_data['LastModified']).is_integer() is True:
+                    local_modified_time = int(local_modified_time)
+                if remote_key_data.get('LastModified', None) is None or local_modified_time > remote_key_data['LastModified']:
+                    self.log(message='Local file "{}" found in S3 and was modified after the upload - marked for UPLOAD'.format(key_data['LocalFullPath']), level='info')
+                    return True
+                match_description = ' and sizes and modification times match'
+        if overwrite is True:
+            self.log(message='Local file "{}" marked for UPLOAD ("ifFileExists" is set to "{}")'.format(key_data['LocalFullPath'], overwrite), level='info')
+            return True
+        elif overwrite is not None:
+            self.log(message='Local file "{}" found in S3{} - ignoring file ("ifFileExists" is set to "{}")'.format(key_data['LocalFullPath'], match_description, overwrite), level='info')
+        else:
+            self.log(message='Local file "{}" found in S3{} - ignoring file'.format(key_data['LocalFullPath'], match_description), level='info')
+        return False
+
+    def _remote_files_to_delete(self, sync_plan: dict, current_s3_keys: object, local_files: dict)->dict:
+        # Consumes the remote key listing only once, returning the remote keys also found locally (for comparison) while adding the remote keys to delete to the plan
+        matched_s3_keys = dict()
+        keep_extra_files = self._keep_extra_remote_keys()
+        if keep_extra_files is True:
+            self.log(message='All remote keys will be kept as "actionExtraFilesOnS3" is set to "{}"'.format(self.spec['actionExtraFilesOnS3'].lower()), level='info')
+        for remote_key_data in current_s3_keys:
+            remote_key = hashlib.sha256(remote_key_data['Key'].encode('utf-8')).digest()
+            if remote_key in local_files:
+                matched_s3_keys[remote_key] = remote_key_data
+            elif keep_extra_files is False and self._is_filtered_source_key(key=remote_key_data['Key']) is False:
+                _sync_plan_add_delete(sync_plan=sync_plan, key=remote_key_data['Key'])
+                self.log(message='Remote key "{}" will be deleted (not found in local files collection)'.format(remote_key_data['Key']), level='info')
+        return matched_s3_keys
+
+    def _server_side_copy_enabled(self)->bool:
+        if 'serverSideCopy' in self.spec:
+            if isinstance(self.spec['serverSideCopy'], dict):
+                return self.spec['serverSideCopy'].get('enabled', False) is True
+        return False
+
+    def _get_server_side_copy_minimum_size(self)->int:
+        minimum_size = 1048576
+        if 'serverSideCopy' in self.spec:
+            if isinstance(self.spec['serverSideCopy'], dict):
+                if 'minimumSize' in self.spec['serverSideCopy'] and self.spec['serverSideCopy']['minimumSize'] is not None:
+                    try:
+                        if int(self.spec['serverSideCopy']['minimumSize']) >= 0:
+                            return int(self.spec['serverSideCopy']['minimumSize'])
+                    except:
+                        pass
+                    self.log(message='The "serverSideCopy.minimumSize" parameter must be a number of bytes - using the default value of {}'.format(minimum_size), level='warning')
+        return minimum_size
+
+    def _get_server_side_copy_source_prefixes(self)->list:
+        # Other key prefixes in the bucket with content that may be copied, for example the previous destinationDirectory
+        source_prefixes = list()
+        if 'serverSideCopy' in self.spec:
+            if isinstance(self.spec['serverSideCopy'], dict):
+                for source_directory in self.spec['serverSideCopy'].get('sourceDirectories', None) or list():
+                    source_prefix = '{}/'.format(str(source_directory).strip('/'))
+                    if source_prefix != '/' and source_prefix != self._get_s3_key_prefix():
+                        source_prefixes.append(source_prefix)
+        return source_prefixes
+
+    def _iterate_diff_s3_keys(self, sync_plan: dict, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
+        # The remote keys that may be copy sources are kept with the sync plan while the differ consumes the listing, so that
+        # planning the server side copies does not have to list the destination again
+        remote_entries = self._iterate_s3_keys(variable_cache=variable_cache, target_environment=target_environment)
+        if self._server_side_copy_enabled() is False:
+            yield from remote_entries
+            return
+        minimum_size = self._get_server_side_copy_minimum_size()
+        for key_data in remote_entries:
+            if key_data['Size'] >= minimum_size and key_data['Size'] > 0:
+                sync_plan['CopySourceCandidates'].append((sys.intern(key_data['Key']), key_data['Size'], key_data['ContentChecksumSha256']))
+            yield key_data
+
+    def _plan_server_side_copies(self, sync_plan: dict, remote_keys: object, variable_cache: VariableCache=VariableCache(), target_environment: str='default', max_head_requests_per_upload: int=8):
+        # Uploads of content that already exists in the bucket under another key (same size and SHA256 checksum) are turned into
+        # server side copies. Keys that are uploaded during this sync are never used as a source, as their content will change.
+        minimum_size = self._get_server_side_copy_minimum_size()
+        uploads_by_size = collections.defaultdict(list)
+        for idx in range(len(sync_plan['Keys'])):
+            if sync_plan['Sizes'][idx] >= minimum_size and sync_plan['Sizes'][idx] > 0:
+                if self._compression_selected(key=sync_plan['Keys'][idx], size=sync_plan['Sizes'][idx]) is True:
+                    continue    # A copy would not be compressed
+                uploads_by_size[sync_plan['Sizes'][idx]].append(idx)
+        if len(uploads_by_size) == 0:
+            return
+        upload_keys = set(sync_plan['Keys'])
+        remote_keys_by_size = collections.defaultdict(list)
+        remote_checksums = dict()
+        for key_data in remote_keys:
+            if key_data['Size'] not in uploads_by_size or key_data['Key'] in upload_keys:
+                continue
+            remote_keys_by_size[key_data['Size']].append(key_data['Key'])
+            if key_data.get('ContentChecksumSha256', None) is not None:
+                remote_checksums[key_data['Key']] = key_data['ContentChecksumSha256']
+        if len(remote_keys_by_size) == 0:
+            return
+        keys_to_verify = list()
+        for size, keys in remote_keys_by_size.items():
+            keys_to_verify += [key for key in keys if key not in remote_checksums][:len(uploads_by_size[size]) * max_head_requests_per_upload]
+        remote_checksums.update(self._get_s3_key_checksums(keys=keys_to_verify, variable_cache=variable_cache, target_environment=target_environment))
+        copy_sources = dict()
+        for size, keys in remote_keys_by_size.items():
+            for key in keys:
+                if remote_checksums.get(key, None) is not None:
+                    copy_sources.setdefault((size, remote_checksums[key]), key)
+        for size, upload_indexes in uploads_by_size.items():
+            if size not in remote_keys_by_size:
+                continue
+            for idx in upload_indexes:
+                if sync_plan['Flags'][idx] & _SYNC_PLAN_HAS_CHECKSUM:
+                    content_checksum_sha256 = sync_plan['Digests'][idx*32:(idx+1)*32].hex()
+                else:
+                    # Reading a local file is cheaper than uploading it again
+                    content_checksum_sha256 = _sha256_file(file_path=sync_plan['LocalFullPaths'][idx])
+                    if content_checksum_sha256 is None:
+                        continue
+                    sync_plan['Digests'][idx*32:(idx+1)*32] = bytes.fromhex(content_checksum_sha256)
+                    sync_plan['Flags'][idx] |= _SYNC_PLAN_HAS_CHECKSUM
+                if (size, content_checksum_sha256) in copy_sources:
+                    sync_plan['CopySources'][idx] = copy_sources[(size, content_checksum_sha256)]
+                    self.log(message='Local file "{}" already exists in S3 as key "{}" - marked for COPY'.format(sync_plan['LocalFullPaths'][idx], sync_plan['CopySources'][idx]), level='info')
+        self.log(message='{} of {} uploads will be copied within S3'.format(len(sync_plan['CopySources']), len(sync_plan['Keys'])), level='info')
+
+    def _find_indexed_copy_source(self, key_data: dict)->str:
+        # Streaming syncs only use the remote index to find copy sources, and only keys that are not local files (and therefore not
+        # uploaded during the sync) are used
+        if self.remote_index is None or self._server_side_copy_enabled() is False:
+            return None
+        if key_data['Size'] < self._get_server_side_copy_minimum_size() or key_data['Size'] == 0:
+            return None
+        if self._compression_selected(key=key_data['Key'], size=key_data['Size']) is True:
+            return None
+        if key_data['ContentChecksumSha256'] is None:
+            key_data['ContentChecksumSha256'] = _sha256_file(file_path=key_data['LocalFullPath'])
+        with self.remote_index['Lock']:
+            rows = self.remote_index['Connection'].execute('SELECT key FROM remote_keys WHERE sha256 = ? AND size = ? LIMIT 16', (key_data['ContentChecksumSha256'], key_data['Size'])).fetchall()
+        for row in rows:
+            if row[0] != key_data['Key'] and self._is_local_source_key(key=row[0]) is False:
+                return row[0]
+        return None
+
+    def _run_copy_and_transfer_jobs(self, sync_plan: dict, delete_keys: object, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->dict:
+        if len(sync_plan['CopySources']) == 0:
+            jobs = itertools.chain(_sync_plan_upload_jobs(sync_plan=sync_plan), self._delete_jobs(keys=delete_keys))
+            return self._run_transfer_jobs(jobs=jobs, variable_cache=variable_cache, target_environment=target_environment)
+        # Keys may only be deleted once all the copies from these keys completed
+        results = self._run_transfer_jobs(jobs=_sync_plan_upload_jobs(sync_plan=sync_plan), variable_cache=variable_cache, target_environment=target_environment)
+        if results['Halted'] is False:
+            delete_results = self._run_transfer_jobs(jobs=self._delete_jobs(keys=delete_keys), variable_cache=variable_cache, target_environment=target_environment)
+            for result_name in ('Succeeded', 'Failed', 'FailedKeys'):
+                results[result_name] += delete_results[result_name]
+            results['Halted'] = delete_results['Halted']
+        return results
+
+    def _create_temporary_working_directory(self)->str:
+        work_dir = ''
+        if 'localStagingDirectory' in self.spec:
+            work_dir = self.spec['localStagingDirectory']
+            create_directory(path=work_dir)
+        else:
+            work_dir = create_temp_directory()
+        return work_dir
+
+    def _delete_temporary_working_directory(self, work_dir: str, target_environment: str='default'):
+        if work_dir == tempfile.gettempdir():   # Do not delete the system default temp directory if that was the directory set as the work dir
+            return
+        if 'localStagingDirectory' in self.spec:
+            # Only the content of the staging directory is deleted, keeping the local checksum cache, the sync journal and the bundles
+            keep_files = [self._checksum_cache_file(target_environment=target_environment),]
+            journal_file = self._sync_journal_file(target_environment=target_environment)
+            if journal_file is not None:
+                keep_files += ['{}{}'.format(journal_file, suffix) for suffix in ('', '-wal', '-shm')]
+            if self._bundling_enabled() is True:
+                keep_files.append(self._bundle_directory())
+            try:
+                for entry in os.scandir(work_dir):
+                    if entry.path not in keep_files:
+                        delete_directory(dir=entry.path)
+            except:
+                self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+        else:
+            delete_directory(dir=work_dir)
+
+    def _get_sync_mode(self)->str:
+        if 'syncMode' in self.spec:
+            if self.spec['syncMode'] is not None:
+                if self.spec['syncMode'].lower() in ('plan', 'streaming'):
+                    return self.spec['syncMode'].lower()
+                self.log(message='Unsupported "syncMode" value "{}" - using "plan"'.format(self.spec['syncMode']), level='warning')
+        return 'plan'
+
+    def _pipeline_worker(self, stage_name: str, input_queue: queue.Queue, output_queue: queue.Queue, process_item: callable, halt: threading.Event, record_failure: callable=None):
+        while True:
+            item = input_queue.get()
+            if item is None:
+                input_queue.put(None)   # Let the other workers of this stage also see the end marker
+                return
+            if halt.is_set() is True:
+                continue                # Keep draining the queue so that upstream stages never block
+            try:
+                for output_item in process_item(item):
+                    if output_queue is not None:
+                        output_queue.put(output_item)
+            except:
+                self.log(message='EXCEPTION in pipeline stage "{}": {}'.format(stage_name, traceback.format_exc()), level='error')
+                if record_failure is not None:
+                    record_failure(stage_name, item)     # The item is lost, and must be counted as failed
+
+    def _run_pipeline(self, source: object, stages: list, halt: threading.Event, queue_size: int, record_failure: callable=None):
+        """Run items from the source iterable through the stages, connected by bounded queues
+
+        Each stage is a tuple of the stage name, the number of worker threads and a function that accepts an item and
+        returns a list of items for the next stage. Items therefore flow to the next stage as soon as they are processed,
+        while the bounded queues keeps the number of items in memory constant. When a stage raises an exception, the
+        record_failure function is called with the stage name and the item.
+        """
+        queues = [queue.Queue(maxsize=queue_size) for stage in stages]
+        stage_threads = list()
+        for idx, (stage_name, worker_count, process_item) in enumerate(stages):
+            output_queue = None
+            if idx + 1 < len(queues):
+                output_queue = queues[idx + 1]
+            threads = list()
+            for worker_number in range(worker_count):
+                thread = threading.Thread(target=self._pipeline_worker, args=(stage_name, queues[idx], output_queue, process_item, halt, record_failure), daemon=True)
+                thread.start()
+                threads.append(thread)
+            stage_threads.append(threads)
+        try:
+            for item in source:
+                if halt.is_set() is True:
+                    break
+                queues[0].put(item)
+        finally:
+            for idx, threads in enumerate(stage_threads):
+                queues[idx].put(None)
+                for thread in threads:
+                    thread.join()
+
+    def _run_streaming_sync(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default', dry_run: bool=False)->dict:
+        results = {
+            'Uploaded': 0,
+            'Skipped': 0,
+            'Deleted': 0,
+            'Failed': 0,
+            'FailedKeys': list(),
+            'Halted': False,
+            'DifferencesDetected': False,
+            'ChecksumDifferencesDetected': False,
+        }
+        results_lock = threading.Lock()
+        halt = threading.Event()
+        client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+        bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+        max_concurrency = self._get_max_concurrency()
+        work_dir = self._create_temporary_working_directory()
+        checksum_cache = self._open_checksum_cache(target_environment=target_environment)
+
+        def record_failure(key: str):
+            with results_lock:
+                results['Failed'] += 1
+                results['FailedKeys'].append(key)
+                if self._halt_on_error() is True:
+                    results['Halted'] = True
+                    halt.set()
+            if self._halt_on_error() is False:
+                self.log(message='UPLOAD WARNING: Failed to process S3 key "{}"'.format(key), level='warning')
+
+        def record_difference():
+            with results_lock:
+                results['DifferencesDetected'] = True
+            if dry_run is True:
+                halt.set()      # The first difference is enough to know the manifest differs
+
+        def record_stage_failure(stage_name: str, item: object):
+            if stage_name == 'hash':
+                key = self._local_file_key(file_name_portion=item[1])
+            elif stage_name == 'compare':
+                key = item[0]['Key']
+            else:
+                key = item['Key']
+            record_failure(key=key)
+            if dry_run is True:
+                record_difference()     # The file could not be compared, so it can not be known to be synchronized
+
+        def hash_stage(item: tuple)->list:
+            base_directory, file_name, compare_policy, listing = item
+            if self._journal_upload_completed(key=self._local_file_key(file_name_portion=file_name), local_file_path='{}{}{}'.format(base_directory, os.sep, file_name)) is True:
+                with results_lock:
+                    results['Skipped'] += 1     # Already uploaded by the interrupted sync
+                return list()
+            try:
+                key_data = self._retrieve_local_file_meta_data(base_directory=base_directory, file_name_portion=file_name, compare_policy=compare_policy, checksum_cache=checksum_cache)
+            except:
+                self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+                record_failure(key=self._local_file_key(file_name_portion=file_name))
+                return list()
+            if key_data is None:
+                return list()
+            return [(key_data, listing),]
+
+        def compare_stage(item: tuple)->list:
+            key_data, listing = item
+            remote_checksum = None
+            if listing is None:
+                remote_key_data = self._remote_index_lookup(key=key_data['Key'])
+                if remote_key_data is not None:
+                    remote_checksum = remote_key_data['ContentChecksumSha256']
+            else:
+                # The merge-join already knows from the listing if the key exists, so only checksums requires a request
+                remote_key_data = listing['RemoteKeyData']
+                if remote_key_data is not None:
+                    remote_checksum = remote_key_data['ContentChecksumSha256']
+                if remote_key_data is not None and remote_checksum is None and key_data['VerifyS3Checksum'] is True:
+                    remote_checksum = self._get_s3_key_checksum(key=key_data['Key'], client=client, bucket_name=bucket_name)
+            if self._local_file_needs_upload(
+                key_data=key_data,
+                remote_key_data=remote_key_data,
+                remote_checksum=remote_checksum,
+                remote_checksum_fallback_function=lambda: self._get_streamed_s3_key_checksum(key=key_data['Key'], variable_cache=variable_cache, target_environment=target_environment)
+            ) is True:
+                record_difference()
+                if key_data.get('ChecksumMismatch', False) is True:
+                    with results_lock:
+                        results['ChecksumDifferencesDetected'] = True
+                if dry_run is False:
+                    return [key_data,]
+            else:
+                with results_lock:
+                    results['Skipped'] += 1
+            return list()
+
+        def upload_stage(key_data: dict)->list:
+            job = {'Action': 'UPLOAD', 'Key': key_data['Key'], 'LocalFullPath': key_data['LocalFullPath'], 'ContentChecksumSha256': key_data['ContentChecksumSha256']}
+            copy_source = self._find_indexed_copy_source(key_data=key_data)
+            if copy_source is not None:
+                job = {'Action': 'COPY', 'Key': key_data['Key'], 'CopySource': copy_source, 'LocalFullPath': key_data['LocalFullPath'], 'Size': key_data['Size'], 'ContentChecksumSha256': key_data['ContentChecksumSha256']}
+            if len(self._run_transfer_job(job=job, client=client, bucket_name=bucket_name, variable_cache=variable_cache, target_environment=target_environment)) == 0:
+                with results_lock:
+                    results['Uploaded'] += 1
+            else:
+                record_failure(key=key_data['Key'])
+            return list()
+
+        keep_extra_files = self._keep_extra_remote_keys()
+        extra_keys_file = '{}{}animus-extra-remote-keys.jsonl'.format(work_dir, os.sep)
+
+        def sort_merge_source():
+            # Extra remote keys are spilled to disk, to be deleted only once all uploads are done
+            with open(extra_keys_file, 'w', encoding='utf-8') as f:
+                for local_entry, remote_key_data in self._merge_join(
+                    local_entries=self._iterate_sorted_local_source_files(work_dir=work_dir),
+                    remote_entries=self._iterate_s3_keys(variable_cache=variable_cache, target_environment=target_environment)
+                ):
+                    if local_entry is not None:
+                        key, base_directory, file_name, compare_policy = local_entry
+                        yield (base_directory, file_name, compare_policy, {'RemoteKeyData': remote_key_data})
+                    elif keep_extra_files is False and self._is_filtered_source_key(key=remote_key_data['Key']) is False:
+                        self.log(message='Remote key "{}" will be deleted (not found in local files collection)'.format(remote_key_data['Key']), level='info')
+                        record_difference()
+                        f.write('{}\n'.format(json.dumps(remote_key_data['Key'])))
+
+        def spilled_extra_keys():
+            with open(extra_keys_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+
+        diff_engine = self._get_diff_engine()
+        # Without a remote index, the local files are merge-joined with the sorted listing instead of a HeadObject request per file
+        merge_join = diff_engine == 'sortmerge' or self.remote_index is None
+        if merge_join is True:
+            source = sort_merge_source()
+        else:
+            source = ((base_directory, file_name, compare_policy, None) for base_directory, file_name, compare_policy in self._iterate_local_source_files())
+
+        self.log(message='Starting streaming sync (dry_run={}, diffEngine={}, mergeJoin={}) with a maximum concurrency of {}'.format(dry_run, diff_engine, merge_join, max_concurrency), level='info')
+        try:
+            self._run_pipeline(
+                source=source,
+                stages=[
+                    ('hash', self._get_hash_workers(), hash_stage),
+                    ('compare', max_concurrency, compare_stage),
+                    ('upload', max_concurrency, upload_stage),
+                ],
+                halt=halt,
+                queue_size=max_concurrency * 2,
+                record_failure=record_stage_failure
+            )
+        finally:
+            source.close()
+            self._close_checksum_cache(checksum_cache=checksum_cache, prune=(halt.is_set() is False))
+
+        if halt.is_set() is False and keep_extra_files is False:
+            if merge_join is True:
+                extra_keys = spilled_extra_keys()
+            else:
+                # Remote keys are streamed from the listing and checked against the local sources one at a time
+                extra_keys = (key_data['Key'] for key_data in self._iterate_s3_keys(variable_cache=variable_cache, target_environment=target_environment) if self._is_local_source_key(key=key_data['Key']) is False and self._is_filtered_source_key(key=key_data['Key']) is False)
+            if dry_run is True:
+                for key in extra_keys:
+                    self.log(message='Remote key "{}" will be deleted (not found in local sources)'.format(key), level='info')
+                    results['DifferencesDetected'] = True
+                    break
+            else:
+                delete_results = self._run_transfer_jobs(jobs=self._delete_jobs(keys=extra_keys), variable_cache=variable_cache, target_environment=target_environment)
+                results['Deleted'] += delete_results['Succeeded']
+                results['Failed'] += delete_results['Failed']
+                results['FailedKeys'] += delete_results['FailedKeys']
+                if delete_results['Succeeded'] > 0 or delete_results['Failed'] > 0:
+                    results['DifferencesDetected'] = True
+                if delete_results['Halted'] is True:
+                    results['Halted'] = True
+        self._delete_temporary_working_directory(work_dir=work_dir, target_environment=target_environment)
+
+        self.log(message='Streaming sync completed: {} uploaded, {} unchanged, {} deleted and {} failed'.format(results['Uploaded'], results['Skipped'], results['Deleted'], results['Failed']), level='info')
+        return results
+
+    def implemented_manifest_differ_from_this_manifest(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders())->bool:
+        if target_environment not in self.metadata['environments']:
+            return False
+        self._reset_run_cache()
+
+        if self.shard is None and self._get_shard_count() > 1:
+            return self._shards_differ(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders)
+
+        if self.destination is None and len(self._get_additional_destinations()) > 0:
+            return self._destinations_differ(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders)
+
+        if self._get_sync_mode() == 'streaming':
+            if self.remote_index is not None:
+                return self._run_streaming_sync(variable_cache=variable_cache, target_environment=target_environment, dry_run=True)['DifferencesDetected']
+            self._open_remote_index(variable_cache=variable_cache, target_environment=target_environment, seed_from_listing=False)
+            try:
+                return self._run_streaming_sync(variable_cache=variable_cache, target_environment=target_environment, dry_run=True)['DifferencesDetected']
+            finally:
+                self._close_remote_index(write=False)
+
+        work_dir = self._create_temporary_working_directory()
+
+        sync_plan = _new_sync_plan()
+        checksum_cache = self._open_checksum_cache(target_environment=target_environment)
+        if self._get_diff_engine() == 'sortmerge':
+            try:
+                self._sort_merge_diff(sync_plan=sync_plan, work_dir=work_dir, checksum_cache=checksum_cache, variable_cache=variable_cache, target_environment=target_environment)
+            except:
+                self._close_checksum_cache(checksum_cache=checksum_cache, prune=False)
+                raise
+            self._close_checksum_cache(checksum_cache=checksum_cache)
+        else:
+            try:
+                local_files = self._get_all_local_files(variable_cache=variable_cache, target_environment=target_environment, checksum_cache=checksum_cache)
+            except:
+                self._close_checksum_cache(checksum_cache=checksum_cache, prune=False)
+                raise
+            self._close_checksum_cache(checksum_cache=checksum_cache)
+            s3_keys = self._remote_files_to_delete(sync_plan=sync_plan, current_s3_keys=self._iterate_diff_s3_keys(sync_plan=sync_plan, variable_cache=variable_cache, target_environment=target_environment), local_files=local_files)
+            self._files_to_transfer(sync_plan=sync_plan, current_s3_keys=s3_keys, local_files=local_files, variable_cache=variable_cache, target_environment=target_environment)
+
+            self.log(message='{}'.format('*'*80), level='debug')
+            self.log(message='s3_keys            = {}'.format(json.dumps(list(s3_keys.values()))), level='debug')
+            self.log(message='{}'.format('*'*80), level='debug')
+            self.log(message='local_files        = {}'.format(json.dumps(list(local_files.values()))), level='debug')
 
         self.log(message='{}'.format('*'*80), level='debug')
-        self.log(message='s3_keys            = {}'.format(json.dumps(s3_keys)), level='debug')
-        self.log(message='{}'.format('*'*80), level='debug')
-        self.log(message='local_files        = {}'.format(json.dumps(local_files)), level='debug')
-        self.log(message='{}'.format('*'*80), level='debug')
-        self.log(message='files_to_transfer  = {}'.format(json.dumps(files_to_transfer)), level='debug')
+        self.log(message='files_to_transfer  = {}'.format(json.dumps(sync_plan['Keys'])), level='debug')
         self.log(message='{}'.format('*'*80), level='debug')
-        self.log(message='files_to_delete  = {}'.format(json.dumps(files_to_delete)), level='debug')
+        self.log(message='files_to_delete  = {}'.format(json.dumps(sync_plan['DeleteKeys'])), level='debug')
         self.log(message='{}'.format('*'*80), level='debug')
 
-        if work_dir != tempfile.gettempdir():   # Do not delete the system default temp directory if that was the directory set as the work dir
-            delete_directory(dir=work_dir)
+        self._delete_temporary_working_directory(work_dir=work_dir, target_environment=target_environment)
 
+        # The complete plan is kept with this instance for apply_manifest(), while only the summary counts are exposed
+        self.sync_plans[target_environment] = sync_plan
         variable_cache.store_variable(
             variable=Variable(
-                name='{}:FILES_TO_TRANSFER'.format(self._var_name),
-                initial_value=files_to_transfer
+                name='{}:FILES_TO_TRANSFER'.format(self._var_name(target_environment=target_environment)),
+                initial_value=len(sync_plan['Keys'])
             ),
             overwrite_existing=True
         )
         variable_cache.store_variable(
             variable=Variable(
-                name='{}:FILES_TO_DELETE'.format(self._var_name),
-                initial_value=files_to_delete
+                name='{}:FILES_TO_DELETE'.format(self._var_name(target_environment=target_environment)),
+                initial_value=len(sync_plan['DeleteKeys'])
             ),
             overwrite_existing=True
         )
 
-        if len(files_to_transfer) > 0 or len(files_to_delete) > 0:
+        if len(sync_plan['Keys']) > 0 or len(sync_plan['DeleteKeys']) > 0:
             return True
 
         return False
 
-    def _write_transaction_log(self, message: str):
+    def _get_transaction_log_format(self)->str:
+        if 'transferLogFormat' in self.spec:
+            if self.spec['transferLogFormat'] is not None:
+                if self.spec['transferLogFormat'].lower() in ('text', 'jsonl'):
+                    return self.spec['transferLogFormat'].lower()
+                self.log(message='Unsupported "transferLogFormat" value "{}" - using "text"'.format(self.spec['transferLogFormat']), level='warning')
+        return 'text'
+
+    def _transaction_log_entry(self, message: str, action: str, succeeded: bool, bucket_name: str, key: str, local_file_path: str=None, size: int=None, duration: float=None)->dict:
+        return {
+            'Message': message,
+            'Action': action,
+            'Result': 'SUCCESS' if succeeded is True else 'FAILED',
+            'Bucket': bucket_name,
+            'Key': key,
+            'LocalFile': local_file_path,
+            'Bytes': size,
+            'DurationSeconds': duration,
+        }
+
+    def _format_transaction_log_lines(self, messages: list)->list:
+        timestamp = get_utc_timestamp(with_decimal=True)
+        lines = list()
+        for entry in messages:
+            if self._get_transaction_log_format() == 'jsonl':
+                record = {'Timestamp': timestamp}
+                record.update(entry)
+                lines.append('{}\n'.format(json.dumps(record)))
+            else:
+                lines.append('{}   {}\n'.format(timestamp, entry['Message']))
+        return lines
+
+    def _open_transaction_log(self, flush_bytes: int=65536, flush_interval: float=1.0):
+        # Log lines are queued to a single writer thread, which writes them in buffered chunks
+        if 'transferLogFile' not in self.spec or self.transaction_log is not None:
+            return
+        try:
+            log_file = open(self.spec['transferLogFile'], 'a', encoding='utf-8')
+        except:
+            self.log(message='Failed to open transaction log file "{}"'.format(self.spec['transferLogFile']), level='warning')
+            return
+        self.transaction_log = {
+            'File': log_file,
+            'Queue': queue.Queue(),
+            'Thread': None,
+        }
+        self.transaction_log['Thread'] = threading.Thread(target=self._transaction_log_writer, args=(self.transaction_log, flush_bytes, flush_interval), daemon=True)
+        self.transaction_log['Thread'].start()
+
+    def _transaction_log_writer(self, transaction_log: dict, flush_bytes: int, flush_interval: float):
+        buffer = list()
+        buffered_bytes = 0
+        last_flush = time.monotonic()
+        done = False
+        while done is False:
+            try:
+                lines = transaction_log['Queue'].get(timeout=max(0.0, flush_interval - (time.monotonic() - last_flush)))
+                if lines is None:
+                    done = True
+                else:
+                    buffer += lines
+                    buffered_bytes += sum([len(line) for line in lines])
+            except queue.Empty:
+                pass
+            if done is True or buffered_bytes >= flush_bytes or time.monotonic() - last_flush >= flush_interval:
+                if len(buffer) > 0:
+                    try:
+                        transaction_log['File'].write(''.join(buffer))
+                        transaction_log['File'].flush()
+                    except:
+                        self.log(message='Failed to write transaction log to log file "{}"'.format(self.spec['transferLogFile']), level='warning')
+                    buffer = list()
+                    buffered_bytes = 0
+                last_flush = time.monotonic()
+
+    def _close_transaction_log(self):
+        if self.transaction_log is None:
+            return
+        transaction_log = self.transaction_log
+        self.transaction_log = None
+        transaction_log['Queue'].put(None)
+        transaction_log['Thread'].join()
+        try:
+            os.fsync(transaction_log['File'].fileno())
+        except:
+            self.log(message='Failed to sync transaction log file "{}" to disk'.format(self.spec['transferLogFile']), level='warning')
+        transaction_log['File'].close()
+
+    def _write_transaction_log(self, message: dict=None, messages: list=None):
         if 'transferLogFile' in self.spec:
+            if messages is None:
+                messages = list()
+            if message is not None:
+                messages = [message,] + messages
+            lines = self._format_transaction_log_lines(messages=messages)
+            transaction_log = self.transaction_log
+            if transaction_log is not None:
+                transaction_log['Queue'].put(lines)
+                return
             try:
-                final_message = '{}   {}'.format(get_utc_timestamp(with_decimal=True), message)
                 with open(self.spec['transferLogFile'], 'a') as f:
-                    f.write('{}\n'.format(final_message))
+                    f.write(''.join(lines))
             except:
                 self.log(message='Failed to write transaction log to log file "{}"'.format(self.spec['transferLogFile']), level='warning')
 
-    def _upload_local_file(self, local_file_path: str, target_key: str, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
-        exception_on_fail = False
-        echo_warning = False
+    def _get_multipart_setting(self, setting_name: str)->int:
+        if 'multipartUpload' in self.spec:
+            if isinstance(self.spec['multipartUpload'], dict):
+                if setting_name in self.spec['multipartUpload'] and self.spec['multipartUpload'][setting_name] is not None:
+                    try:
+                        if int(self.spec['multipartUpload'][setting_name]) > 0:
+                            return int(self.spec['multipartUpload'][setting_name])
+                    except:
+                        pass
+                    self.log(message='The "multipartUpload.{}" parameter must be a positive number - ignoring the value "{}"'.format(setting_name, self.spec['multipartUpload'][setting_name]), level='warning')
+        return None
+
+    def _multipart_auto_tuning(self)->bool:
+        if 'multipartUpload' in self.spec:
+            if isinstance(self.spec['multipartUpload'], dict):
+                if 'auto' in self.spec['multipartUpload']:
+                    return self.spec['multipartUpload']['auto'] is True
+        return False
+
+    def _init_transfer_tuning(self, file_sizes: object=None, large_file_threshold: int=8388608):
+        # When the sizes of the files to upload are not known up front (streaming sync), assume all upload slots may carry large files
+        large_files = None
+        if file_sizes is not None:
+            large_files = len([size for size in file_sizes if size >= large_file_threshold])
+        self.transfer_tuning = {
+            'Lock': threading.Lock(),
+            'LargeFileThreshold': large_file_threshold,
+            'LargeFilesRemaining': large_files,
+            'StreamBytesPerSecond': None,
+        }
+
+    def _get_transfer_config(self, file_size: int, min_part_size: int=8388608, max_part_size: int=536870912, max_parts: int=10000, target_part_seconds: float=4.0, max_file_concurrency: int=32)->TransferConfig:
+        threshold = self._get_multipart_setting(setting_name='threshold')
+        configured_part_size = self._get_multipart_setting(setting_name='partSize')
+        part_size = configured_part_size
+        concurrency = self._get_multipart_setting(setting_name='concurrency')
+        auto = self._multipart_auto_tuning()
+        if auto is False and threshold is None and part_size is None and concurrency is None:
+            return None     # Use the boto3 defaults
+        if auto is True:
+            if self.transfer_tuning is None:
+                self._init_transfer_tuning()
+            with self.transfer_tuning['Lock']:
+                large_files_remaining = self.transfer_tuning['LargeFilesRemaining']
+                stream_bytes_per_second = self.transfer_tuning['StreamBytesPerSecond']
+            if part_size is None:
+                # Size parts so that each part takes a few seconds at the measured speed of earlier uploads
+                part_size = min_part_size
+                if stream_bytes_per_second is not None:
+                    part_size = min(max(int(stream_bytes_per_second * target_part_seconds), min_part_size), max_part_size)
+                part_size = ((part_size + 1048575) // 1048576) * 1048576
+            if concurrency is None:
+                # Spread a connection budget over the large files that may be uploaded at the same time, so that a few large
+                # files get many streams each while many large files get only a few streams each
+                max_concurrency = self._get_max_concurrency()
+                parallel_large_files = max_concurrency
+                if large_files_remaining is not None:
+                    parallel_large_files = max(1, min(max_concurrency, large_files_remaining))
+                concurrency = min(max(max_concurrency * 4 // parallel_large_files, 1), max_file_concurrency)
+            if configured_part_size is None:
+                # Smaller files are split in smaller parts so that each file still uses all of its streams
+                part_size = min(part_size, max(min_part_size, ((file_size // concurrency + 1048575) // 1048576) * 1048576))
+            if threshold is None:
+                threshold = 2 * min_part_size
+        if part_size is None:
+            part_size = min_part_size
+        if threshold is None:
+            threshold = min_part_size
+        if concurrency is None:
+            concurrency = 10
+        if file_size // part_size >= max_parts:     # S3 allows at most 10000 parts for one upload
+            part_size = ((file_size // (max_parts - 1) + 1048575) // 1048576) * 1048576
+        return TransferConfig(multipart_threshold=threshold, multipart_chunksize=part_size, max_concurrency=concurrency)
+
+    def _record_transfer_throughput(self, file_size: int, duration: float, transfer_config: TransferConfig):
+        if self.transfer_tuning is None or transfer_config is None or duration <= 0:
+            return
+        if file_size < transfer_config.multipart_threshold:
+            return
+        streams = max(1, min(transfer_config.max_concurrency, file_size // transfer_config.multipart_chunksize))
+        stream_bytes_per_second = file_size / duration / streams
+        with self.transfer_tuning['Lock']:
+            if self.transfer_tuning['StreamBytesPerSecond'] is None:
+                self.transfer_tuning['StreamBytesPerSecond'] = stream_bytes_per_second
+            else:
+                self.transfer_tuning['StreamBytesPerSecond'] = 0.7 * self.transfer_tuning['StreamBytesPerSecond'] + 0.3 * stream_bytes_per_second
+            if self.transfer_tuning['LargeFilesRemaining'] is not None and file_size >= self.transfer_tuning['LargeFileThreshold']:
+                self.transfer_tuning['LargeFilesRemaining'] = max(0, self.transfer_tuning['LargeFilesRemaining'] - 1)
+
+    def _compression_enabled(self)->bool:
+        if 'compression' in self.spec:
+            if isinstance(self.spec['compression'], dict):
+                return self.spec['compression'].get('enabled', False) is True
+        return False
+
+    def _get_compression_setting(self, setting_name: str, default_value: int, minimum_value: int=0, maximum_value: int=None)->int:
+        if 'compression' in self.spec:
+            if isinstance(self.spec['compression'], dict):
+                if setting_name in self.spec['compression'] and self.spec['compression'][setting_name] is not None:
+                    try:
+                        value = int(self.spec['compression'][setting_name])
+                        if value >= minimum_value and (maximum_value is None or value <= maximum_value):
+                            return value
+                    except:
+                        pass
+                    self.log(message='The "compression.{}" parameter value "{}" is not valid - using the default value of {}'.format(setting_name, self.spec['compression'][setting_name], default_value), level='warning')
+        return default_value
+
+    def _get_compression_rules(self)->tuple:
+        patterns = ['*.json', '*.yaml', '*.yml', '*.template']
+        if self.spec['compression'].get('patterns', None) is not None:
+            if isinstance(self.spec['compression']['patterns'], list) is True and len([pattern for pattern in self.spec['compression']['patterns'] if isinstance(pattern, str) is False]) == 0:
+                patterns = self.spec['compression']['patterns']
+            else:
+                self.log(message='The "compression.patterns" parameter must be a list of patterns - using the default patterns {}'.format(patterns), level='warning')
+        return _compile_path_patterns(patterns=tuple(patterns))
+
+    def _compression_selected(self, key: str, size: int)->bool:
+        # Only files matching the patterns are compressed, as most other content (archives, images, etc.) is already compressed
+        if self._compression_enabled() is False:
+            return False
+        if size < self._get_compression_setting(setting_name='minimumSize', default_value=1024):
+            return False
+        prefix = self._get_s3_key_prefix()
+        if key.startswith(prefix) is True:
+            key = key[len(prefix):]
+        return _path_matches_patterns(relative_path=key, is_directory=False, rules=self._get_compression_rules())
+
+    def _compress_local_file(self, f: object, size: int)->object:
+        # The compressed content is kept in a spooled temporary file (in memory up to 8 MiB), so that the parts of a multipart upload
+        # can be read again when a part is retried. Returns None when the content does not compress.
+        compressed_file = tempfile.SpooledTemporaryFile(max_size=8388608)
         try:
-            client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+            with gzip.GzipFile(filename='', fileobj=compressed_file, mode='wb', compresslevel=self._get_compression_setting(setting_name='level', default_value=6, minimum_value=1, maximum_value=9), mtime=0) as gzip_file:
+                shutil.copyfileobj(f, gzip_file, 1048576)
+        except:
+            compressed_file.close()
+            raise
+        f.seek(0)
+        if compressed_file.tell() >= size:
+            compressed_file.close()
+            return None
+        return compressed_file
+
+    def _upload_local_file(self, local_file_path: str, target_key: str, variable_cache: VariableCache=VariableCache(), target_environment: str='default', client: object=None, bucket_name: str=None, content_checksum_sha256: str=None)->bool:
+        if bucket_name is None:
+            bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+        extra_args = {'ChecksumAlgorithm': 'SHA256'}
+        if content_checksum_sha256 is None:
+            content_checksum_sha256 = self._calculate_local_file_checksum(file_full_path=local_file_path)    # Only calculated for files that are uploaded when the compare policy did not need it
+        if content_checksum_sha256 is not None:
+            extra_args['Metadata'] = {'animus-sha256': content_checksum_sha256}    # Allows later checksum verification without downloading the object
+        start_time = time.monotonic()
+        size = None
+        compressed_file = None
+        try:
+            if client is None:
+                client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
             with open(local_file_path, 'rb') as f:
-                client.upload_fileobj(f, self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment), target_key)
-            self.log(
-                message='Uploaded local file "{}" to S3 key "s3://{}/{}"'.format(
-                    local_file_path,
-                    self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment),
-                    target_key
-                ),
-                level='info'
-            )
-            self._write_transaction_log(message='SUCCESSFULLY Uploaded local file "{}" to S3 key "s3://{}/{}"'.format(
-                    local_file_path,
-                    self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment),
-                    target_key
-                )
-            )
+                size = os.fstat(f.fileno()).st_size
+                upload_file = f
+                if self._compression_selected(key=target_key, size=size) is True:
+                    compressed_file = self._compress_local_file(f=f, size=size)
+                if compressed_file is not None:
+                    # The checksum in the metadata remains the checksum of the uncompressed content, which is compared with the local file
+                    extra_args['ContentEncoding'] = 'gzip'
+                    upload_file = compressed_file
+                    self.log(message='Compressed local file "{}" from {} to {} bytes'.format(local_file_path, size, compressed_file.seek(0, os.SEEK_END)), level='info')
+                    size = compressed_file.tell()
+                    compressed_file.seek(0)
+                transfer_config = self._get_transfer_config(file_size=size)
+                callback = None
+                if self.rate_limiting is not None and 'Bytes' in self.rate_limiting['Buckets']:
+                    callback = lambda transferred_bytes: self._take_tokens(bucket_name='Bytes', amount=transferred_bytes)
+                multipart_threshold = 8388608
+                if transfer_config is not None:
+                    multipart_threshold = transfer_config.multipart_threshold
+                if self.sync_journal is not None and size >= multipart_threshold and compressed_file is None:
+                    self._upload_local_file_resumable(f=f, file_size=size, local_file_path=local_file_path, target_key=target_key, extra_args=extra_args, transfer_config=transfer_config, client=client, bucket_name=bucket_name)
+                elif transfer_config is not None:
+                    client.upload_fileobj(upload_file, bucket_name, target_key, ExtraArgs=extra_args, Config=transfer_config, Callback=callback)
+                else:
+                    client.upload_fileobj(upload_file, bucket_name, target_key, ExtraArgs=extra_args, Callback=callback)
+            self._record_transfer_throughput(file_size=size, duration=time.monotonic() - start_time, transfer_config=transfer_config)
+            self._remote_index_record_upload(key=target_key, size=size, content_checksum_sha256=content_checksum_sha256)
+            self.log(message='Uploaded local file "{}" to S3 key "s3://{}/{}"'.format(local_file_path, bucket_name, target_key), level='info')
+            self._write_transaction_log(message=self._transaction_log_entry(message='SUCCESSFULLY Uploaded local file "{}" to S3 key "s3://{}/{}"'.format(local_file_path, bucket_name, target_key), action='UPLOAD', succeeded=True, bucket_name=bucket_name, key=target_key, local_file_path=local_file_path, size=size, duration=time.monotonic() - start_time))
         except:
             self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
-            self._write_transaction_log(message='FAILED to Uploaded local file "{}" to S3 key "s3://{}/{}"'.format(
-                    local_file_path,
-                    self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment),
-                    target_key
-                )
+            self._write_transaction_log(message=self._transaction_log_entry(message='FAILED to Uploaded local file "{}" to S3 key "s3://{}/{}"'.format(local_file_path, bucket_name, target_key), action='UPLOAD', succeeded=False, bucket_name=bucket_name, key=target_key, local_file_path=local_file_path, size=size, duration=time.monotonic() - start_time))
+            return False
+        finally:
+            if compressed_file is not None:
+                compressed_file.close()
+        return True
+
+    def _copy_s3_key(self, source_key: str, target_key: str, size: int, content_checksum_sha256: str, client: object, bucket_name: str)->bool:
+        # The managed copy uses CopyObject, or UploadPartCopy for large objects, so the content never leaves S3
+        extra_args = {'ChecksumAlgorithm': 'SHA256', 'MetadataDirective': 'REPLACE', 'Metadata': {'animus-sha256': content_checksum_sha256}}
+        start_time = time.monotonic()
+        try:
+            transfer_config = self._get_transfer_config(file_size=size)
+            if transfer_config is not None:
+                client.copy({'Bucket': bucket_name, 'Key': source_key}, bucket_name, target_key, ExtraArgs=extra_args, Config=transfer_config)
+            else:
+                client.copy({'Bucket': bucket_name, 'Key': source_key}, bucket_name, target_key, ExtraArgs=extra_args)
+            self._remote_index_record_upload(key=target_key, size=size, content_checksum_sha256=content_checksum_sha256)
+            self.log(message='Copied S3 key "s3://{}/{}" to S3 key "s3://{}/{}"'.format(bucket_name, source_key, bucket_name, target_key), level='info')
+            self._write_transaction_log(message=self._transaction_log_entry(message='SUCCESSFULLY Copied S3 key "s3://{}/{}" to S3 key "s3://{}/{}"'.format(bucket_name, source_key, bucket_name, target_key), action='COPY', succeeded=True, bucket_name=bucket_name, key=target_key, size=size, duration=time.monotonic() - start_time))
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            self._write_transaction_log(message=self._transaction_log_entry(message='FAILED to Copy S3 key "s3://{}/{}" to S3 key "s3://{}/{}"'.format(bucket_name, source_key, bucket_name, target_key), action='COPY', succeeded=False, bucket_name=bucket_name, key=target_key, size=size, duration=time.monotonic() - start_time))
+            return False
+        return True
+
+    def _abort_multipart_upload(self, key: str, upload_id: str, variable_cache: VariableCache=VariableCache(), target_environment: str='default', client: object=None, bucket_name: str=None):
+        try:
+            if client is None:
+                client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+            if bucket_name is None:
+                bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+            client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+            self.log(message='Aborted the unfinished multipart upload of S3 key "s3://{}/{}"'.format(bucket_name, key), level='info')
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+        self._journal_execute(statement='DELETE FROM multipart_uploads WHERE key = ? AND upload_id = ?', parameters=(key, upload_id))
+
+    def _abort_orphaned_multipart_uploads(self, resumable_keys: object=None, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
+        # Multipart uploads that are not in the journal (or that will not be resumed) are never completed, but S3 keeps
+        # (and bills) their parts until they are aborted
+        if self.sync_journal is None:
+            return
+        resumable_upload_ids = set()
+        for key, upload_id in self._journal_execute(statement='SELECT key, upload_id FROM multipart_uploads'):
+            if resumable_keys is None or key in resumable_keys:
+                resumable_upload_ids.add(upload_id)
+            else:
+                self._abort_multipart_upload(key=key, upload_id=upload_id, variable_cache=variable_cache, target_environment=target_environment)
+        try:
+            client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+            bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+            paginator = client.get_paginator('list_multipart_uploads')
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=self._get_s3_key_prefix()):
+                for upload in page.get('Uploads', list()):
+                    if self._key_in_shard(key=upload['Key']) is False:
+                        continue    # The uploads of the other shards are aborted by those shards
+                    if upload['UploadId'] not in resumable_upload_ids:
+                        self._abort_multipart_upload(key=upload['Key'], upload_id=upload['UploadId'], client=client, bucket_name=bucket_name)
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+
+    def _list_uploaded_parts(self, client: object, bucket_name: str, key: str, upload_id: str)->dict:
+        uploaded_parts = dict()
+        paginator = client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=bucket_name, Key=key, UploadId=upload_id):
+            for part in page.get('Parts', list()):
+                uploaded_parts[part['PartNumber']] = part
+        return uploaded_parts
+
+    def _upload_local_file_resumable(self, f: object, file_size: int, local_file_path: str, target_key: str, extra_args: dict, transfer_config: TransferConfig, client: object, bucket_name: str, max_parts: int=10000):
+        # The parts are uploaded with the low level API, so that the upload ID can be kept in the sync journal and an
+        # interrupted upload can continue with the parts that S3 does not have yet
+        part_size = 8388608
+        concurrency = 10
+        if transfer_config is not None:
+            part_size = transfer_config.multipart_chunksize
+            concurrency = transfer_config.max_concurrency
+        if file_size // part_size >= max_parts:
+            part_size = ((file_size // (max_parts - 1) + 1048575) // 1048576) * 1048576
+        part_count = (file_size + part_size - 1) // part_size
+        file_stat = os.fstat(f.fileno())
+        content_checksum_sha256 = extra_args.get('Metadata', dict()).get('animus-sha256', None)
+        upload_id = None
+        uploaded_parts = dict()
+        for previous_upload_id, previous_local_path, previous_size, previous_mtime_ns, previous_part_size, previous_checksum in self._journal_execute(statement='SELECT upload_id, local_path, size, mtime_ns, part_size, sha256 FROM multipart_uploads WHERE key = ?', parameters=(target_key,)):
+            if (previous_local_path, previous_size, previous_mtime_ns, previous_part_size, previous_checksum) == (local_file_path, file_size, file_stat.st_mtime_ns, part_size, content_checksum_sha256):
+                try:
+                    for part_number, part in self._list_uploaded_parts(client=client, bucket_name=bucket_name, key=target_key, upload_id=previous_upload_id).items():
+                        if part['Size'] == min(part_size, file_size - (part_number - 1) * part_size):
+                            uploaded_parts[part_number] = part
+                    upload_id = previous_upload_id
+                    self.log(message='Resuming the multipart upload of local file "{}" - {} of {} parts were already uploaded'.format(local_file_path, len(uploaded_parts), part_count), level='info')
+                except:
+                    self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            if upload_id is None:
+                # The local file changed since the upload started, or S3 no longer knows the upload
+                self._abort_multipart_upload(key=target_key, upload_id=previous_upload_id, client=client, bucket_name=bucket_name)
+        if upload_id is None:
+            response = client.create_multipart_upload(Bucket=bucket_name, Key=target_key, **extra_args)
+            upload_id = response['UploadId']
+            self._journal_execute(
+                statement='INSERT OR REPLACE INTO multipart_uploads (key, upload_id, local_path, size, mtime_ns, part_size, sha256) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                parameters=(target_key, upload_id, local_file_path, file_size, file_stat.st_mtime_ns, part_size, content_checksum_sha256)
             )
-            if 'onError' in self.spec:
-                if self.spec['onError'].lower() == 'exception':
-                    exception_on_fail = True
+
+        def upload_part(part_number: int)->dict:
+            offset = (part_number - 1) * part_size
+            data = os.pread(f.fileno(), min(part_size, file_size - offset), offset)
+            self._take_tokens(bucket_name='Bytes', amount=len(data))
+            response = client.upload_part(Bucket=bucket_name, Key=target_key, UploadId=upload_id, PartNumber=part_number, Body=data, ChecksumAlgorithm='SHA256')
+            return {'PartNumber': part_number, 'ETag': response['ETag'], 'ChecksumSHA256': response.get('ChecksumSHA256', None)}
+
+        missing_parts = [part_number for part_number in range(1, part_count + 1) if part_number not in uploaded_parts]
+        if len(missing_parts) > 0:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(concurrency, len(missing_parts))) as executor:
+                for part in executor.map(upload_part, missing_parts):
+                    uploaded_parts[part['PartNumber']] = part
+        parts = list()
+        for part_number in range(1, part_count + 1):
+            part = {'PartNumber': part_number, 'ETag': uploaded_parts[part_number]['ETag']}
+            if uploaded_parts[part_number].get('ChecksumSHA256', None) is not None:
+                part['ChecksumSHA256'] = uploaded_parts[part_number]['ChecksumSHA256']
+            parts.append(part)
+        client.complete_multipart_upload(Bucket=bucket_name, Key=target_key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+        self._journal_execute(statement='DELETE FROM multipart_uploads WHERE key = ? AND upload_id = ?', parameters=(target_key, upload_id))
+
+    def _get_max_concurrency(self)->int:
+        max_concurrency = 10
+        if 'maxConcurrency' in self.spec:
+            try:
+                if int(self.spec['maxConcurrency']) > 0:
+                    max_concurrency = int(self.spec['maxConcurrency'])
                 else:
-                    echo_warning = True
-        if exception_on_fail is True:
-            raise Exception('Failed to upload local file "{}" and "onError" was set to "{}"' .format(local_file_path, self.spec['onError'].lower()))
-        elif echo_warning is True:
-            self.log(message='UPLOAD WARNING: Failed to upload local file "{}"'.format(local_file_path), level='warning')
+                    self.log(message='The "maxConcurrency" parameter must be a positive number - using the default value of {}'.format(max_concurrency), level='warning')
+            except:
+                self.log(message='The "maxConcurrency" parameter value "{}" is not a number - using the default value of {}'.format(self.spec['maxConcurrency'], max_concurrency), level='warning')
+        return max_concurrency
 
-    def apply_manifest(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), increment_exec_counter: bool=False, target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders()):
-        if target_environment not in self.metadata['environments']:
-            self.log(message='Target environment "{}" not relevant for this manifest'.format(target_environment), level='warning')
+    def _get_rate_limit_setting(self, setting_name: str)->int:
+        if 'rateLimit' in self.spec:
+            if isinstance(self.spec['rateLimit'], dict):
+                if setting_name in self.spec['rateLimit'] and self.spec['rateLimit'][setting_name] is not None:
+                    try:
+                        if int(self.spec['rateLimit'][setting_name]) > 0:
+                            return int(self.spec['rateLimit'][setting_name])
+                    except:
+                        pass
+                    self.log(message='The "rateLimit.{}" parameter must be a positive number - ignoring the value "{}"'.format(setting_name, self.spec['rateLimit'][setting_name]), level='warning')
+        return None
+
+    def _init_rate_limiting(self):
+        now = time.monotonic()
+        buckets = dict()
+        for bucket_name, setting_name in (('Requests', 'requestsPerSecond'), ('Bytes', 'bytesPerSecond')):
+            rate = self._get_rate_limit_setting(setting_name=setting_name)
+            if rate is not None:
+                buckets[bucket_name] = {'Rate': rate, 'Tokens': rate, 'LastRefill': now}
+        max_concurrency = self._get_max_concurrency()
+        self.rate_limiting = {
+            'Lock': threading.Lock(),
+            'SlotAvailable': threading.Condition(),
+            'Buckets': buckets,
+            'MaxConcurrency': max_concurrency,
+            'ConcurrencyLimit': float(max_concurrency),
+            'ActiveTransfers': 0,
+            'LastThrottle': 0.0,
+            'Throttles': 0,
+        }
+
+    def _take_tokens(self, bucket_name: str, amount: int):
+        # Token bucket with a capacity of one second. Tokens may be borrowed, in which case the caller waits until the debt is repaid.
+        rate_limiting = self.rate_limiting
+        if rate_limiting is None or bucket_name not in rate_limiting['Buckets'] or amount <= 0:
             return
-        self.log(message='APPLY CALLED', level='info')
+        with rate_limiting['Lock']:
+            bucket = rate_limiting['Buckets'][bucket_name]
+            now = time.monotonic()
+            bucket['Tokens'] = min(bucket['Rate'], bucket['Tokens'] + (now - bucket['LastRefill']) * bucket['Rate'])
+            bucket['LastRefill'] = now
+            bucket['Tokens'] -= amount
+            wait_time = 0.0
+            if bucket['Tokens'] < 0:
+                wait_time = -bucket['Tokens'] / bucket['Rate']
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def _before_s3_request(self, **kwargs):
+        self._take_tokens(bucket_name='Requests', amount=1)
+
+    def _after_s3_response(self, response_dict: dict=None, parsed_response: dict=None, **kwargs):
+        throttled = False
+        if response_dict is not None and response_dict.get('status_code', None) == 503:
+            throttled = True
+        if parsed_response is not None and parsed_response.get('Error', dict()).get('Code', None) in ('SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequests'):
+            throttled = True
+        if throttled is True:
+            self._record_throttle()
+
+    def _record_throttle(self, min_interval: float=1.0):
+        # Multiplicative decrease, but at most once per interval so that one burst of throttled requests does not collapse the concurrency
+        rate_limiting = self.rate_limiting
+        if rate_limiting is None:
+            return
+        with rate_limiting['SlotAvailable']:
+            rate_limiting['Throttles'] += 1
+            now = time.monotonic()
+            if now - rate_limiting['LastThrottle'] < min_interval:
+                return
+            rate_limiting['LastThrottle'] = now
+            rate_limiting['ConcurrencyLimit'] = max(1.0, rate_limiting['ConcurrencyLimit'] / 2)
+            concurrency_limit = int(rate_limiting['ConcurrencyLimit'])
+        self.log(message='S3 is throttling requests - reducing the transfer concurrency to {}'.format(concurrency_limit), level='warning')
+
+    def _record_transfer_success(self):
+        # Additive increase of about one transfer slot for every full round of successful transfers
+        rate_limiting = self.rate_limiting
+        if rate_limiting is None:
+            return
+        with rate_limiting['SlotAvailable']:
+            if rate_limiting['ConcurrencyLimit'] < rate_limiting['MaxConcurrency']:
+                rate_limiting['ConcurrencyLimit'] = min(float(rate_limiting['MaxConcurrency']), rate_limiting['ConcurrencyLimit'] + 1.0 / rate_limiting['ConcurrencyLimit'])
+                rate_limiting['SlotAvailable'].notify_all()
+
+    def _acquire_transfer_slot(self):
+        rate_limiting = self.rate_limiting
+        if rate_limiting is None:
+            return
+        with rate_limiting['SlotAvailable']:
+            while rate_limiting['ActiveTransfers'] >= int(rate_limiting['ConcurrencyLimit']):
+                rate_limiting['SlotAvailable'].wait(timeout=1.0)
+            rate_limiting['ActiveTransfers'] += 1
+
+    def _release_transfer_slot(self):
+        rate_limiting = self.rate_limiting
+        if rate_limiting is None:
+            return
+        with rate_limiting['SlotAvailable']:
+            rate_limiting['ActiveTransfers'] = max(0, rate_limiting['ActiveTransfers'] - 1)
+            rate_limiting['SlotAvailable'].notify_all()
+
+    def _halt_on_error(self)->bool:
+        if 'onError' in self.spec:
+            if self.spec['onError'].lower() == 'exception':
+                return True
+        return False
+
+    def _run_transfer_job(self, job: dict, client: object, bucket_name: str, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->list:
+        try:
+            self._remove_remote_index_object(client=client, bucket_name=bucket_name)
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            return self._job_keys(job=job)     # Changing the bucket while the previous index remains would leave a stale index
+        self._acquire_transfer_slot()
+        try:
+            failed_keys = self._run_transfer_action(job=job, client=client, bucket_name=bucket_name, variable_cache=variable_cache, target_environment=target_environment)
+        finally:
+            self._release_transfer_slot()
+        self._journal_record_completed_job(job=job, failed_keys=failed_keys)
+        if len(failed_keys) > 0 and self.remote_index is not None:
+            self.remote_index['Failed'] = True
+        if len(failed_keys) == 0:
+            self._record_transfer_success()
+        return failed_keys
+
+    def _run_transfer_action(self, job: dict, client: object, bucket_name: str, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->list:
+        if job['Action'] == 'UPLOAD':
+            if self._upload_local_file(local_file_path=job['LocalFullPath'], target_key=job['Key'], variable_cache=variable_cache, target_environment=target_environment, client=client, bucket_name=bucket_name, content_checksum_sha256=job['ContentChecksumSha256']) is True:
+                return list()
+            return [job['Key'],]
+        elif job['Action'] == 'COPY':
+            if self._copy_s3_key(source_key=job['CopySource'], target_key=job['Key'], size=job['Size'], content_checksum_sha256=job['ContentChecksumSha256'], client=client, bucket_name=bucket_name) is True:
+                return list()
+            self.log(message='Copying S3 key "{}" to "{}" failed - uploading the local file "{}" instead'.format(job['CopySource'], job['Key'], job['LocalFullPath']), level='warning')
+            if self._upload_local_file(local_file_path=job['LocalFullPath'], target_key=job['Key'], variable_cache=variable_cache, target_environment=target_environment, client=client, bucket_name=bucket_name, content_checksum_sha256=job['ContentChecksumSha256']) is True:
+                return list()
+            return [job['Key'],]
+        elif job['Action'] == 'DELETE_BATCH':
+            return self._delete_s3_keys(keys=job['Keys'], variable_cache=variable_cache, target_environment=target_environment, client=client, bucket_name=bucket_name)
+        self.log(message='Unsupported transfer action "{}"'.format(job['Action']), level='error')
+        return self._job_keys(job=job)
+
+    def _job_keys(self, job: dict)->list:
+        if 'Keys' in job:
+            return job['Keys']
+        return [job['Key'],]
+
+    def _run_transfer_jobs(self, jobs: object, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->dict:
+        results = {
+            'Succeeded': 0,
+            'Failed': 0,
+            'FailedKeys': list(),
+            'Halted': False,
+        }
+        job_iterator = iter(jobs)
+        first_job = next(job_iterator, None)
+        if first_job is None:
+            return results
+        job_iterator = itertools.chain([first_job,], job_iterator)
+        client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+        bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+        max_concurrency = self._get_max_concurrency()
+        self.log(message='Processing transfer jobs with a maximum concurrency of {}'.format(max_concurrency), level='info')
+        in_flight = dict()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            while True:
+                while results['Halted'] is False and len(in_flight) < max_concurrency:
+                    job = next(job_iterator, None)
+                    if job is None:
+                        break
+                    in_flight[executor.submit(self._run_transfer_job, job, client, bucket_name, variable_cache, target_environment)] = job
+                if len(in_flight) == 0:
+                    break
+                done, not_done = concurrent.futures.wait(list(in_flight.keys()), return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    job = in_flight.pop(future)
+                    job_keys = self._job_keys(job=job)
+                    failed_keys = job_keys
+                    try:
+                        failed_keys = future.result()
+                    except:
+                        self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+                    results['Succeeded'] += len(job_keys) - len(failed_keys)
+                    if len(failed_keys) == 0:
+                        continue
+                    results['Failed'] += len(failed_keys)
+                    results['FailedKeys'] += failed_keys
+                    if self._halt_on_error() is True:
+                        results['Halted'] = True    # Stop scheduling new jobs, but allow the jobs already in flight to complete
+                    else:
+                        for failed_key in failed_keys:
+                            self.log(message='{} WARNING: Failed to process S3 key "{}"'.format(job['Action'], failed_key), level='warning')
+        self.log(message='Transfer jobs completed: {} succeeded and {} failed'.format(results['Succeeded'], results['Failed']), level='info')
+        if self.rate_limiting is not None and self.rate_limiting['Throttles'] > 0:
+            self.log(message='S3 throttled {} requests - the transfer concurrency ended at {}'.format(self.rate_limiting['Throttles'], int(self.rate_limiting['ConcurrencyLimit'])), level='warning')
+        return results
+
+    def _watch_enabled(self)->bool:
+        if self.shard is not None:
+            return False
+        if 'watch' in self.spec:
+            if isinstance(self.spec['watch'], dict):
+                if self.spec['watch'].get('enabled', False) is True and self._bundling_enabled() is True:
+                    self.log(message='Watching the local sources is not supported together with the "bundling" parameter - the sources are synchronized once', level='warning')
+                    return False
+                return self.spec['watch'].get('enabled', False) is True
+        return False
+
+    def _get_watch_setting(self, setting_name: str, default_value: float)->float:
+        if 'watch' in self.spec:
+            if isinstance(self.spec['watch'], dict):
+                if setting_name in self.spec['watch'] and self.spec['watch'][setting_name] is not None:
+                    try:
+                        if float(self.spec['watch'][setting_name]) >= 0:
+                            return float(self.spec['watch'][setting_name])
+                    except:
+                        pass
+                    self.log(message='The "watch.{}" parameter must be a number of seconds - using the default value of {}'.format(setting_name, default_value), level='warning')
+        return default_value
+
+    def _iterate_watch_directories(self, root_directory: str=None):
+        # Yields the directories of the local sources to watch, skipping excluded directories. With a root directory, only the
+        # directories from the root directory downwards are returned (for example for a directory that was just created).
+        for source_definition in self.spec.get('sources', list()):
+            if 'sourceType' not in source_definition or 'baseDirectory' not in source_definition:
+                continue
+            base_directory = source_definition['baseDirectory'].rstrip(os.sep)
+            if source_definition['sourceType'].lower() == 'localfiles':
+                if root_directory is None:
+                    for file_name in source_definition.get('files', list()):
+                        yield os.path.dirname('{}{}{}'.format(base_directory, os.sep, file_name.lstrip('/')))
+                continue
+            if source_definition['sourceType'].lower() != 'localdirectories':
+                continue
+            recurse = source_definition.get('recurse', False)
+            exclude_rules = self._get_source_path_rules(source_definition=source_definition, field_name='exclude')
+            for dir in source_definition.get('directories', ['',]):
+                directory = '{}{}{}'.format(base_directory, os.sep, dir.strip('/')).rstrip(os.sep)
+                if root_directory is not None:
+                    if recurse is False or root_directory.startswith('{}{}'.format(directory, os.sep)) is False:
+                        continue
+                    if _directory_is_excluded(relative_directory=root_directory[len(base_directory)+len(os.sep):].replace(os.sep, '/'), exclude_rules=exclude_rules) is True:
+                        continue
+                    directory = root_directory
+                directories = [directory,]
+                visited_directories = set()
+                while len(directories) > 0:
+                    current_directory = directories.pop()
+                    if _directory_already_visited(directory=current_directory, visited_directories=visited_directories) is True:
+                        continue    # A symbolic link cycle, or a directory that is already watched through another path
+                    yield current_directory
+                    if recurse is False:
+                        continue
+                    try:
+                        with os.scandir(current_directory) as entries:
+                            for entry in entries:
+                                if entry.is_dir() is False:
+                                    continue
+                                entry_path = '{}{}{}'.format(current_directory, os.sep, entry.name)
+                                if _path_matches_patterns(relative_path=entry_path[len(base_directory)+len(os.sep):].replace(os.sep, '/'), is_directory=True, rules=exclude_rules) is False:
+                                    directories.append(entry_path)
+                    except:
+                        self.log(message='Failed to read directory "{}" - the directory will not be watched'.format(current_directory), level='warning')
+
+    def _local_source_file_for_path(self, file_full_path: str)->tuple:
+        # The reverse of _iterate_local_source_files() for a single local path: returns (base directory, file name, compare policy) or None
+        for source_definition in self.spec.get('sources', list()):
+            if 'sourceType' not in source_definition or 'baseDirectory' not in source_definition:
+                continue
+            full_base_dir = '{}{}'.format(source_definition['baseDirectory'].rstrip(os.sep), os.sep)
+            if file_full_path.startswith(full_base_dir) is False:
+                continue
+            file_name = file_full_path[len(full_base_dir):].lstrip(os.sep)
+            if source_definition['sourceType'].lower() == 'localfiles':
+                if file_name.replace(os.sep, '/') not in [listed_file_name.lstrip('/') for listed_file_name in source_definition.get('files', list())]:
+                    continue
+            elif source_definition['sourceType'].lower() == 'localdirectories':
+                if self._source_file_name_selected(source_definition=source_definition, file_name=file_name.replace(os.sep, '/')) is False:
+                    continue
+            else:
+                continue
+            return (source_definition['baseDirectory'], file_name, self._get_compare_policy(source_definition=source_definition))
+        return None
+
+    def _local_source_directory_key_prefix(self, directory: str)->str:
+        for source_definition in self.spec.get('sources', list()):
+            if source_definition.get('sourceType', '').lower() != 'localdirectories' or 'baseDirectory' not in source_definition:
+                continue
+            full_base_dir = '{}{}'.format(source_definition['baseDirectory'].rstrip(os.sep), os.sep)
+            if directory.startswith(full_base_dir) is True:
+                return self._local_file_key(file_name_portion='{}/'.format(directory[len(full_base_dir):].replace(os.sep, '/').strip('/')))
+        return None
+
+    def _iterate_s3_keys_below(self, key_prefix: str, client: object, bucket_name: str, use_remote_index: bool=True):
+        if use_remote_index is True and self.remote_index is not None:
+            with self.remote_index['Lock']:
+                rows = self.remote_index['Connection'].execute('SELECT key, size, sha256 FROM remote_keys WHERE key >= ? AND key < ? ORDER BY key', (key_prefix, '{}\U0010FFFF'.format(key_prefix))).fetchall()
+            for key, size, content_checksum_sha256 in rows:
+                yield {'Key': key, 'Size': size, 'ContentChecksumSha256': content_checksum_sha256}
+            return
+        for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=key_prefix):
+            for key_data in page.get('Contents', list()):
+                yield {'Key': key_data['Key'], 'Size': key_data['Size'], 'ContentChecksumSha256': None}
+
+    def _local_source_snapshot(self)->dict:
+        snapshot = dict()
+        for base_directory, file_name, compare_policy in self._iterate_local_source_files():
+            file_full_path = '{}{}{}'.format(base_directory.rstrip(os.sep), os.sep, file_name.lstrip(os.sep))
+            try:
+                file_stat = os.stat(file_full_path)
+            except:
+                continue
+            snapshot[file_full_path] = (file_stat.st_size, file_stat.st_mtime_ns)
+        return snapshot
+
+    def _record_watch_events(self, watcher: dict, events: list, watch_state: dict):
+        for path, mask in events:
+            if path is None:
+                self.log(message='Filesystem events were lost - a full sync will be done', level='warning')
+                watch_state['FullSyncRequired'] = True
+            elif mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                # Files may be created before the new directory is watched, and therefore all the files found in it count as changed
+                for directory in self._iterate_watch_directories(root_directory=path):
+                    _inotify_add_watch(watcher=watcher, directory=directory)
+                    try:
+                        with os.scandir(directory) as entries:
+                            for entry in entries:
+                                if entry.is_dir() is False:
+                                    watch_state['ChangedPaths'].add('{}{}{}'.format(directory, os.sep, entry.name))
+                    except:
+                        self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            elif mask & _IN_ISDIR and mask & (_IN_DELETE | _IN_MOVED_FROM):
+                _inotify_remove_watches(watcher=watcher, directory=path)
+                watch_state['RemovedDirectories'].add(path)
+            elif mask & _IN_ISDIR == 0:
+                watch_state['ChangedPaths'].add(path)
+            else:
+                continue
+            now = time.monotonic()
+            if watch_state['FirstEvent'] is None:
+                watch_state['FirstEvent'] = now
+            watch_state['LastEvent'] = now
+
+    def _sync_watched_changes(self, changed_paths: set, removed_directories: set, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->dict:
+        # Only the changed paths are compared with S3, using the remote index when available and otherwise one HEAD request per file
+        client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+        bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+        keep_extra_files = self._keep_extra_remote_keys()
+        sync_plan = _new_sync_plan()
+        delete_keys = set()
+        failed_keys = list()    # Paths that could not be compared are failed items, but do not stop the watch
+        for file_full_path in sorted(changed_paths):
+            source_file = self._local_source_file_for_path(file_full_path=file_full_path)
+            if source_file is None:
+                continue
+            base_directory, file_name, compare_policy = source_file
+            if os.path.isfile(file_full_path) is False:
+                if keep_extra_files is False:
+                    delete_keys.add(self._local_file_key(file_name_portion=file_name.replace(os.sep, '/')))
+                continue
+            try:
+                key_data = self._retrieve_local_file_meta_data(base_directory=base_directory, file_name_portion=file_name, compare_policy=compare_policy)
+                if key_data is None:
+                    continue
+                if self.remote_index is not None:
+                    remote_key_data = self._remote_index_lookup(key=key_data['Key'])
+                else:
+                    remote_key_data = self._head_s3_key(key=key_data['Key'], client=client, bucket_name=bucket_name)
+            except:
+                self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+                failed_keys.append(self._local_file_key(file_name_portion=file_name.replace(os.sep, '/')))
+                continue
+            remote_checksum = None
+            if remote_key_data is not None:
+                remote_checksum = remote_key_data['ContentChecksumSha256']
+            if self._local_file_needs_upload(
+                key_data=key_data,
+                remote_key_data=remote_key_data,
+                remote_checksum=remote_checksum,
+                remote_checksum_fallback_function=lambda: self._get_streamed_s3_key_checksum(key=key_data['Key'], variable_cache=variable_cache, target_environment=target_environment)
+            ) is True:
+                _sync_plan_add_upload(sync_plan=sync_plan, key_data=key_data)
+        if keep_extra_files is False:
+            # A directory that was moved away or deleted only produces one event, so its keys must be looked up
+            for directory in sorted(removed_directories):
+                key_prefix = self._local_source_directory_key_prefix(directory=directory)
+                if key_prefix is None:
+                    continue
+                try:
+                    for key_data in self._iterate_s3_keys_below(key_prefix=key_prefix, client=client, bucket_name=bucket_name):
+                        if self._is_local_source_key(key=key_data['Key']) is False and self._is_filtered_source_key(key=key_data['Key']) is False:
+                            delete_keys.add(key_data['Key'])
+                except:
+                    self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+                    failed_keys.append(key_prefix)
+        self.log(message='Watch batch with {} changed paths and {} removed directories: {} uploads and {} deletes'.format(len(changed_paths), len(removed_directories), len(sync_plan['Keys']), len(delete_keys)), level='info')
+        if self._server_side_copy_enabled() is True and len(delete_keys) > 0 and len(sync_plan['Keys']) > 0:
+            # Files moved within the sources show up as a deleted and a new file in the same batch
+            self._plan_server_side_copies(sync_plan=sync_plan, remote_keys=self._iterate_watched_copy_sources(keys=sorted(delete_keys), client=client, bucket_name=bucket_name), variable_cache=variable_cache, target_environment=target_environment)
+        self._init_transfer_tuning(file_sizes=sync_plan['Sizes'])
+        results = self._run_copy_and_transfer_jobs(sync_plan=sync_plan, delete_keys=sorted(delete_keys), variable_cache=variable_cache, target_environment=target_environment)
+        if len(failed_keys) > 0:
+            results['Failed'] += len(failed_keys)
+            results['FailedKeys'] += failed_keys
+            if self._halt_on_error() is True:
+                results['Halted'] = True
+            else:
+                for failed_key in failed_keys:
+                    self.log(message='WATCH WARNING: Failed to compare S3 key "{}" with the local files'.format(failed_key), level='warning')
+        results['ChecksumDifferencesDetected'] = _sync_plan_checksum_differences_detected(sync_plan=sync_plan)
+        return results
+
+    def _iterate_watched_copy_sources(self, keys: list, client: object, bucket_name: str):
+        for key in keys:
+            try:
+                if self.remote_index is not None:
+                    key_data = self._remote_index_lookup(key=key)
+                else:
+                    key_data = self._head_s3_key(key=key, client=client, bucket_name=bucket_name)
+            except:
+                # The key is still deleted, it is only not used as a copy source
+                self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+                continue
+            if key_data is not None:
+                yield key_data
+
+    def _watch_local_sources(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders()):
+        # Changes are collected until no new events arrived for the debounce time (or the maximum batch delay passed), and are then
+        # synced as one batch. Repeated events for the same path therefore result in a single upload or delete.
+        debounce_seconds = self._get_watch_setting(setting_name='debounceSeconds', default_value=2.0)
+        max_batch_delay_seconds = max(self._get_watch_setting(setting_name='maxBatchDelaySeconds', default_value=30.0), debounce_seconds)
+        poll_interval_seconds = max(self._get_watch_setting(setting_name='pollIntervalSeconds', default_value=10.0), 1.0)
+        full_sync_interval_seconds = self._get_watch_setting(setting_name='fullSyncIntervalSeconds', default_value=0.0)
+        max_run_seconds = self._get_watch_setting(setting_name='maxRunSeconds', default_value=0.0)
+        watch_state = {
+            'ChangedPaths': set(),
+            'RemovedDirectories': set(),
+            'FullSyncRequired': False,
+            'FirstEvent': None,
+            'LastEvent': None,
+        }
+        all_ok = True
+        checksum_differences_detected = False
+        snapshot = None
+        watcher = _inotify_open()
+        if watcher is not None:
+            for directory in self._iterate_watch_directories():
+                if _inotify_add_watch(watcher=watcher, directory=directory) is False:
+                    self.log(message='Failed to watch directory "{}" (errno {}) - changes in this directory will only be synced by a full sync'.format(directory, ctypes.get_errno()), level='warning')
+            self.log(message='Watching {} directories for changes'.format(len(watcher['Descriptors'])), level='info')
+        else:
+            snapshot = self._local_source_snapshot()
+            self.log(message='inotify is not available - polling {} local files for changes every {} seconds'.format(len(snapshot), poll_interval_seconds), level='info')
+        start_time = time.monotonic()
+        last_full_sync = start_time
+        last_poll = start_time
+        try:
+            while True:
+                now = time.monotonic()
+                deadlines = [now + 1.0,]
+                if max_run_seconds > 0:
+                    deadlines.append(start_time + max_run_seconds)
+                if watch_state['FirstEvent'] is not None:
+                    deadlines.append(watch_state['LastEvent'] + debounce_seconds)
+                    deadlines.append(watch_state['FirstEvent'] + max_batch_delay_seconds)
+                timeout = max(min(deadlines) - now, 0.0)
+                if watcher is not None:
+                    self._record_watch_events(watcher=watcher, events=_inotify_read_events(watcher=watcher, timeout=timeout), watch_state=watch_state)
+                else:
+                    time.sleep(timeout)
+                    if time.monotonic() - last_poll >= poll_interval_seconds:
+                        last_poll = time.monotonic()
+                        current_snapshot = self._local_source_snapshot()
+                        changed_paths = [path for path, file_state in current_snapshot.items() if snapshot.get(path, None) != file_state] + [path for path in snapshot if path not in current_snapshot]
+                        snapshot = current_snapshot
+                        if len(changed_paths) > 0:
+                            watch_state['ChangedPaths'].update(changed_paths)
+                            if watch_state['FirstEvent'] is None:
+                                watch_state['FirstEvent'] = last_poll
+                            watch_state['LastEvent'] = last_poll
+
+                now = time.monotonic()
+                stopping = max_run_seconds > 0 and now - start_time >= max_run_seconds
+                if watch_state['FullSyncRequired'] is True or (full_sync_interval_seconds > 0 and now - last_full_sync >= full_sync_interval_seconds):
+                    self.log(message='Starting a full sync while watching for changes', level='info')
+                    for key in ('ChangedPaths', 'RemovedDirectories'):
+                        watch_state[key] = set()
+                    watch_state['FullSyncRequired'] = False
+                    watch_state['FirstEvent'] = None
+                    self._sync(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders)
+                    last_full_sync = time.monotonic()
+                    all_ok = variable_cache.get_value(variable_name='{}:SYNC_RESULT'.format(self._var_name(target_environment=target_environment)), value_if_expired=None, default_value_if_not_found=None, raise_exception_on_expired=False, raise_exception_on_not_found=False) == 'ALL_OK'
+                    continue
+                if watch_state['FirstEvent'] is not None and (stopping is True or now - watch_state['LastEvent'] >= debounce_seconds or now - watch_state['FirstEvent'] >= max_batch_delay_seconds):
+                    results = self._sync_watched_changes(changed_paths=watch_state['ChangedPaths'], removed_directories=watch_state['RemovedDirectories'], variable_cache=variable_cache, target_environment=target_environment)
+                    for key in ('ChangedPaths', 'RemovedDirectories'):
+                        watch_state[key] = set()
+                    watch_state['FirstEvent'] = None
+                    all_ok = all_ok and results['Failed'] == 0
+                    checksum_differences_detected = checksum_differences_detected or results['ChecksumDifferencesDetected']
+                    self._set_variables(all_ok=all_ok, checksum_differences_detected=checksum_differences_detected, variable_cache=variable_cache, target_environment=target_environment)
+                    if results['Halted'] is True:
+                        raise Exception('Failed to process S3 keys {} and "onError" was set to "{}"'.format(results['FailedKeys'], self.spec['onError'].lower()))
+                if stopping is True:
+                    self.log(message='Watch mode stopped after {} seconds'.format(max_run_seconds), level='info')
+                    return
+        except KeyboardInterrupt:
+            self.log(message='Watch mode interrupted - changes not yet synced will be synced during the next run', level='warning')
+        finally:
+            if watcher is not None:
+                _inotify_close(watcher=watcher)
+
+    def _get_additional_destinations(self)->list:
+        destinations = list()
+        if 'additionalDestinations' not in self.spec or self.spec['additionalDestinations'] is None:
+            return destinations
+        if isinstance(self.spec['additionalDestinations'], list) is False:
+            self.log(message='The "additionalDestinations" parameter must be a list - ignoring the additional destinations', level='warning')
+            return destinations
+        s3_buckets = [self.spec['s3Bucket'],]
+        for destination in self.spec['additionalDestinations']:
+            if isinstance(destination, dict) is False or 's3Bucket' not in destination:
+                self.log(message='Every "additionalDestinations" entry requires the "s3Bucket" parameter - ignoring the entry {}'.format(json.dumps(destination, default=str)), level='warning')
+                continue
+            if destination['s3Bucket'] in s3_buckets:
+                self.log(message='The S3 bucket "{}" is already a destination - ignoring the duplicate entry'.format(destination['s3Bucket']), level='warning')
+                continue
+            s3_buckets.append(destination['s3Bucket'])
+            aws_boto3_session = self.spec['awsBoto3Session']
+            if 'awsBoto3Session' in destination and destination['awsBoto3Session'] is not None:
+                aws_boto3_session = destination['awsBoto3Session']
+            destinations.append({'awsBoto3Session': aws_boto3_session, 's3Bucket': destination['s3Bucket']})
+        return destinations
+
+    def _run_copy(self, spec_updates: dict=None, staging_sub_directory: str=None):
+        # A shallow copy with its own spec and run state, used to process one destination or one shard
+        manifest = copy.copy(self)
+        manifest.spec = dict(self.spec)
+        if spec_updates is not None:
+            manifest.spec.update(spec_updates)
+        if 'localStagingDirectory' in self.spec and staging_sub_directory is not None:
+            # The sync journal and temporary files of every copy are kept in a separate directory
+            manifest.spec['localStagingDirectory'] = '{}{}{}'.format(
+                self.spec['localStagingDirectory'],
+                os.sep,
+                re.sub(r'[^A-Za-z0-9_.-]', '_', staging_sub_directory)
+            )
+        manifest.sync_plans = dict()
+        manifest.s3_clients = dict()
+        manifest.bucket_names = dict()
+        manifest.transfer_tuning = None
+        manifest.rate_limiting = None
+        manifest.sync_journal = None
+        manifest.remote_index = None
+        return manifest
+
+    def _destination_manifests(self)->list:
+        # A shallow copy per destination shares the local source memo and the transaction log, while the clients, rate
+        # limits, sync journal, remote index and results are kept per destination
+        destination_manifests = list()
+        for destination in [{'awsBoto3Session': self.spec['awsBoto3Session'], 's3Bucket': self.spec['s3Bucket']},] + self._get_additional_destinations():
+            destination_manifest = self._run_copy(spec_updates=destination, staging_sub_directory='destination-{}'.format(destination['s3Bucket']))
+            destination_manifest.destination = destination
+            destination_manifest._init_rate_limiting()
+            destination_manifests.append(destination_manifest)
+        return destination_manifests
+
+    def _prepare_local_source_memo(self, target_environment: str='default'):
+        # The local sources are scanned and hashed once, before the destinations are processed concurrently
+        if 'localStagingDirectory' in self.spec:
+            create_directory(path=self.spec['localStagingDirectory'])   # Also the parent of the destination staging directories
+        files = None
+        if self.local_source_memo is not None:
+            files = self.local_source_memo['Files']     # Already scanned by the shard coordinator
+        self.local_source_memo = {
+            'Lock': threading.Lock(),
+            'Files': files,
+            'Checksums': dict(),
+        }
+        checksum_cache = self._open_checksum_cache(target_environment=target_environment)
+        try:
+            local_files = self._get_all_local_files(target_environment=target_environment, checksum_cache=checksum_cache)
+        except:
+            self._close_checksum_cache(checksum_cache=checksum_cache, prune=False)
+            self.local_source_memo = None
+            raise
+        self._close_checksum_cache(checksum_cache=checksum_cache)
+        self.log(message='Scanned {} local files once for all destinations'.format(len(local_files)), level='info')
+
+    def _run_destinations(self, destination_manifests: list, function: callable)->dict:
+        # A failing destination does not stop the other destinations
+        destination_results = {
+            'Results': dict(),
+            'Failed': list(),
+        }
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(destination_manifests)) as executor:
+            futures = [(destination_manifest.destination['s3Bucket'], executor.submit(function, destination_manifest)) for destination_manifest in destination_manifests]
+            for s3_bucket, future in futures:
+                try:
+                    destination_results['Results'][s3_bucket] = future.result()
+                except:
+                    self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+                    self.log(message='Processing the destination S3 bucket "{}" failed'.format(s3_bucket), level='error')
+                    destination_results['Failed'].append(s3_bucket)
+        return destination_results
+
+    def _destinations_differ(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders())->bool:
+        self._prepare_local_source_memo(target_environment=target_environment)
+        try:
+            destination_results = self._run_destinations(
+                destination_manifests=self._destination_manifests(),
+                function=lambda destination_manifest: destination_manifest.implemented_manifest_differ_from_this_manifest(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders)
+            )
+        finally:
+            self.local_source_memo = None
+        if len(destination_results['Failed']) > 0:
+            raise Exception('Failed to compare the local sources with the destination S3 buckets {}'.format(destination_results['Failed']))
+        return True in destination_results['Results'].values()
 
+    def _sync_destination(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders()):
         if self._bucket_exists(variable_cache=variable_cache, target_environment=target_environment) is False:
             raise Exception('Bucket does not exist - cannot continue')
+        self._open_sync_journal(target_environment=target_environment)
+        sync_completed = False
+        try:
+            self._open_remote_index(variable_cache=variable_cache, target_environment=target_environment)
+            self._sync(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders)
+            sync_completed = True
+        finally:
+            self._close_remote_index(write=sync_completed, variable_cache=variable_cache, target_environment=target_environment)
+            self._close_sync_journal(completed=sync_completed, variable_cache=variable_cache, target_environment=target_environment)
+
+    def _sync_destinations(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders()):
+        if self._watch_enabled() is True:
+            self.log(message='Watching the local sources is not supported together with the "additionalDestinations" parameter - the sources are synchronized once', level='warning')
+        self._prepare_local_source_memo(target_environment=target_environment)
+        try:
+            destination_manifests = self._destination_manifests()
+            destination_results = self._run_destinations(
+                destination_manifests=destination_manifests,
+                function=lambda destination_manifest: destination_manifest._sync_destination(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders)
+            )
+        finally:
+            self.local_source_memo = None
+        all_ok = True
+        checksum_differences_detected = False
+        for destination_manifest in destination_manifests:
+            if destination_manifest.destination['s3Bucket'] in destination_results['Failed']:
+                destination_manifest._set_variables(all_ok=False, checksum_differences_detected=False, variable_cache=variable_cache, target_environment=target_environment)
+            destination_var_name = destination_manifest._var_name(target_environment=target_environment)
+            result_txt = variable_cache.get_value(variable_name='{}:SYNC_RESULT'.format(destination_var_name), value_if_expired=None, default_value_if_not_found=None, raise_exception_on_expired=False, raise_exception_on_not_found=False)
+            if result_txt != 'ALL_OK':
+                all_ok = False
+            if variable_cache.get_value(variable_name='{}:CHECKSUM_DIFFERENCES_DETECTED'.format(destination_var_name), value_if_expired=None, default_value_if_not_found=None, raise_exception_on_expired=False, raise_exception_on_not_found=False) is True:
+                checksum_differences_detected = True
+            self.log(message='    Destination S3 bucket "{}" sync result: {}'.format(destination_manifest.destination['s3Bucket'], result_txt), level='info')
+        self._set_variables(all_ok=all_ok, checksum_differences_detected=checksum_differences_detected, variable_cache=variable_cache, target_environment=target_environment)
+        if len(destination_results['Failed']) > 0:
+            raise Exception('Failed to synchronize the destination S3 buckets {}'.format(destination_results['Failed']))
 
-        if self.implemented_manifest_differ_from_this_manifest(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders) is False:
-            self.log(message='    Bucket "{}" in environment "{}" already appears to be synchronized'.format(self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment), target_environment), level='info')
-            self._set_variables(all_ok=True, checksum_differences_detected=False, variable_cache=variable_cache, target_environment=target_environment)
+    def _key_in_shard(self, key: str)->bool:
+        if self.shard is None:
+            return True
+        return _key_shard(key=key, shard_count=self.shard['Count']) == self.shard['Index']
+
+    def _get_shard_count(self)->int:
+        shard_count = 1
+        if 'sharding' in self.spec:
+            if isinstance(self.spec['sharding'], dict):
+                if 'shardCount' in self.spec['sharding'] and self.spec['sharding']['shardCount'] is not None:
+                    try:
+                        if int(self.spec['sharding']['shardCount']) > 0:
+                            shard_count = int(self.spec['sharding']['shardCount'])
+                        else:
+                            self.log(message='The "sharding.shardCount" parameter must be a positive number - using the default value of {}'.format(shard_count), level='warning')
+                    except:
+                        self.log(message='The "sharding.shardCount" parameter value "{}" is not a number - using the default value of {}'.format(self.spec['sharding']['shardCount'], shard_count), level='warning')
+        return shard_count
+
+    def _get_shard_indexes(self, shard_count: int)->list:
+        # By default (or with an empty list) all shards are processed by this host
+        shard_indexes = list(range(shard_count))
+        if isinstance(self.spec['sharding'], dict) and 'shardIndexes' in self.spec['sharding'] and self.spec['sharding']['shardIndexes'] is not None:
+            if self.spec['sharding']['shardIndexes'] == list():
+                return shard_indexes
+            try:
+                selected_shard_indexes = sorted(set([int(shard_index) for shard_index in self.spec['sharding']['shardIndexes']]))
+                if len(selected_shard_indexes) > 0 and selected_shard_indexes[0] >= 0 and selected_shard_indexes[-1] < shard_count:
+                    return selected_shard_indexes
+            except:
+                pass
+            self.log(message='The "sharding.shardIndexes" parameter must be a list of shard numbers from 0 to {} - processing all shards'.format(shard_count - 1), level='warning')
+        return shard_indexes
+
+    def _get_shard_workers(self, shard_indexes: list)->int:
+        shard_workers = len(shard_indexes)
+        if isinstance(self.spec['sharding'], dict) and 'maxWorkers' in self.spec['sharding'] and self.spec['sharding']['maxWorkers'] is not None:
+            try:
+                if int(self.spec['sharding']['maxWorkers']) == 0:
+                    return shard_workers
+                if int(self.spec['sharding']['maxWorkers']) > 0:
+                    return min(int(self.spec['sharding']['maxWorkers']), shard_workers)
+            except:
+                pass
+            self.log(message='The "sharding.maxWorkers" parameter must be a positive number - using the default value of {}'.format(shard_workers), level='warning')
+        return shard_workers
+
+    def _result_variable_names(self, target_environment: str='default')->list:
+        var_names = [self._var_name(target_environment=target_environment),]
+        if len(self._get_additional_destinations()) > 0:
+            for s3_bucket in [self.spec['s3Bucket'],] + [destination['s3Bucket'] for destination in self._get_additional_destinations()]:
+                var_names.append('{}:{}'.format(var_names[0], s3_bucket))
+        variable_names = list()
+        for var_name in var_names:
+            for suffix in ('SYNC_RESULT', 'CHECKSUM_DIFFERENCES_DETECTED', 'FILES_TO_TRANSFER', 'FILES_TO_DELETE'):
+                variable_names.append('{}:{}'.format(var_name, suffix))
+        return variable_names
+
+    def _run_shard_worker(self, shard_index: int, shard_count: int, function: callable, variable_cache: VariableCache=VariableCache(), target_environment: str='default', result_connection: object=None)->dict:
+        # Runs in a forked worker process, which sends the result to the coordinator before it exits
+        shard_result = {
+            'ShardIndex': shard_index,
+            'Result': None,
+            'Failed': False,
+            'Variables': dict(),
+        }
+        spec_updates = dict()
+        if 'transferLogFile' in self.spec:
+            # Every shard writes its own transaction log, which the coordinator appends to the transaction log once all shards completed
+            spec_updates['transferLogFile'] = self._shard_transaction_log_file(shard_index=shard_index, shard_count=shard_count)
+        shard_manifest = self._run_copy(spec_updates=spec_updates, staging_sub_directory='shard-{}-of-{}'.format(shard_index, shard_count))
+        shard_manifest.shard = {'Index': shard_index, 'Count': shard_count}
+        variable_names = shard_manifest._result_variable_names(target_environment=target_environment)
+        for variable_name in variable_names:
+            variable_cache.delete_variable(variable_name=variable_name)
+        try:
+            shard_result['Result'] = function(shard_manifest)
+        except:
+            shard_manifest.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            shard_result['Failed'] = True
+        for variable_name in variable_names:
+            value = variable_cache.get_value(variable_name=variable_name, value_if_expired=None, default_value_if_not_found=None, raise_exception_on_expired=False, raise_exception_on_not_found=False)
+            if value is not None:
+                shard_result['Variables'][variable_name] = value
+        if result_connection is not None:
+            result_connection.send(shard_result)
+            result_connection.close()
+        return shard_result
+
+    def _run_shards(self, function: callable, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->dict:
+        # The coordinator scans the local sources once. Every shard runs in a forked worker process that inherits the list
+        # of files, and processes only the local files and remote keys of which the key falls in the hash range of the shard.
+        shard_count = self._get_shard_count()
+        shard_indexes = self._get_shard_indexes(shard_count=shard_count)
+        shard_workers = self._get_shard_workers(shard_indexes=shard_indexes)
+        if self._watch_enabled() is True:
+            self.log(message='Watching the local sources is not supported together with the "sharding" parameter - the sources are synchronized once', level='warning')
+        if 'localStagingDirectory' in self.spec:
+            create_directory(path=self.spec['localStagingDirectory'])   # Also the parent of the shard staging directories
+        self.local_source_memo = {
+            'Lock': threading.Lock(),
+            'Files': list(self._scan_local_source_files()),
+            'Checksums': dict(),
+        }
+        self.log(message='Processing shards {} of {} shards using {} worker processes for {} local files'.format(shard_indexes, shard_count, shard_workers, len(self.local_source_memo['Files'])), level='info')
+        shard_results = dict()
+        try:
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                self.log(message='Worker processes can not be forked on this platform - the shards are processed one after the other', level='warning')
+                for shard_index in shard_indexes:
+                    shard_results[shard_index] = self._run_shard_worker(shard_index=shard_index, shard_count=shard_count, function=function, variable_cache=variable_cache, target_environment=target_environment)
+                return shard_results
+            context = multiprocessing.get_context('fork')
+            pending_shard_indexes = list(shard_indexes)
+            running_workers = dict()
+            while len(pending_shard_indexes) > 0 or len(running_workers) > 0:
+                while len(pending_shard_indexes) > 0 and len(running_workers) < shard_workers:
+                    shard_index = pending_shard_indexes.pop(0)
+                    receive_connection, send_connection = context.Pipe(duplex=False)
+                    process = context.Process(
+                        target=self._run_shard_worker,
+                        kwargs={'shard_index': shard_index, 'shard_count': shard_count, 'function': function, 'variable_cache': variable_cache, 'target_environment': target_environment, 'result_connection': send_connection}
+                    )
+                    process.start()
+                    send_connection.close()
+                    running_workers[shard_index] = (process, receive_connection)
+                # A connection is also ready when the worker process exited without sending a result
+                ready_connections = multiprocessing.connection.wait([receive_connection for process, receive_connection in running_workers.values()])
+                for shard_index, (process, receive_connection) in list(running_workers.items()):
+                    if receive_connection not in ready_connections:
+                        continue
+                    try:
+                        shard_results[shard_index] = receive_connection.recv()
+                    except EOFError:
+                        shard_results[shard_index] = {'ShardIndex': shard_index, 'Result': None, 'Failed': True, 'Variables': dict()}
+                    receive_connection.close()
+                    process.join()
+                    if process.exitcode != 0:
+                        self.log(message='The worker process of shard {} exited with code {}'.format(shard_index, process.exitcode), level='error')
+                        shard_results[shard_index]['Failed'] = True
+                    running_workers.pop(shard_index)
+        finally:
+            self.local_source_memo = None
+            self._merge_shard_transaction_logs(shard_indexes=shard_indexes, shard_count=shard_count)
+        return shard_results
+
+    def _shard_transaction_log_file(self, shard_index: int, shard_count: int)->str:
+        return '{}.shard-{}-of-{}'.format(self.spec['transferLogFile'], shard_index, shard_count)
+
+    def _merge_shard_transaction_logs(self, shard_indexes: list, shard_count: int):
+        if 'transferLogFile' not in self.spec:
             return
+        for shard_index in shard_indexes:
+            shard_log_file = self._shard_transaction_log_file(shard_index=shard_index, shard_count=shard_count)
+            if os.path.isfile(shard_log_file) is False:
+                continue
+            try:
+                with open(shard_log_file, 'r', encoding='utf-8') as source_file:
+                    with open(self.spec['transferLogFile'], 'a', encoding='utf-8') as f:
+                        shutil.copyfileobj(source_file, f)
+                os.remove(shard_log_file)
+            except:
+                self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+                self.log(message='Failed to append the transaction log of shard {} to log file "{}" - the shard log file "{}" is kept'.format(shard_index, self.spec['transferLogFile'], shard_log_file), level='warning')
 
-        files_to_transfer = variable_cache.get_value(
-            variable_name='{}:FILES_TO_TRANSFER'.format(self._var_name),
-            value_if_expired=dict(),
-            default_value_if_not_found=dict(),
-            raise_exception_on_expired=False,
-            raise_exception_on_not_found=False
-        )
-        files_to_delete = variable_cache.get_value(
-            variable_name='{}:FILES_TO_DELETE'.format(self._var_name),
-            value_if_expired=dict(),
-            default_value_if_not_found=dict(),
-            raise_exception_on_expired=False,
-            raise_exception_on_not_found=False
+    def _store_shard_variables(self, shard_results: dict, variable_cache: VariableCache=VariableCache()):
+        # The variables of all shards are combined as if a single process did the sync
+        variables = dict()
+        for shard_index in sorted(shard_results.keys()):
+            for variable_name, value in shard_results[shard_index]['Variables'].items():
+                if variable_name.endswith(':SYNC_RESULT'):
+                    variables[variable_name] = 'ALL_OK' if variables.get(variable_name, 'ALL_OK') == 'ALL_OK' and value == 'ALL_OK' else 'NOT_OK'
+                elif variable_name.endswith(':CHECKSUM_DIFFERENCES_DETECTED'):
+                    variables[variable_name] = variables.get(variable_name, False) is True or value is True
+                else:
+                    variables[variable_name] = variables.get(variable_name, 0) + value
+        for variable_name, value in variables.items():
+            variable_cache.store_variable(
+                variable=Variable(
+                    name=variable_name,
+                    initial_value=value,
+                    logger=self.logger
+                ),
+                overwrite_existing=True
+            )
+
+    def _shards_differ(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders())->bool:
+        shard_results = self._run_shards(
+            function=lambda shard_manifest: shard_manifest.implemented_manifest_differ_from_this_manifest(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders),
+            variable_cache=variable_cache,
+            target_environment=target_environment
         )
+        self._store_shard_variables(shard_results=shard_results, variable_cache=variable_cache)
+        failed_shard_indexes = [shard_index for shard_index, shard_result in shard_results.items() if shard_result['Failed'] is True]
+        if len(failed_shard_indexes) > 0:
+            raise Exception('Failed to compare the local sources with the S3 bucket for shards {}'.format(failed_shard_indexes))
+        return True in [shard_result['Result'] for shard_result in shard_results.values()]
 
-        for local_key, local_key_data in files_to_transfer.items():
-            self._upload_local_file(
-                local_file_path=local_key_data['LocalFullPath'],
-                target_key=local_key_data['Key'],
-                variable_cache=variable_cache,
-                target_environment=target_environment
-            )
-        for remote_key, remote_key_data in files_to_delete.items():
-            self._delete_s3_key(
-                key=remote_key_data['Key'],
+    def _sync_shards(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders()):
+        shard_results = self._run_shards(
+            function=lambda shard_manifest: shard_manifest.apply_manifest(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders),
+            variable_cache=variable_cache,
+            target_environment=target_environment
+        )
+        self._store_shard_variables(shard_results=shard_results, variable_cache=variable_cache)
+        failed_shard_indexes = list()
+        for shard_index in sorted(shard_results.keys()):
+            shard_result = shard_results[shard_index]
+            result_txt = shard_result['Variables'].get('{}:SYNC_RESULT'.format(self._var_name(target_environment=target_environment)), 'NOT_OK')
+            if shard_result['Failed'] is True:
+                failed_shard_indexes.append(shard_index)
+                result_txt = 'NOT_OK'
+            self.log(message='    Shard {} sync result: {}'.format(shard_index, result_txt), level='info')
+        if len(failed_shard_indexes) > 0:
+            self._set_variables(
+                all_ok=False,
+                checksum_differences_detected=variable_cache.get_value(variable_name='{}:CHECKSUM_DIFFERENCES_DETECTED'.format(self._var_name(target_environment=target_environment)), value_if_expired=False, default_value_if_not_found=False, raise_exception_on_expired=False, raise_exception_on_not_found=False),
                 variable_cache=variable_cache,
                 target_environment=target_environment
             )
+            raise Exception('Failed to synchronize shards {}'.format(failed_shard_indexes))
+
+    def _sync(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders()):
+        if self._get_sync_mode() == 'streaming':
+            if self.sync_journal is not None and self.sync_journal['Resumed'] is True:
+                self._abort_orphaned_multipart_uploads(variable_cache=variable_cache, target_environment=target_environment)
+            self._init_transfer_tuning()
+            results = self._run_streaming_sync(variable_cache=variable_cache, target_environment=target_environment)
+            self._set_variables(all_ok=(results['Failed'] == 0), checksum_differences_detected=results['ChecksumDifferencesDetected'], variable_cache=variable_cache, target_environment=target_environment)
+            if results['Halted'] is True:
+                raise Exception('Failed to process S3 keys {} and "onError" was set to "{}"'.format(results['FailedKeys'], self.spec['onError'].lower()))
+            return
+
+        sync_plan = self._journal_load_sync_plan()
+        if sync_plan is not None:
+            self._abort_orphaned_multipart_uploads(resumable_keys=set(sync_plan['Keys']), variable_cache=variable_cache, target_environment=target_environment)
+        else:
+            if self.sync_journal is not None and self.sync_journal['Resumed'] is True:
+                self._abort_orphaned_multipart_uploads(resumable_keys=set(), variable_cache=variable_cache, target_environment=target_environment)
+            if self.implemented_manifest_differ_from_this_manifest(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders) is False:
+                self.log(message='    Bucket "{}" in environment "{}" already appears to be synchronized'.format(self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment), target_environment), level='info')
+                self._set_variables(all_ok=True, checksum_differences_detected=False, variable_cache=variable_cache, target_environment=target_environment)
+                return
+            sync_plan = self.sync_plans.pop(target_environment, _new_sync_plan())
+            if self._server_side_copy_enabled() is True:
+                client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+                bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+                remote_keys = itertools.chain(
+                    ({'Key': key, 'Size': size, 'ContentChecksumSha256': content_checksum_sha256} for key, size, content_checksum_sha256 in sync_plan['CopySourceCandidates']),
+                    *[self._iterate_s3_keys_below(key_prefix=source_prefix, client=client, bucket_name=bucket_name, use_remote_index=False) for source_prefix in self._get_server_side_copy_source_prefixes()]
+                )
+                self._plan_server_side_copies(sync_plan=sync_plan, remote_keys=remote_keys, variable_cache=variable_cache, target_environment=target_environment)
+            sync_plan['CopySourceCandidates'].clear()
+            self._journal_store_sync_plan(sync_plan=sync_plan)
+
+        self._init_transfer_tuning(file_sizes=sync_plan['Sizes'])
+        results = self._run_copy_and_transfer_jobs(sync_plan=sync_plan, delete_keys=sync_plan['DeleteKeys'], variable_cache=variable_cache, target_environment=target_environment)
+
+        checksum_differences_detected = _sync_plan_checksum_differences_detected(sync_plan=sync_plan)
+        self._set_variables(all_ok=(results['Failed'] == 0), checksum_differences_detected=checksum_differences_detected, variable_cache=variable_cache, target_environment=target_environment)
+        if results['Halted'] is True:
+            raise Exception('Failed to process S3 keys {} and "onError" was set to "{}"'.format(results['FailedKeys'], self.spec['onError'].lower()))
 
         return
 
-    def delete_manifest(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), increment_exec_counter: bool=False, target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders()):
+    def apply_manifest(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), increment_exec_counter: bool=False, target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders()):
         if target_environment not in self.metadata['environments']:
             self.log(message='Target environment "{}" not relevant for this manifest'.format(target_environment), level='warning')
             return
+        self.log(message='APPLY CALLED', level='info')
+        if self.shard is None and self._get_shard_count() > 1:
+            self._sync_shards(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders)
+            return
+        self._reset_run_cache()
+        self._init_rate_limiting()
+
+        if len(self._get_additional_destinations()) > 0:
+            self._open_transaction_log()
+            try:
+                self._sync_destinations(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders)
+            finally:
+                self._close_transaction_log()
+            return
+
+        if self._bucket_exists(variable_cache=variable_cache, target_environment=target_environment) is False:
+            raise Exception('Bucket does not exist - cannot continue')
+
+        self._open_transaction_log()
+        self._open_sync_journal(target_environment=target_environment)
+        sync_completed = False
+        try:
+            self._open_remote_index(variable_cache=variable_cache, target_environment=target_environment)
+            self._sync(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders)
+            if self._watch_enabled() is True:
+                # The initial sync is done, and the small batches synced while watching do not need to be resumable
+                self._close_sync_journal(completed=True, variable_cache=variable_cache, target_environment=target_environment)
+                self._watch_local_sources(manifest_lookup_function=manifest_lookup_function, variable_cache=variable_cache, target_environment=target_environment, value_placeholders=value_placeholders)
+            sync_completed = True
+        finally:
+            self._close_remote_index(write=sync_completed, variable_cache=variable_cache, target_environment=target_environment)
+            self._close_sync_journal(completed=sync_completed, variable_cache=variable_cache, target_environment=target_environment)
+            self._close_transaction_log()
+        return
+
+    def _delete_remote_keys(self, variable_cache: VariableCache=VariableCache(), target_environment: str='default'):
         if self._bucket_exists(variable_cache=variable_cache, target_environment=target_environment) is False:
             self.log(message='Bucket already deleted', level='warning')
-        s3_keys = self._get_all_s3_keys(variable_cache=variable_cache, target_environment=target_environment)
-        for key_hash, key_data in s3_keys.items():
-            self._delete_s3_key(key=key_data['Key'], variable_cache=variable_cache, target_environment=target_environment)
-            self.log(message='   Deleted known S3 key "{}"'.format(key_data['Key']), level='info')
-        # TODO Delete temporary files
-        # TODO Delete temporary work directories
+        keys = (key_data['Key'] for key_data in self._iterate_s3_keys(variable_cache=variable_cache, target_environment=target_environment, use_remote_index=False))
+        if self._remote_index_enabled() is True:
+            # Also the remote indexes written by the shards of a sharded sync
+            index_keys = set([self._remote_index_key(),])
+            try:
+                for key_data in self._iterate_s3_keys_below(
+                    key_prefix='{}.animus-index.'.format(self._get_s3_key_prefix()),
+                    client=self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment),
+                    bucket_name=self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment),
+                    use_remote_index=False
+                ):
+                    if self._is_remote_index_key(key=key_data['Key']) is True:
+                        index_keys.add(key_data['Key'])
+            except:
+                self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            keys = itertools.chain(keys, sorted(index_keys))
+        results = self._run_transfer_jobs(jobs=self._delete_jobs(keys=keys), variable_cache=variable_cache, target_environment=target_environment)
+        self.log(message='   Deleted {} known S3 keys ({} failed)'.format(results['Succeeded'], results['Failed']), level='info')
+        if results['Halted'] is True:
+            raise Exception('Failed to delete S3 keys {} and "onError" was set to "{}"'.format(results['FailedKeys'], self.spec['onError'].lower()))
+
+    def delete_manifest(self, manifest_lookup_function: object=dummy_manifest_lookup_function, variable_cache: VariableCache=VariableCache(), increment_exec_counter: bool=False, target_environment: str='default', value_placeholders: ValuePlaceHolders=ValuePlaceHolders()):
+        if target_environment not in self.metadata['environments']:
+            self.log(message='Target environment "{}" not relevant for this manifest'.format(target_environment), level='warning')
+            return
+        self._reset_run_cache()
+        self._init_rate_limiting()
+        self._open_transaction_log()
+        try:
+            if len(self._get_additional_destinations()) > 0:
+                destination_results = self._run_destinations(
+                    destination_manifests=self._destination_manifests(),
+                    function=lambda destination_manifest: destination_manifest._delete_remote_keys(variable_cache=variable_cache, target_environment=target_environment)
+                )
+                if len(destination_results['Failed']) > 0:
+                    raise Exception('Failed to delete the S3 keys of the destination S3 buckets {}'.format(destination_results['Failed']))
+            else:
+                self._delete_remote_keys(variable_cache=variable_cache, target_environment=target_environment)
+        finally:
+            self._close_transaction_log()
+        self._delete_local_state(target_environment=target_environment)
         self.log(message='DELETE CALLED', level='info')
         return
+
+    def _delete_local_state(self, target_environment: str='default'):
+        # The checksum cache, the sync journal and the bundles are kept in the staging directory between runs, and are of no use once
+        # the S3 keys were deleted. The destinations and shards keep their own files in sub-directories of the staging directory. The
+        # temporary work files of a run are already deleted when the run completes, and the transaction log is kept.
+        if 'localStagingDirectory' not in self.spec:
+            return
+        staging_directory = self.spec['localStagingDirectory']
+        if os.path.isdir(staging_directory) is False:
+            return
+        state_name = re.sub(r'[^A-Za-z0-9_.-]', '_', '{}-{}'.format(self.metadata['name'], target_environment))
+        state_file_names = list()
+        for file_name in ('animus-checksum-cache-{}.sqlite'.format(state_name), 'animus-sync-journal-{}.sqlite'.format(state_name)):
+            state_file_names += ['{}{}'.format(file_name, suffix) for suffix in ('', '-wal', '-shm')]
+        state_file_names.append(os.path.basename(self._bundle_directory()))
+        try:
+            directories = [staging_directory,]
+            for entry in os.scandir(staging_directory):
+                if entry.is_dir() is True and re.fullmatch(r'destination-.+|shard-[0-9]+-of-[0-9]+', entry.name) is not None:
+                    directories.append(entry.path)
+            for directory in directories:
+                for file_name in state_file_names:
+                    file_path = '{}{}{}'.format(directory, os.sep, file_name)
+                    if os.path.exists(file_path) is True:
+                        delete_directory(dir=file_path)
+                        self.log(message='Deleted the local state "{}"'.format(file_path), level='info')
+                if directory != staging_directory and len(os.listdir(directory)) == 0:
+                    os.rmdir(directory)
+        except:
+            self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+            self.log(message='The local state in the staging directory "{}" could not be deleted'.format(staging_directory), level='warning')
+
+    def extract_bundled_files(self, target_directory: str, keys: list=None, variable_cache: VariableCache=VariableCache(), target_environment: str='default')->dict:
+        # For consumers that need individual files of a bundled sync: the selected files (by default all bundled files) are
+        # written to the target directory, using the key relative to the destinationDirectory as path. Complete bundles are
+        # read in one request, while single files are read with a ranged request using the offset in the bundle index.
+        # Returns the local file path of every extracted key.
+        self._reset_run_cache()
+        client = self._get_boto3_s3_client(variable_cache=variable_cache, target_environment=target_environment)
+        bucket_name = self._get_bucket_name(variable_cache=variable_cache, target_environment=target_environment)
+        prefix = self._get_s3_key_prefix()
+        index_lines = gzip.decompress(client.get_object(Bucket=bucket_name, Key=self._bundle_index_key())['Body'].read()).decode('utf-8').splitlines()
+        header = json.loads(index_lines[0])
+        if header.get('Version', None) != 1 or header.get('Prefix', None) != prefix:
+            raise Exception('The bundle index at S3 key "s3://{}/{}" is not compatible with this manifest'.format(bucket_name, self._bundle_index_key()))
+        bundle_member_counts = collections.Counter()
+        members_by_bundle = collections.defaultdict(list)
+        selected_keys = None
+        if keys is not None:
+            selected_keys = set(keys)
+        for line in index_lines[1:]:
+            index_entry = json.loads(line)
+            bundle_member_counts[index_entry['Bundle']] += 1
+            if selected_keys is None or index_entry['Key'] in selected_keys:
+                members_by_bundle[index_entry['Bundle']].append(index_entry)
+        if selected_keys is not None and len(selected_keys) > sum([len(members) for members in members_by_bundle.values()]):
+            self.log(message='Not all requested keys were found in the bundle index', level='warning')
+
+        base_directory = os.path.normpath(target_directory)
+        extracted = dict()
+        failed_keys = list()
+        results_lock = threading.Lock()
+
+        def write_member(index_entry: dict, data: bytes):
+            file_full_path = os.path.normpath('{}{}{}'.format(base_directory, os.sep, index_entry['Key'][len(prefix):]))
+            if file_full_path.startswith('{}{}'.format(base_directory, os.sep)) is False or len(data) != index_entry['Size'] or hashlib.sha256(data).hexdigest() != index_entry['ContentChecksumSha256']:
+                self.log(message='Bundled file "{}" in S3 key "s3://{}/{}" is not valid - the file is not extracted'.format(index_entry['Key'], bucket_name, index_entry['Bundle']), level='warning')
+                with results_lock:
+                    failed_keys.append(index_entry['Key'])
+                return
+            os.makedirs(os.path.dirname(file_full_path), exist_ok=True)
+            with open(file_full_path, 'wb') as f:
+                f.write(data)
+            with results_lock:
+                extracted[index_entry['Key']] = file_full_path
+
+        def extract_bundle(bundle_key: str):
+            members = sorted(members_by_bundle[bundle_key], key=lambda index_entry: index_entry['Offset'])
+            try:
+                if len(members) == bundle_member_counts[bundle_key]:
+                    body = client.get_object(Bucket=bucket_name, Key=bundle_key)['Body']
+                    position = 0
+                    for index_entry in members:
+                        body.read(index_entry['Offset'] - position)     # The tar headers
+                        write_member(index_entry=index_entry, data=body.read(index_entry['Size']))
+                        position = index_entry['Offset'] + index_entry['Size']
+                    body.close()
+                    return
+                for index_entry in members:
+                    data = b''
+                    if index_entry['Size'] > 0:
+                        data = client.get_object(Bucket=bucket_name, Key=bundle_key, Range='bytes={}-{}'.format(index_entry['Offset'], index_entry['Offset'] + index_entry['Size'] - 1))['Body'].read()
+                    write_member(index_entry=index_entry, data=data)
+            except:
+                self.log(message='EXCEPTION: {}'.format(traceback.format_exc()), level='error')
+                with results_lock:
+                    failed_keys.extend([index_entry['Key'] for index_entry in members if index_entry['Key'] not in extracted])
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._get_max_concurrency()) as executor:
+            list(executor.map(extract_bundle, sorted(members_by_bundle.keys())))
+        self.log(message='Extracted {} bundled files to "{}" ({} failed)'.format(len(extracted), base_directory, len(failed_keys)), level='info')
+        if len(failed_keys) > 0 and self._halt_on_error() is True:
+            raise Exception('Failed to extract bundled files {} and "onError" was set to "{}"'.format(sorted(failed_keys), self.spec['onError'].lower()))
+        return extracted
@@ -0,0 +1,134 @@
+import importlib
+import logging
+import os
+import sys
+
+import pytest
+
+try:
+    import boto3
+    from moto import mock_aws
+    from py_animus.manifest_management import VariableCache, Variable
+except ImportError:
+    # The tests that need these packages are skipped by their fixtures (see tests/requirements.txt)
+    boto3 = mock_aws = VariableCache = Variable = None
+
+
+IMPLEMENTATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'implementations')
+BUCKET_NAME = 'animus-test-bucket'
+
+
+def load_implementation(file_name: str):
+    # Loaded the way py-animus loads the implementations, so that spawned worker processes can import the module again
+    if IMPLEMENTATIONS_DIRECTORY not in sys.path:
+        sys.path.insert(0, IMPLEMENTATIONS_DIRECTORY)
+    return importlib.import_module(file_name)
+
+
+def require_test_packages():
+    for module_name in ('boto3', 'moto', 'py_animus'):
+        pytest.importorskip(module_name)
+
+
+@pytest.fixture(scope='session')
+def s3_files_module():
+    require_test_packages()
+    return load_implementation(file_name='aws-boto3-s3-files-v1')
+
+
+@pytest.fixture(scope='session')
+def s3_bucket_module():
+    require_test_packages()
+    return load_implementation(file_name='aws-boto3-s3-bucket-v1')
+
+
+@pytest.fixture
+def aws_environment(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    for name in ('AWS_PROFILE', 'AWS_SESSION_TOKEN', 'AWS_ENDPOINT_URL', 'AWS_ENDPOINT_URL_S3'):
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def s3_client(aws_environment):
+    require_test_packages()
+    with mock_aws():
+        client = boto3.Session(region_name='us-east-1').client('s3')
+        client.create_bucket(Bucket=BUCKET_NAME)
+        yield client
+
+
+def new_variable_cache(bucket_name: str=BUCKET_NAME)->VariableCache:
+    # The variables normally set by the AwsBoto3Session and AwsBoto3S3Bucket manifests
+    variable_cache = VariableCache()
+    variable_cache.store_variable(Variable(name='AwsBoto3Session:test-session:default:CONNECTED', initial_value=True))
+    variable_cache.store_variable(Variable(name='AwsBoto3Session:test-session:default:SESSION', initial_value=boto3.Session(region_name='us-east-1')))
+    variable_cache.store_variable(Variable(name='AwsBoto3S3Bucket:test-bucket:default:NAME', initial_value=bucket_name))
+    return variable_cache
+
+
+def new_spec(source_directory: str, staging_directory: str, **spec_updates)->dict:
+    spec = {
+        'awsBoto3Session': 'test-session',
+        's3Bucket': 'test-bucket',
+        'localStagingDirectory': staging_directory,
+        'onError': 'warn',
+        'actionExtraFilesOnS3': 'delete',
+        'ifFileExists': {'overWrite': False},
+        'sources': [
+            {'sourceType': 'localDirectories', 'baseDirectory': source_directory, 'recurse': True, 'verifyChecksums': True},
+        ],
+    }
+    spec.update(spec_updates)
+    return spec
+
+
+def new_manifest(module: object, spec: dict):
+    manifest = module.AwsBoto3S3Files(logger=logging.getLogger('test'))
+    manifest.parse_manifest(manifest_data={'kind': 'AwsBoto3S3Files', 'version': 'v1', 'metadata': {'name': 'test-files', 'environments': ['default']}, 'spec': spec})
+    return manifest
+
+
+def write_source_tree(directory: str, directories: int=3, files_per_directory: int=10)->dict:
+    # Returns the content of every file by its S3 key
+    files = dict()
+    for directory_number in range(directories):
+        os.makedirs(os.path.join(directory, 'dir{}'.format(directory_number)), exist_ok=True)
+        for file_number in range(files_per_directory):
+            key = 'dir{}/file{}.txt'.format(directory_number, file_number)
+            files[key] = 'content {} {}\n'.format(key, 'x' * file_number * 100).encode('utf-8')
+            with open(os.path.join(directory, key), 'wb') as f:
+                f.write(files[key])
+    return files
+
+
+def list_keys(client: object, bucket_name: str=BUCKET_NAME)->list:
+    keys = list()
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket_name):
+        keys += [item['Key'] for item in page.get('Contents', list())]
+    return sorted(keys)
+
+
+def get_variable(variable_cache: VariableCache, name: str):
+    return variable_cache.get_value(variable_name='AwsBoto3S3Files:test-files:default:{}'.format(name), value_if_expired=None, default_value_if_not_found=None, raise_exception_on_expired=False, raise_exception_on_not_found=False)
+
+
+def count_s3_requests(manifest: object, counts: object, fail_operation: str=None):
+    # Counts the S3 API calls of the manifest by operation name and optionally makes one operation fail
+    original_get_boto3_s3_client = manifest._get_boto3_s3_client
+
+    def before_call(model, **kwargs):
+        counts.update([model.name])
+        if model.name == fail_operation:
+            raise Exception('Simulated {} failure'.format(fail_operation))
+
+    def get_boto3_s3_client(**kwargs):
+        client = original_get_boto3_s3_client(**kwargs)
+        if getattr(client, 'test_counted', False) is False:
+            client.meta.events.register('before-call.s3', before_call)
+            client.test_counted = True
+        return client
+
+    manifest._get_boto3_s3_client = get_boto3_s3_client
@@ -0,0 +1,101 @@
+import pytest
+
+from conftest import Variable, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+SECOND_BUCKET_NAME = 'animus-second-test-bucket'
+
+
+def _destinations_variable_cache(second_bucket_name: str=SECOND_BUCKET_NAME):
+    # The bucket name of the second destination, normally set by a second AwsBoto3S3Bucket manifest
+    variable_cache = new_variable_cache()
+    variable_cache.store_variable(Variable(name='AwsBoto3S3Bucket:second-bucket:default:NAME', initial_value=second_bucket_name))
+    return variable_cache
+
+
+@pytest.fixture
+def second_bucket(s3_client):
+    s3_client.create_bucket(Bucket=SECOND_BUCKET_NAME)
+    return SECOND_BUCKET_NAME
+
+
+@pytest.fixture
+def hashed_files(s3_files_module, monkeypatch):
+    hashed = list()
+    original_sha256_file = s3_files_module._sha256_file
+
+    def sha256_file(file_path: str, **kwargs)->str:
+        hashed.append(file_path)
+        return original_sha256_file(file_path=file_path, **kwargs)
+
+    monkeypatch.setattr(s3_files_module, '_sha256_file', sha256_file)
+    return hashed
+
+
+def _destinations_spec(tmp_path: object, **spec_updates)->dict:
+    return new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), additionalDestinations=[{'s3Bucket': 'second-bucket'},], **spec_updates)
+
+
+def test_files_are_synced_to_every_destination(s3_files_module, s3_client, second_bucket, tmp_path, hashed_files):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=2, files_per_directory=3)
+    s3_client.put_object(Bucket=second_bucket, Key='extra.txt', Body=b'extra')
+    spec = _destinations_spec(tmp_path=tmp_path)
+
+    variable_cache = _destinations_variable_cache()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=variable_cache) is True
+    assert get_variable(variable_cache=variable_cache, name='test-bucket:FILES_TO_TRANSFER') == len(files)
+    assert get_variable(variable_cache=variable_cache, name='second-bucket:FILES_TO_DELETE') == 1
+    assert len(hashed_files) == len(files)     # Hashed once for both destinations
+
+    manifest.apply_manifest(variable_cache=variable_cache)
+    assert len(hashed_files) == len(files)
+    assert list_keys(client=s3_client) == sorted(files.keys())
+    assert list_keys(client=s3_client, bucket_name=second_bucket) == sorted(files.keys())
+    for name in ('SYNC_RESULT', 'test-bucket:SYNC_RESULT', 'second-bucket:SYNC_RESULT'):
+        assert get_variable(variable_cache=variable_cache, name=name) == 'ALL_OK'
+    assert new_manifest(module=s3_files_module, spec=spec).implemented_manifest_differ_from_this_manifest(variable_cache=_destinations_variable_cache()) is False
+
+    s3_client.delete_object(Bucket=second_bucket, Key='dir1/file1.txt')
+    variable_cache = _destinations_variable_cache()
+    assert new_manifest(module=s3_files_module, spec=spec).implemented_manifest_differ_from_this_manifest(variable_cache=variable_cache) is True
+    assert get_variable(variable_cache=variable_cache, name='test-bucket:FILES_TO_TRANSFER') == 0
+    assert get_variable(variable_cache=variable_cache, name='second-bucket:FILES_TO_TRANSFER') == 1
+
+
+def test_a_failing_destination_does_not_stop_the_others(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    variable_cache = _destinations_variable_cache(second_bucket_name='animus-missing-test-bucket')
+    manifest = new_manifest(module=s3_files_module, spec=_destinations_spec(tmp_path=tmp_path))
+    with pytest.raises(Exception, match='second-bucket'):
+        manifest.apply_manifest(variable_cache=variable_cache)
+    assert list_keys(client=s3_client) == sorted(files.keys())
+    assert get_variable(variable_cache=variable_cache, name='test-bucket:SYNC_RESULT') == 'ALL_OK'
+    assert get_variable(variable_cache=variable_cache, name='second-bucket:SYNC_RESULT') == 'NOT_OK'
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'NOT_OK'
+
+
+def test_keys_are_deleted_from_every_destination(s3_files_module, s3_client, second_bucket, tmp_path):
+    write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    spec = _destinations_spec(tmp_path=tmp_path)
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=_destinations_variable_cache())
+    new_manifest(module=s3_files_module, spec=spec).delete_manifest(variable_cache=_destinations_variable_cache())
+    assert list_keys(client=s3_client) == list()
+    assert list_keys(client=s3_client, bucket_name=second_bucket) == list()
+
+
+def test_additional_destination_definitions(s3_files_module, tmp_path):
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), additionalDestinations=[
+        {'s3Bucket': 'second-bucket'},
+        {'s3Bucket': 'third-bucket', 'awsBoto3Session': 'other-session'},
+        {'s3Bucket': 'second-bucket'},
+        {'s3Bucket': 'test-bucket'},
+        {'awsBoto3Session': 'other-session'},
+        'fourth-bucket',
+    ])
+    assert new_manifest(module=s3_files_module, spec=spec)._get_additional_destinations() == [
+        {'awsBoto3Session': 'test-session', 's3Bucket': 'second-bucket'},
+        {'awsBoto3Session': 'other-session', 's3Bucket': 'third-bucket'},
+    ]
+    spec['additionalDestinations'] = 'second-bucket'
+    assert new_manifest(module=s3_files_module, spec=spec)._get_additional_destinations() == list()
@@ -0,0 +1,81 @@
+import collections
+import json
+
+from conftest import BUCKET_NAME, count_s3_requests, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+class FailingDeleteClient:
+    # Returns the per key errors of a DeleteObjects request, or fails the complete request
+
+    def __init__(self, errors: list=None, fail_request: bool=False):
+        self.errors = errors
+        self.fail_request = fail_request
+        self.requests = list()
+
+    def delete_objects(self, **parameters):
+        self.requests.append(parameters)
+        if self.fail_request is True:
+            raise Exception('Simulated connection failure')
+        response = dict()
+        if self.errors is not None:
+            response['Errors'] = self.errors
+        return response
+
+
+def _read_transaction_log(transfer_log_file: str)->dict:
+    with open(transfer_log_file, 'r') as f:
+        return {record['Key']: record['Result'] for record in [json.loads(line) for line in f.read().splitlines()]}
+
+
+def test_delete_jobs_hold_at_most_1000_keys(s3_files_module, tmp_path):
+    manifest = new_manifest(module=s3_files_module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging')))
+    jobs = list(manifest._delete_jobs(keys=('key{}'.format(idx) for idx in range(2500))))
+    assert [len(job['Keys']) for job in jobs] == [1000, 1000, 500]
+    assert [key for job in jobs for key in job['Keys']] == ['key{}'.format(idx) for idx in range(2500)]
+    assert list(manifest._delete_jobs(keys=iter(list()))) == list()
+
+
+def test_delete_manifest_deletes_in_batches(s3_files_module, s3_client, tmp_path):
+    for idx in range(2001):
+        s3_client.put_object(Bucket=BUCKET_NAME, Key='key{:04d}'.format(idx), Body=b'')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+    counts = collections.Counter()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    count_s3_requests(manifest=manifest, counts=counts)
+    manifest.delete_manifest(variable_cache=new_variable_cache())
+    assert counts['DeleteObjects'] == 3
+    assert counts['DeleteObject'] == 0
+    assert list_keys(client=s3_client) == list()
+
+
+def test_delete_errors_are_reported_per_key(s3_files_module, tmp_path):
+    transfer_log_file = str(tmp_path / 'transfer.log')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), transferLogFile=transfer_log_file, transferLogFormat='jsonl')
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    client = FailingDeleteClient(errors=[{'Key': 'b.txt', 'Code': 'AccessDenied', 'Message': 'Access Denied'},])
+    failed_keys = manifest._delete_s3_keys(keys=['a.txt', 'b.txt', 'c.txt'], client=client, bucket_name=BUCKET_NAME)
+    assert failed_keys == ['b.txt',]
+    assert client.requests == [{'Bucket': BUCKET_NAME, 'Delete': {'Objects': [{'Key': 'a.txt'}, {'Key': 'b.txt'}, {'Key': 'c.txt'}], 'Quiet': True}},]
+    assert _read_transaction_log(transfer_log_file=transfer_log_file) == {'a.txt': 'SUCCESS', 'b.txt': 'FAILED', 'c.txt': 'SUCCESS'}
+
+
+def test_failed_delete_request_fails_all_keys(s3_files_module, tmp_path):
+    transfer_log_file = str(tmp_path / 'transfer.log')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), transferLogFile=transfer_log_file, transferLogFormat='jsonl')
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    failed_keys = manifest._delete_s3_keys(keys=['a.txt', 'b.txt'], client=FailingDeleteClient(fail_request=True), bucket_name=BUCKET_NAME)
+    assert sorted(failed_keys) == ['a.txt', 'b.txt']
+    assert _read_transaction_log(transfer_log_file=transfer_log_file) == {'a.txt': 'FAILED', 'b.txt': 'FAILED'}
+
+
+def test_delete_errors_fail_the_sync(s3_files_module, s3_client, tmp_path):
+    write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=2)
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='extra1.txt', Body=b'extra')
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='extra2.txt', Body=b'extra')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    original_delete_s3_keys = manifest._delete_s3_keys
+    manifest._delete_s3_keys = lambda keys, **kwargs: original_delete_s3_keys(keys=keys, **dict(kwargs, client=FailingDeleteClient(errors=[{'Key': 'extra2.txt', 'Code': 'AccessDenied'},])))
+    variable_cache = new_variable_cache()
+    manifest.apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'NOT_OK'
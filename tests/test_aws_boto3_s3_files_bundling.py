@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from conftest import BUCKET_NAME, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+BUNDLE_INDEX_KEY = '.animus-bundles/index.jsonl.gz'
+
+
+def _bundle_etags(client: object)->dict:
+    return {key: client.head_object(Bucket=BUCKET_NAME, Key=key)['ETag'] for key in list_keys(client=client) if key.endswith('.tar')}
+
+
+@pytest.mark.parametrize('sync_mode', ['plan', 'streaming'])
+def test_bundled_files_are_extracted(s3_files_module, s3_client, tmp_path, sync_mode):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=3, files_per_directory=40)
+    with open(str(tmp_path / 'source' / 'large.bin'), 'wb') as f:
+        f.write(os.urandom(8192))
+    spec = new_spec(
+        source_directory=str(tmp_path / 'source'),
+        staging_directory=str(tmp_path / 'staging'),
+        syncMode=sync_mode,
+        bundling={'enabled': True, 'maximumFileSize': 4096, 'filesPerBundle': 10}
+    )
+    variable_cache = new_variable_cache()
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    bundle_etags = _bundle_etags(client=s3_client)
+    assert len(bundle_etags) > 1
+    assert list_keys(client=s3_client) == sorted(list(bundle_etags.keys()) + [BUNDLE_INDEX_KEY, 'large.bin'])
+
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    extracted_files = manifest.extract_bundled_files(target_directory=str(tmp_path / 'extracted'), variable_cache=new_variable_cache())
+    assert sorted(extracted_files.keys()) == sorted(files.keys())
+    for key, content in files.items():
+        with open(extracted_files[key], 'rb') as f:
+            assert f.read() == content
+
+    selected_keys = ['dir0/file0.txt', 'dir2/file39.txt']
+    extracted_files = manifest.extract_bundled_files(target_directory=str(tmp_path / 'selected'), keys=selected_keys, variable_cache=new_variable_cache())
+    assert sorted(extracted_files.keys()) == selected_keys
+    for key in selected_keys:
+        with open(extracted_files[key], 'rb') as f:
+            assert f.read() == files[key]
+
+    # Only the bundle with the changed file is uploaded again
+    assert new_manifest(module=s3_files_module, spec=spec).implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+    with open(str(tmp_path / 'source' / 'dir1' / 'file7.txt'), 'wb') as f:
+        f.write(b'changed')
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    changed_bundles = [key for key, etag in _bundle_etags(client=s3_client).items() if bundle_etags.get(key, None) != etag]
+    assert len(changed_bundles) == 1
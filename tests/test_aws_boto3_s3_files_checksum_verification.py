@@ -0,0 +1,64 @@
+import collections
+
+from conftest import BUCKET_NAME, count_s3_requests, new_variable_cache, new_spec, new_manifest, write_source_tree, get_variable
+
+
+def _counted_manifest(module: object, spec: dict, counts: object):
+    manifest = new_manifest(module=module, spec=spec)
+    count_s3_requests(manifest=manifest, counts=counts)
+    return manifest
+
+
+def test_recorded_checksums_are_verified_without_downloads(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=2, files_per_directory=3)
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    assert 'animus-sha256' in s3_client.head_object(Bucket=BUCKET_NAME, Key='dir0/file0.txt')['Metadata']
+
+    counts = collections.Counter()
+    assert _counted_manifest(module=s3_files_module, spec=spec, counts=counts).implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+    assert counts['HeadObject'] == len(files)
+    assert counts['GetObject'] == 0
+
+
+def test_recorded_checksum_mismatch_is_uploaded(s3_files_module, s3_client, tmp_path):
+    write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    with open(str(tmp_path / 'source' / 'dir0' / 'file1.txt'), 'r+b') as f:
+        f.write(b'C')    # Same size, different content
+
+    counts = collections.Counter()
+    variable_cache = new_variable_cache()
+    manifest = _counted_manifest(module=s3_files_module, spec=spec, counts=counts)
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=variable_cache) is True
+    assert get_variable(variable_cache=variable_cache, name='FILES_TO_TRANSFER') == 1
+    assert counts['GetObject'] == 0
+    manifest.apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='CHECKSUM_DIFFERENCES_DETECTED') is True
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir0/file1.txt')['Body'].read()[:1] == b'C'
+
+
+def test_s3_sha256_checksum_is_used_without_metadata(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=2)
+    for key, content in files.items():
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=content, ChecksumAlgorithm='SHA256')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+
+    counts = collections.Counter()
+    assert _counted_manifest(module=s3_files_module, spec=spec, counts=counts).implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+    assert counts['HeadObject'] == len(files)
+    assert counts['GetObject'] == 0
+
+
+def test_objects_without_a_recorded_checksum_are_downloaded(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=2)
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='dir0/file0.txt', Body=files['dir0/file0.txt'])
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='dir0/file1.txt', Body=files['dir0/file1.txt'].replace(b'content', b'CONTENT'))
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+
+    counts = collections.Counter()
+    variable_cache = new_variable_cache()
+    assert _counted_manifest(module=s3_files_module, spec=spec, counts=counts).implemented_manifest_differ_from_this_manifest(variable_cache=variable_cache) is True
+    assert get_variable(variable_cache=variable_cache, name='FILES_TO_TRANSFER') == 1
+    assert counts['GetObject'] == 2
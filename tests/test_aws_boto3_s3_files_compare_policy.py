@@ -0,0 +1,104 @@
+import collections
+import os
+import time
+
+import pytest
+
+from conftest import count_s3_requests, new_variable_cache, new_spec, new_manifest, write_source_tree, get_variable
+
+
+def _policy_spec(tmp_path: object, compare_policy: str)->dict:
+    return new_spec(
+        source_directory=str(tmp_path / 'source'),
+        staging_directory=str(tmp_path / 'staging'),
+        sources=[{'sourceType': 'localDirectories', 'baseDirectory': str(tmp_path / 'source'), 'recurse': True, 'comparePolicy': compare_policy},]
+    )
+
+
+def _files_to_transfer(module: object, spec: dict, counts: object)->int:
+    variable_cache = new_variable_cache()
+    manifest = new_manifest(module=module, spec=spec)
+    count_s3_requests(manifest=manifest, counts=counts)
+    manifest.implemented_manifest_differ_from_this_manifest(variable_cache=variable_cache)
+    return get_variable(variable_cache=variable_cache, name='FILES_TO_TRANSFER')
+
+
+def _change_file(file_path: str, content: bytes, mtime_offset: float=0.0):
+    file_stat = os.stat(file_path)
+    with open(file_path, 'wb') as f:
+        f.write(content)
+    os.utime(file_path, (file_stat.st_atime, file_stat.st_mtime + mtime_offset))
+
+
+@pytest.mark.parametrize('compare_policy, same_size_change, size_change, later_change', [
+    ('name', 0, 0, 0),
+    ('size', 0, 1, 0),
+    ('size+mtime', 0, 1, 1),
+    ('checksum', 1, 1, 1),
+])
+def test_compare_policies(s3_files_module, s3_client, tmp_path, compare_policy, same_size_change, size_change, later_change):
+    write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    spec = _policy_spec(tmp_path=tmp_path, compare_policy=compare_policy)
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    counts = collections.Counter()
+    assert _files_to_transfer(module=s3_files_module, spec=spec, counts=counts) == 0
+    if compare_policy != 'checksum':
+        assert counts['HeadObject'] == 0     # Only the checksum policy needs more than the listing
+        assert counts['GetObject'] == 0
+
+    file_path = str(tmp_path / 'source' / 'dir0' / 'file1.txt')
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    _change_file(file_path=file_path, content=content.upper(), mtime_offset=-3600.0)
+    assert _files_to_transfer(module=s3_files_module, spec=spec, counts=counts) == same_size_change
+    _change_file(file_path=file_path, content=content + b'more', mtime_offset=-3600.0)
+    assert _files_to_transfer(module=s3_files_module, spec=spec, counts=counts) == size_change
+    _change_file(file_path=file_path, content=content.upper(), mtime_offset=0.0)
+    os.utime(file_path, (time.time() + 3600.0, time.time() + 3600.0))
+    assert _files_to_transfer(module=s3_files_module, spec=spec, counts=counts) == later_change
+
+
+def test_modification_times_are_compared_with_the_remote_precision(s3_files_module, tmp_path):
+    manifest = new_manifest(module=s3_files_module, spec=_policy_spec(tmp_path=tmp_path, compare_policy='size+mtime'))
+    key_data = {'Key': 'file.txt', 'LocalFullPath': str(tmp_path / 'file.txt'), 'Size': 10, 'ModifiedTime': 1000.5, 'ComparePolicy': 'size+mtime'}
+    # A listing only has whole seconds, so a change within the upload second can not be told apart from the upload
+    assert manifest._local_file_needs_upload(key_data=dict(key_data), remote_key_data={'Key': 'file.txt', 'Size': 10, 'LastModified': 1000.0}) is False
+    assert manifest._local_file_needs_upload(key_data=dict(key_data), remote_key_data={'Key': 'file.txt', 'Size': 10, 'LastModified': 999.0}) is True
+    # The remote index records the upload time with fractions of a second
+    assert manifest._local_file_needs_upload(key_data=dict(key_data), remote_key_data={'Key': 'file.txt', 'Size': 10, 'LastModified': 1000.25}) is True
+    assert manifest._local_file_needs_upload(key_data=dict(key_data), remote_key_data={'Key': 'file.txt', 'Size': 10, 'LastModified': 1000.75}) is False
+
+
+def test_same_size_change_within_the_upload_second_with_remote_index(s3_files_module, s3_client, tmp_path):
+    write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    spec = _policy_spec(tmp_path=tmp_path, compare_policy='size+mtime')
+    spec['remoteIndex'] = True
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    manifest._open_remote_index(variable_cache=new_variable_cache(), seed_from_listing=False)
+    upload_time = manifest._remote_index_lookup(key='dir0/file1.txt')['LastModified']
+    manifest._close_remote_index(write=False)
+
+    # The file is rewritten with the same size in the second of its upload, but after the upload
+    file_path = str(tmp_path / 'source' / 'dir0' / 'file1.txt')
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    with open(file_path, 'wb') as f:
+        f.write(content.upper())
+    modified_time = min(upload_time + 0.001, int(upload_time) + 0.9999)
+    os.utime(file_path, (modified_time, modified_time))
+    assert _files_to_transfer(module=s3_files_module, spec=spec, counts=collections.Counter()) == 1
+
+
+@pytest.mark.parametrize('source_definition, expected_compare_policy', [
+    ({}, 'name'),
+    ({'verifyChecksums': False}, 'name'),
+    ({'verifyChecksums': True}, 'checksum'),
+    ({'comparePolicy': 'Size+MTime'}, 'size+mtime'),
+    ({'comparePolicy': 'size', 'verifyChecksums': True}, 'size'),
+    ({'comparePolicy': 'unknown', 'verifyChecksums': True}, 'checksum'),
+    ({'comparePolicy': 'unknown'}, 'name'),
+])
+def test_compare_policy_setting(s3_files_module, tmp_path, source_definition, expected_compare_policy):
+    manifest = new_manifest(module=s3_files_module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging')))
+    assert manifest._get_compare_policy(source_definition=source_definition) == expected_compare_policy
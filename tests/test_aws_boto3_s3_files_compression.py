@@ -0,0 +1,51 @@
+import gzip
+import hashlib
+import json
+import os
+
+import pytest
+
+from conftest import BUCKET_NAME, new_variable_cache, new_spec, new_manifest, list_keys, get_variable
+
+
+@pytest.mark.parametrize('sync_mode', ['plan', 'streaming'])
+def test_compressed_files_round_trip(s3_files_module, s3_client, tmp_path, sync_mode):
+    files = {
+        'data.json': json.dumps([{'item': idx} for idx in range(2000)]).encode('utf-8'),
+        'config/settings.yaml': b'key: value\n' * 500,
+        'small.json': b'{"a": 1}',
+        'random.json': os.urandom(50000),
+        'image.bin': b'x' * 100000,
+    }
+    for file_name, content in files.items():
+        os.makedirs(os.path.dirname(str(tmp_path / 'source' / file_name)), exist_ok=True)
+        with open(str(tmp_path / 'source' / file_name), 'wb') as f:
+            f.write(content)
+    spec = new_spec(
+        source_directory=str(tmp_path / 'source'),
+        staging_directory=str(tmp_path / 'staging'),
+        syncMode=sync_mode,
+        compression={'enabled': True, 'minimumSize': 1024}
+    )
+    variable_cache = new_variable_cache()
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert list_keys(client=s3_client) == sorted(files.keys())
+
+    content_encodings = dict()
+    for key, content in files.items():
+        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
+        body = response['Body'].read()
+        content_encodings[key] = response.get('ContentEncoding', None)
+        if content_encodings[key] == 'gzip':
+            assert len(body) < len(content)
+            body = gzip.decompress(body)
+        assert body == content
+        assert response['Metadata']['animus-sha256'] == hashlib.sha256(content).hexdigest()
+    # Too small, not matching the patterns, or not smaller when compressed
+    assert content_encodings == {'data.json': 'gzip', 'config/settings.yaml': 'gzip', 'small.json': None, 'random.json': None, 'image.bin': None}
+
+    assert new_manifest(module=s3_files_module, spec=spec).implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+    with open(str(tmp_path / 'source' / 'data.json'), 'ab') as f:
+        f.write(b' ')
+    assert new_manifest(module=s3_files_module, spec=spec).implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is True
@@ -0,0 +1,60 @@
+import collections
+
+import pytest
+
+from conftest import BUCKET_NAME, count_s3_requests, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+def test_listing_is_paginated_and_in_key_order(s3_files_module, s3_client, tmp_path):
+    keys = ['data/key{:03d}'.format(idx) for idx in range(50)]
+    for key in reversed(keys):
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=b'x' * (len(key) % 7))
+    manifest = new_manifest(module=s3_files_module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging')))
+    counts = collections.Counter()
+    count_s3_requests(manifest=manifest, counts=counts)
+
+    listing = list(manifest._iterate_s3_keys(variable_cache=new_variable_cache(), page_size=7))
+    assert [key_data['Key'] for key_data in listing] == keys
+    assert [key_data['Size'] for key_data in listing] == [len(key) % 7 for key in keys]
+    assert counts['ListObjectsV2'] == 8
+
+
+def test_listing_stops_with_the_consumer(s3_files_module, s3_client, tmp_path):
+    for idx in range(50):
+        s3_client.put_object(Bucket=BUCKET_NAME, Key='key{:03d}'.format(idx), Body=b'')
+    manifest = new_manifest(module=s3_files_module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging')))
+    counts = collections.Counter()
+    count_s3_requests(manifest=manifest, counts=counts)
+
+    listing = manifest._iterate_s3_keys(variable_cache=new_variable_cache(), page_size=10)
+    assert next(listing)['Key'] == 'key000'
+    listing.close()
+    assert counts['ListObjectsV2'] == 1
+
+
+def test_only_keys_under_the_destination_directory_are_synced_and_deleted(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=2, files_per_directory=3)
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='other/keep.txt', Body=b'keep')
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='releases-old/keep.txt', Body=b'keep')
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='releases/extra.txt', Body=b'extra')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), destinationDirectory='/releases/')
+
+    variable_cache = new_variable_cache()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=variable_cache) is True
+    assert get_variable(variable_cache=variable_cache, name='FILES_TO_DELETE') == 1
+    manifest.apply_manifest(variable_cache=variable_cache)
+    assert list_keys(client=s3_client) == sorted(['other/keep.txt', 'releases-old/keep.txt'] + ['releases/{}'.format(key) for key in files.keys()])
+    assert new_manifest(module=s3_files_module, spec=spec).implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+
+    new_manifest(module=s3_files_module, spec=spec).delete_manifest(variable_cache=new_variable_cache())
+    assert list_keys(client=s3_client) == ['other/keep.txt', 'releases-old/keep.txt']
+
+
+def test_listing_errors_are_raised_on_request(s3_files_module, s3_client, tmp_path):
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='key.txt', Body=b'')
+    manifest = new_manifest(module=s3_files_module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging')))
+    count_s3_requests(manifest=manifest, counts=collections.Counter(), fail_operation='ListObjectsV2')
+    assert list(manifest._iterate_s3_keys(variable_cache=new_variable_cache())) == list()
+    with pytest.raises(Exception, match='Simulated ListObjectsV2 failure'):
+        list(manifest._iterate_s3_keys(variable_cache=new_variable_cache(), raise_on_error=True))
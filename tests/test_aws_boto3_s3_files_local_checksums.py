@@ -0,0 +1,108 @@
+import hashlib
+import os
+import sqlite3
+
+import pytest
+
+from conftest import new_variable_cache, new_spec, new_manifest, write_source_tree
+
+
+@pytest.fixture
+def hashed_files(s3_files_module, monkeypatch):
+    # Records every local file hashed in the current process
+    hashed = list()
+    original_sha256_file = s3_files_module._sha256_file
+
+    def sha256_file(file_path: str, **kwargs)->str:
+        hashed.append(file_path)
+        return original_sha256_file(file_path=file_path, **kwargs)
+
+    monkeypatch.setattr(s3_files_module, '_sha256_file', sha256_file)
+    return hashed
+
+
+def _scan_local_files(manifest: object)->tuple:
+    # Returns the local file checksums by key, with the cache hits and misses of the scan
+    checksum_cache = manifest._open_checksum_cache()
+    local_files = manifest._get_all_local_files(variable_cache=new_variable_cache(), checksum_cache=checksum_cache)
+    hits, misses = checksum_cache['Hits'], checksum_cache['Misses']
+    manifest._close_checksum_cache(checksum_cache=checksum_cache)
+    return {key_data['Key']: key_data['ContentChecksumSha256'] for key_data in local_files.values()}, hits, misses
+
+
+def _cached_paths(manifest: object)->list:
+    with sqlite3.connect(manifest._checksum_cache_file()) as connection:
+        return sorted([row[0] for row in connection.execute('SELECT path FROM file_checksums')])
+
+
+def _new_manifest(module: object, tmp_path: object, **spec_updates):
+    os.makedirs(str(tmp_path / 'staging'), exist_ok=True)
+    return new_manifest(module=module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), **spec_updates))
+
+
+def test_unchanged_files_are_not_hashed_again(s3_files_module, tmp_path, hashed_files):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=2, files_per_directory=3)
+    expected_checksums = {key: hashlib.sha256(content).hexdigest() for key, content in files.items()}
+
+    checksums, hits, misses = _scan_local_files(manifest=_new_manifest(module=s3_files_module, tmp_path=tmp_path))
+    assert checksums == expected_checksums
+    assert (hits, misses) == (0, len(files))
+    assert len(hashed_files) == len(files)
+
+    hashed_files.clear()
+    checksums, hits, misses = _scan_local_files(manifest=_new_manifest(module=s3_files_module, tmp_path=tmp_path))
+    assert checksums == expected_checksums
+    assert (hits, misses) == (len(files), 0)
+    assert hashed_files == list()
+
+
+def test_changed_files_invalidate_the_cached_checksum(s3_files_module, tmp_path, hashed_files):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    _scan_local_files(manifest=_new_manifest(module=s3_files_module, tmp_path=tmp_path))
+    changed_file = str(tmp_path / 'source' / 'dir0' / 'file1.txt')
+    file_stat = os.stat(changed_file)
+    with open(changed_file, 'r+b') as f:
+        f.write(b'C')    # Same size, so only the modification time shows the change
+    os.utime(changed_file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 1000000))
+
+    hashed_files.clear()
+    checksums, hits, misses = _scan_local_files(manifest=_new_manifest(module=s3_files_module, tmp_path=tmp_path))
+    assert (hits, misses) == (len(files) - 1, 1)
+    assert hashed_files == [changed_file,]
+    with open(changed_file, 'rb') as f:
+        assert checksums['dir0/file1.txt'] == hashlib.sha256(f.read()).hexdigest()
+
+
+def test_removed_files_are_pruned_from_the_cache(s3_files_module, tmp_path, hashed_files):
+    write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path)
+    _scan_local_files(manifest=manifest)
+    assert len(_cached_paths(manifest=manifest)) == 3
+
+    os.remove(str(tmp_path / 'source' / 'dir0' / 'file0.txt'))
+    _scan_local_files(manifest=manifest)
+    assert _cached_paths(manifest=manifest) == [str(tmp_path / 'source' / 'dir0' / 'file{}.txt'.format(idx)) for idx in (1, 2)]
+
+
+def test_checksum_cache_can_be_disabled(s3_files_module, tmp_path, hashed_files):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    for run in range(2):
+        manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, checksumCache=False)
+        assert manifest._open_checksum_cache() is None
+        manifest._get_all_local_files(variable_cache=new_variable_cache())
+    assert len(hashed_files) == 2 * len(files)
+    assert os.listdir(str(tmp_path / 'staging')) == list()
+
+
+def test_checksums_calculated_by_the_process_pool(s3_files_module, tmp_path, hashed_files):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=2, files_per_directory=5)
+    with open(str(tmp_path / 'source' / 'dir0' / 'large.bin'), 'wb') as f:
+        f.write(os.urandom(2097152))    # Hashed with mmap in its own batch
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, hashWorkers=2, checksumCache=False)
+    pending_checksums = list()
+    for file_name in sorted(list(files.keys()) + ['dir0/large.bin',]):
+        manifest._retrieve_local_file_meta_data(base_directory=str(tmp_path / 'source'), file_name_portion=file_name, compare_policy='checksum', pending_checksums=pending_checksums)
+    manifest._calculate_pending_checksums(pending_checksums=pending_checksums, min_parallel_bytes=0)
+    assert hashed_files == list()   # All files were hashed by the worker processes
+    for result, file_stat in pending_checksums:
+        assert result['ContentChecksumSha256'] == s3_files_module._sha256_file(file_path=result['LocalFullPath'])
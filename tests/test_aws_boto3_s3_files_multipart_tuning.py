@@ -0,0 +1,80 @@
+import logging
+
+import pytest
+
+from conftest import BUCKET_NAME, new_variable_cache, new_spec, new_manifest, get_variable
+
+
+MIB = 1048576
+
+
+def _new_manifest(module: object, tmp_path: object, **spec_updates):
+    return new_manifest(module=module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), **spec_updates))
+
+
+def _transfer_config_values(transfer_config: object)->tuple:
+    return (transfer_config.multipart_threshold, transfer_config.multipart_chunksize, transfer_config.max_concurrency)
+
+
+def test_boto3_defaults_without_settings(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path)
+    assert manifest._get_transfer_config(file_size=1024 * MIB) is None
+
+
+def test_configured_settings_are_used(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, multipartUpload={'threshold': 16 * MIB, 'partSize': 32 * MIB, 'concurrency': 4})
+    assert _transfer_config_values(transfer_config=manifest._get_transfer_config(file_size=1024 * MIB)) == (16 * MIB, 32 * MIB, 4)
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, multipartUpload={'concurrency': 4})
+    assert _transfer_config_values(transfer_config=manifest._get_transfer_config(file_size=1024 * MIB)) == (8 * MIB, 8 * MIB, 4)
+
+
+def test_part_size_is_raised_to_stay_within_10000_parts(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, multipartUpload={'partSize': 8 * MIB})
+    file_size = 200 * 1024 * MIB
+    part_size = manifest._get_transfer_config(file_size=file_size).multipart_chunksize
+    assert part_size % MIB == 0
+    assert file_size // part_size < 10000
+
+
+@pytest.mark.parametrize('value', ['abc', 0, -5])
+def test_invalid_part_size_warns_once(s3_files_module, tmp_path, caplog, value):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, multipartUpload={'auto': True, 'partSize': value})
+    with caplog.at_level(logging.WARNING, logger='test'):
+        transfer_config = manifest._get_transfer_config(file_size=64 * MIB)
+    assert transfer_config.multipart_chunksize == 8 * MIB
+    assert len([record for record in caplog.records if 'multipartUpload.partSize' in record.getMessage()]) == 1
+
+
+def test_auto_tuning_spreads_streams_over_large_files(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, multipartUpload={'auto': True}, maxConcurrency=10)
+    manifest._init_transfer_tuning(file_sizes=[1024 * MIB,])
+    assert _transfer_config_values(transfer_config=manifest._get_transfer_config(file_size=1024 * MIB)) == (16 * MIB, 8 * MIB, 32)
+    manifest._init_transfer_tuning(file_sizes=[100 * MIB,] * 20 + [MIB,])
+    assert manifest._get_transfer_config(file_size=100 * MIB).max_concurrency == 4
+    manifest._init_transfer_tuning(file_sizes=[4 * MIB,])
+    assert manifest._get_transfer_config(file_size=4 * MIB).max_concurrency == 32    # Without other large files, one file gets the complete stream budget
+
+
+def test_auto_tuning_sizes_parts_by_measured_throughput(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, multipartUpload={'auto': True, 'concurrency': 2}, maxConcurrency=10)
+    manifest._init_transfer_tuning(file_sizes=[1024 * MIB, 1024 * MIB])
+    transfer_config = manifest._get_transfer_config(file_size=1024 * MIB)
+    assert transfer_config.multipart_chunksize == 8 * MIB
+
+    # Two streams of 5 MiB per second each, so that a part of 4 seconds holds 20 MiB
+    manifest._record_transfer_throughput(file_size=1024 * MIB, duration=102.4, transfer_config=transfer_config)
+    assert manifest.transfer_tuning['StreamBytesPerSecond'] == pytest.approx(5 * MIB)
+    assert manifest.transfer_tuning['LargeFilesRemaining'] == 1
+    assert manifest._get_transfer_config(file_size=1024 * MIB).multipart_chunksize == 20 * MIB
+    assert manifest._get_transfer_config(file_size=24 * MIB).multipart_chunksize == 12 * MIB     # Each stream still gets a part
+
+
+def test_upload_uses_the_configured_part_size(s3_files_module, s3_client, tmp_path):
+    (tmp_path / 'source').mkdir()
+    with open(str(tmp_path / 'source' / 'large.bin'), 'wb') as f:
+        f.write(b'x' * 12 * MIB)
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), multipartUpload={'threshold': 5 * MIB, 'partSize': 5 * MIB, 'concurrency': 2})
+    variable_cache = new_variable_cache()
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert s3_client.head_object(Bucket=BUCKET_NAME, Key='large.bin')['ETag'].strip('"').endswith('-3')
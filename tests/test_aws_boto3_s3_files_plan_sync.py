@@ -0,0 +1,82 @@
+import os
+
+from conftest import BUCKET_NAME, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+def test_plan_sync_uploads_and_deletes(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'))
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='extra.txt', Body=b'extra')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+
+    variable_cache = new_variable_cache()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=variable_cache) is True
+    assert get_variable(variable_cache=variable_cache, name='FILES_TO_TRANSFER') == len(files)
+    assert get_variable(variable_cache=variable_cache, name='FILES_TO_DELETE') == 1
+    manifest.apply_manifest(variable_cache=variable_cache)
+
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert list_keys(client=s3_client) == sorted(files.keys())
+    for key, content in files.items():
+        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
+        assert response['Body'].read() == content
+    assert new_manifest(module=s3_files_module, spec=spec).implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+
+
+def test_plan_sync_uploads_changed_files_only(s3_files_module, s3_client, tmp_path):
+    write_source_tree(directory=str(tmp_path / 'source'))
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    with open(str(tmp_path / 'source' / 'dir1' / 'file3.txt'), 'wb') as f:
+        f.write(b'changed')
+    os.remove(str(tmp_path / 'source' / 'dir2' / 'file0.txt'))
+
+    variable_cache = new_variable_cache()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=variable_cache) is True
+    assert get_variable(variable_cache=variable_cache, name='FILES_TO_TRANSFER') == 1
+    assert get_variable(variable_cache=variable_cache, name='FILES_TO_DELETE') == 1
+    manifest.apply_manifest(variable_cache=variable_cache)
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir1/file3.txt')['Body'].read() == b'changed'
+    assert 'dir2/file0.txt' not in list_keys(client=s3_client)
+
+
+def test_delete_manifest_removes_all_keys(s3_files_module, s3_client, tmp_path):
+    write_source_tree(directory=str(tmp_path / 'source'))
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    new_manifest(module=s3_files_module, spec=spec).delete_manifest(variable_cache=new_variable_cache())
+    assert list_keys(client=s3_client) == list()
+
+
+def test_delete_manifest_removes_the_local_state(s3_files_module, s3_client, tmp_path):
+    write_source_tree(directory=str(tmp_path / 'source'))
+    staging_directory = tmp_path / 'staging'
+    spec = new_spec(
+        source_directory=str(tmp_path / 'source'),
+        staging_directory=str(staging_directory),
+        bundling={'enabled': True},
+        resumableSync=True,
+        transferLogFile=str(tmp_path / 'transfer.log')
+    )
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    assert sorted(os.listdir(str(staging_directory))) == ['animus-bundles-test-files', 'animus-checksum-cache-test-files-default.sqlite']
+    # The journal of an interrupted sync of a destination, and the files of another manifest
+    os.makedirs(str(staging_directory / 'destination-second-bucket'))
+    (staging_directory / 'destination-second-bucket' / 'animus-sync-journal-test-files-default.sqlite').write_bytes(b'')
+    (staging_directory / 'animus-checksum-cache-other-files-default.sqlite').write_bytes(b'')
+
+    new_manifest(module=s3_files_module, spec=spec).delete_manifest(variable_cache=new_variable_cache())
+    assert list_keys(client=s3_client) == list()
+    assert os.listdir(str(staging_directory)) == ['animus-checksum-cache-other-files-default.sqlite']
+    assert os.path.isfile(str(tmp_path / 'transfer.log')) is True
+
+
+def test_symbolic_link_cycle_ends_the_directory_walk(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'))
+    os.symlink(str(tmp_path / 'source'), str(tmp_path / 'source' / 'dir0' / 'loop'))
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+    variable_cache = new_variable_cache()
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert list_keys(client=s3_client) == sorted(files.keys())
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from conftest import new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+awsrequest = pytest.importorskip('botocore.awsrequest')
+
+SLOW_DOWN_BODY = b'<?xml version="1.0" encoding="UTF-8"?><Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>'
+
+
+class SlowDownBody:
+
+    def stream(self, **kwargs):
+        yield SLOW_DOWN_BODY
+
+
+@pytest.fixture
+def sleeps(s3_files_module, monkeypatch):
+    # Records the rate limiting waits instead of waiting
+    waits = list()
+    monkeypatch.setattr(s3_files_module.time, 'sleep', waits.append)
+    return waits
+
+
+def _new_manifest(module: object, tmp_path: object, **spec_updates):
+    manifest = new_manifest(module=module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), **spec_updates))
+    manifest._init_rate_limiting()
+    return manifest
+
+
+def test_requests_wait_for_tokens(s3_files_module, tmp_path, sleeps):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, rateLimit={'requestsPerSecond': 10})
+    for idx in range(10):
+        manifest._before_s3_request()
+    assert sleeps == list()
+    manifest._before_s3_request()
+    manifest._before_s3_request()
+    assert len(sleeps) == 2
+    assert sleeps[0] == pytest.approx(0.1, abs=0.02)
+    assert sleeps[1] == pytest.approx(0.2, abs=0.02)
+
+
+def test_byte_tokens_refill_over_time(s3_files_module, tmp_path, sleeps):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, rateLimit={'bytesPerSecond': 1000})
+    manifest._take_tokens(bucket_name='Bytes', amount=1500)
+    assert sleeps[0] == pytest.approx(0.5, abs=0.02)
+    manifest.rate_limiting['Buckets']['Bytes']['LastRefill'] -= 10.0     # The capacity is one second of tokens
+    manifest._take_tokens(bucket_name='Bytes', amount=1000)
+    assert len(sleeps) == 1
+    manifest._take_tokens(bucket_name='Requests', amount=1000)     # Not limited
+    assert len(sleeps) == 1
+
+
+def test_invalid_rate_limits_are_ignored(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, rateLimit={'requestsPerSecond': 'fast', 'bytesPerSecond': 0})
+    assert manifest.rate_limiting['Buckets'] == dict()
+
+
+def test_throttling_halves_the_concurrency_once_per_interval(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, maxConcurrency=8)
+    for idx in range(5):
+        manifest._after_s3_response(response_dict={'status_code': 503}, parsed_response={'Error': {'Code': 'SlowDown'}})
+    assert manifest.rate_limiting['ConcurrencyLimit'] == 4.0
+    assert manifest.rate_limiting['Throttles'] == 5
+
+    for idx in range(5):
+        manifest.rate_limiting['LastThrottle'] -= 2.0
+        manifest._after_s3_response(parsed_response={'Error': {'Code': 'Throttling'}})
+    assert manifest.rate_limiting['ConcurrencyLimit'] == 1.0
+    manifest._after_s3_response(response_dict={'status_code': 200}, parsed_response={'ETag': '"etag"'})
+    assert manifest.rate_limiting['Throttles'] == 10
+
+
+def test_successful_transfers_increase_the_concurrency(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, maxConcurrency=4)
+    manifest.rate_limiting['ConcurrencyLimit'] = 2.0
+    manifest._record_transfer_success()
+    assert manifest.rate_limiting['ConcurrencyLimit'] == 2.5
+    manifest._record_transfer_success()
+    assert manifest.rate_limiting['ConcurrencyLimit'] == pytest.approx(2.9)
+    for idx in range(20):
+        manifest._record_transfer_success()
+    assert manifest.rate_limiting['ConcurrencyLimit'] == 4.0
+
+
+def test_transfers_wait_for_a_slot(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, maxConcurrency=4)
+    manifest.rate_limiting['ConcurrencyLimit'] = 1.0
+    manifest._acquire_transfer_slot()
+    acquired = threading.Event()
+    waiting_transfer = threading.Thread(target=lambda: (manifest._acquire_transfer_slot(), acquired.set()))
+    waiting_transfer.start()
+    assert acquired.wait(timeout=0.3) is False
+    manifest._release_transfer_slot()
+    assert acquired.wait(timeout=5.0) is True
+    waiting_transfer.join()
+    assert manifest.rate_limiting['ActiveTransfers'] == 1
+
+
+def test_sync_slows_down_on_throttled_uploads(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=4)
+    manifest = new_manifest(module=s3_files_module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), maxConcurrency=4))
+    throttled_requests = list()
+    throttled_requests_lock = threading.Lock()
+    original_get_boto3_s3_client = manifest._get_boto3_s3_client
+
+    def slow_down(request, **kwargs):
+        # The first two uploads are throttled, and succeed when retried
+        with throttled_requests_lock:
+            if len(throttled_requests) >= 2:
+                return None
+            throttled_requests.append(request.url)
+        return awsrequest.AWSResponse(url=request.url, status_code=503, headers={}, raw=SlowDownBody())
+
+    def get_boto3_s3_client(**kwargs):
+        client = original_get_boto3_s3_client(**kwargs)
+        if getattr(client, 'test_throttled', False) is False:
+            client.meta.events.register_first('before-send.s3.PutObject', slow_down)
+            client.test_throttled = True
+        return client
+
+    manifest._get_boto3_s3_client = get_boto3_s3_client
+    variable_cache = new_variable_cache()
+    start = time.monotonic()
+    manifest.apply_manifest(variable_cache=variable_cache)
+    assert time.monotonic() - start < 30.0
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert list_keys(client=s3_client) == sorted(files.keys())
+    assert len(throttled_requests) == 2
+    assert manifest.rate_limiting['Throttles'] == 2
+    assert manifest.rate_limiting['ConcurrencyLimit'] < 4.0
@@ -0,0 +1,49 @@
+import collections
+import gzip
+import json
+
+import pytest
+
+from conftest import BUCKET_NAME, count_s3_requests, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+INDEX_KEY = '.animus-index.jsonl.gz'
+
+
+def _read_index(client: object)->dict:
+    lines = gzip.decompress(client.get_object(Bucket=BUCKET_NAME, Key=INDEX_KEY)['Body'].read()).decode('utf-8').splitlines()
+    return {json.loads(line)[0]: json.loads(line) for line in lines[1:]}
+
+
+@pytest.mark.parametrize('sync_mode', ['plan', 'streaming'])
+def test_remote_index_replaces_the_listing(s3_files_module, s3_client, tmp_path, sync_mode):
+    files = write_source_tree(directory=str(tmp_path / 'source'))
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), syncMode=sync_mode, remoteIndex=True)
+    variable_cache = new_variable_cache()
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert list_keys(client=s3_client) == sorted(list(files.keys()) + [INDEX_KEY,])
+    assert sorted(_read_index(client=s3_client).keys()) == sorted(files.keys())
+
+    counts = collections.Counter()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    count_s3_requests(manifest=manifest, counts=counts)
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+    assert counts['ListObjectsV2'] == 0
+
+
+def test_listing_error_while_seeding_does_not_write_the_index(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'))
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+
+    spec['remoteIndex'] = True
+    counts = collections.Counter()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    count_s3_requests(manifest=manifest, counts=counts, fail_operation='ListObjectsV2')
+    manifest.apply_manifest(variable_cache=new_variable_cache())
+    assert counts['ListObjectsV2'] > 0
+    assert INDEX_KEY not in list_keys(client=s3_client)
+
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    assert sorted(_read_index(client=s3_client).keys()) == sorted(files.keys())
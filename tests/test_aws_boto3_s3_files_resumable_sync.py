@@ -0,0 +1,147 @@
+import collections
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from conftest import BUCKET_NAME, count_s3_requests, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+PART_SIZE = 5 * 1024 * 1024
+
+
+def _fail_upload_part(manifest: object, fail_at_call: int, calls: list):
+    # Wraps the cached S3 client of the manifest, so that one part upload fails
+    original_get_boto3_s3_client = manifest._get_boto3_s3_client
+
+    def get_boto3_s3_client(**kwargs):
+        client = original_get_boto3_s3_client(**kwargs)
+        if getattr(client, 'test_wrapped', False) is False:
+            original_upload_part = client.upload_part
+
+            def upload_part(**parameters):
+                calls.append(parameters['PartNumber'])
+                if len(calls) == fail_at_call:
+                    raise Exception('Simulated connection failure')
+                return original_upload_part(**parameters)
+
+            client.upload_part = upload_part
+            client.test_wrapped = True
+        return client
+
+    manifest._get_boto3_s3_client = get_boto3_s3_client
+
+
+@pytest.mark.parametrize('sync_mode', ['plan', 'streaming'])
+def test_interrupted_sync_resumes_from_the_journal(s3_files_module, s3_client, tmp_path, sync_mode):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    large_file_content = os.urandom(PART_SIZE * 2 + 1234)
+    with open(str(tmp_path / 'source' / 'large.bin'), 'wb') as f:
+        f.write(large_file_content)
+    spec = new_spec(
+        source_directory=str(tmp_path / 'source'),
+        staging_directory=str(tmp_path / 'staging'),
+        syncMode=sync_mode,
+        onError='exception',
+        resumableSync=True,
+        maxConcurrency=1,
+        multipartUpload={'partSize': PART_SIZE, 'concurrency': 1, 'threshold': PART_SIZE}
+    )
+
+    first_run_calls = list()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    _fail_upload_part(manifest=manifest, fail_at_call=3, calls=first_run_calls)
+    with pytest.raises(Exception):
+        manifest.apply_manifest(variable_cache=new_variable_cache())
+    journal_file = str(tmp_path / 'staging' / 'animus-sync-journal-test-files-default.sqlite')
+    assert os.path.isfile(journal_file) is True
+    connection = sqlite3.connect(journal_file)
+    assert connection.execute('SELECT key FROM multipart_uploads').fetchall() == [('large.bin',),]
+    connection.close()
+
+    second_run_calls = list()
+    variable_cache = new_variable_cache()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    _fail_upload_part(manifest=manifest, fail_at_call=-1, calls=second_run_calls)
+    manifest.apply_manifest(variable_cache=variable_cache)
+
+    assert second_run_calls == [3,]     # Only the part that failed is uploaded again
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert os.path.isfile(journal_file) is False
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='large.bin')['Body'].read() == large_file_content
+    assert list_keys(client=s3_client) == sorted(list(files.keys()) + ['large.bin',])
+    assert s3_client.list_multipart_uploads(Bucket=BUCKET_NAME).get('Uploads', list()) == list()
+
+
+def test_transaction_log_lines(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), transferLogFile=str(tmp_path / 'transfer.log'))
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    with open(str(tmp_path / 'transfer.log'), 'r') as f:
+        lines = f.read().splitlines()
+    assert len(lines) == len(files)
+
+
+def _interrupt_after_copies(manifest: object, copies: int):
+    # Fails every copy and upload once the given number of copies completed, so that the sync halts
+    original_get_boto3_s3_client = manifest._get_boto3_s3_client
+    calls = collections.Counter()
+
+    def before_call(model, **kwargs):
+        if model.name in ('CopyObject', 'PutObject'):
+            calls.update([model.name])
+            if calls['CopyObject'] > copies:
+                raise Exception('Simulated connection failure')
+
+    def get_boto3_s3_client(**kwargs):
+        client = original_get_boto3_s3_client(**kwargs)
+        if getattr(client, 'test_interrupted', False) is False:
+            client.meta.events.register('before-call.s3', before_call)
+            client.test_interrupted = True
+        return client
+
+    manifest._get_boto3_s3_client = get_boto3_s3_client
+
+
+def test_planned_copies_survive_an_interruption(s3_files_module, s3_client, tmp_path):
+    files = dict()
+    os.makedirs(str(tmp_path / 'source' / 'old'))
+    for file_number in range(4):
+        content = os.urandom(4096 + file_number)
+        with open(str(tmp_path / 'source' / 'old' / 'file{}.bin'.format(file_number)), 'wb') as f:
+            f.write(content)
+        files['file{}.bin'.format(file_number)] = content
+    spec = new_spec(
+        source_directory=str(tmp_path / 'source'),
+        staging_directory=str(tmp_path / 'staging'),
+        onError='exception',
+        resumableSync=True,
+        maxConcurrency=1,
+        serverSideCopy={'enabled': True, 'minimumSize': 1024}
+    )
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+
+    shutil.move(str(tmp_path / 'source' / 'old'), str(tmp_path / 'source' / 'new'))
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    _interrupt_after_copies(manifest=manifest, copies=1)
+    with pytest.raises(Exception):
+        manifest.apply_manifest(variable_cache=new_variable_cache())
+    journal_file = str(tmp_path / 'staging' / 'animus-sync-journal-test-files-default.sqlite')
+    connection = sqlite3.connect(journal_file)
+    assert sorted(connection.execute('SELECT key, copy_source FROM pending_jobs WHERE action = ?', ('COPY',)).fetchall()) == [('new/{}'.format(file_name), 'old/{}'.format(file_name)) for file_name in sorted(files.keys())]
+    connection.close()
+
+    counts = collections.Counter()
+    variable_cache = new_variable_cache()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    count_s3_requests(manifest=manifest, counts=counts)
+    manifest.apply_manifest(variable_cache=variable_cache)
+
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert counts['CopyObject'] == len(files) - 1     # Only the copies that did not complete
+    assert counts['PutObject'] == 0
+    assert os.path.isfile(journal_file) is False
+    assert list_keys(client=s3_client) == sorted('new/{}'.format(file_name) for file_name in files.keys())
+    for file_name, content in files.items():
+        assert s3_client.get_object(Bucket=BUCKET_NAME, Key='new/{}'.format(file_name))['Body'].read() == content
@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import BUCKET_NAME, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+OTHER_BUCKET_NAME = 'animus-other-test-bucket'
+
+
+@pytest.fixture
+def reused_manifest(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    s3_client.create_bucket(Bucket=OTHER_BUCKET_NAME)
+    manifest = new_manifest(module=s3_files_module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging')))
+    manifest.apply_manifest(variable_cache=new_variable_cache())
+    assert list_keys(client=s3_client) == sorted(files.keys())
+    return manifest, files
+
+
+def test_differ_uses_the_current_bucket_name(reused_manifest, s3_client):
+    manifest, files = reused_manifest
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+
+    variable_cache = new_variable_cache(bucket_name=OTHER_BUCKET_NAME)
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=variable_cache) is True
+    assert get_variable(variable_cache=variable_cache, name='FILES_TO_TRANSFER') == len(files)
+    manifest.apply_manifest(variable_cache=variable_cache)
+    assert list_keys(client=s3_client, bucket_name=OTHER_BUCKET_NAME) == sorted(files.keys())
+
+
+def test_differ_uses_the_current_session(reused_manifest):
+    manifest = reused_manifest[0]
+    variable_cache = new_variable_cache()
+    manifest.implemented_manifest_differ_from_this_manifest(variable_cache=variable_cache)
+    client = manifest._get_boto3_s3_client(variable_cache=variable_cache)
+    assert manifest._get_boto3_s3_client(variable_cache=variable_cache) is client
+
+    reconnected_variable_cache = new_variable_cache()
+    reconnected_session = reconnected_variable_cache.get_value(variable_name='AwsBoto3Session:test-session:default:SESSION')
+    assert reconnected_session is not variable_cache.get_value(variable_name='AwsBoto3Session:test-session:default:SESSION')
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=reconnected_variable_cache) is False
+    reconnected_client = manifest._get_boto3_s3_client(variable_cache=reconnected_variable_cache)
+    assert reconnected_client is not client
+    assert manifest._get_bucket_name(variable_cache=reconnected_variable_cache) == BUCKET_NAME
@@ -0,0 +1,40 @@
+import collections
+import os
+import shutil
+
+import pytest
+
+from conftest import BUCKET_NAME, count_s3_requests, new_variable_cache, new_spec, new_manifest, list_keys, get_variable
+
+
+@pytest.mark.parametrize('diff_engine', ['hash', 'sortmerge'])
+def test_moved_files_are_copied_with_a_single_listing(s3_files_module, s3_client, tmp_path, diff_engine):
+    files = dict()
+    os.makedirs(str(tmp_path / 'source' / 'old'))
+    for file_number in range(4):
+        content = os.urandom(4096 + file_number)
+        with open(str(tmp_path / 'source' / 'old' / 'file{}.bin'.format(file_number)), 'wb') as f:
+            f.write(content)
+        files['file{}.bin'.format(file_number)] = content
+    spec = new_spec(
+        source_directory=str(tmp_path / 'source'),
+        staging_directory=str(tmp_path / 'staging'),
+        diffEngine=diff_engine,
+        serverSideCopy={'enabled': True, 'minimumSize': 1024}
+    )
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+
+    shutil.move(str(tmp_path / 'source' / 'old'), str(tmp_path / 'source' / 'new'))
+    counts = collections.Counter()
+    variable_cache = new_variable_cache()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    count_s3_requests(manifest=manifest, counts=counts)
+    manifest.apply_manifest(variable_cache=variable_cache)
+
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert counts['ListObjectsV2'] == 1
+    assert counts['CopyObject'] == len(files)
+    assert counts['PutObject'] == 0
+    assert list_keys(client=s3_client) == sorted('new/{}'.format(file_name) for file_name in files.keys())
+    for file_name, content in files.items():
+        assert s3_client.get_object(Bucket=BUCKET_NAME, Key='new/{}'.format(file_name))['Body'].read() == content
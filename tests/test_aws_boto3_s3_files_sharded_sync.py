@@ -0,0 +1,120 @@
+import os
+import socket
+import urllib.request
+
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+moto_server = pytest.importorskip('moto.server')     # Requires moto[server]
+
+from conftest import BUCKET_NAME, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+@pytest.fixture
+def s3_server_client(aws_environment, monkeypatch):
+    # Forked shard workers can not share an in-process mock, so the shards talk to a moto server instead
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    server = moto_server.ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    endpoint_url = 'http://127.0.0.1:{}'.format(port)
+    urllib.request.urlopen(urllib.request.Request('{}/moto-api/reset'.format(endpoint_url), method='POST')).close()     # The server state is shared within this process
+    monkeypatch.setenv('AWS_ENDPOINT_URL_S3', endpoint_url)
+    try:
+        client = boto3.Session(region_name='us-east-1').client('s3')
+        client.create_bucket(Bucket=BUCKET_NAME)
+        yield client
+    finally:
+        server.stop()
+
+
+@pytest.mark.parametrize('sync_mode', ['plan', 'streaming'])
+def test_sharded_sync(s3_files_module, s3_server_client, tmp_path, sync_mode):
+    files = write_source_tree(directory=str(tmp_path / 'source'))
+    s3_server_client.put_object(Bucket=BUCKET_NAME, Key='extra.txt', Body=b'extra')
+    transfer_log_file = str(tmp_path / 'transfer.log')
+    spec = new_spec(
+        source_directory=str(tmp_path / 'source'),
+        staging_directory=str(tmp_path / 'staging'),
+        syncMode=sync_mode,
+        sharding={'shardCount': 3},
+        transferLogFile=transfer_log_file
+    )
+    variable_cache = new_variable_cache()
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=variable_cache)
+
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert list_keys(client=s3_server_client) == sorted(files.keys())
+    assert sorted(os.listdir(str(tmp_path))) == ['source', 'staging', 'transfer.log']     # The shard logs were merged
+    with open(transfer_log_file, 'r') as f:
+        lines = f.read().splitlines()
+    assert len(lines) == len(files) + 1
+    assert len([line for line in lines if 'extra.txt' in line]) == 1
+    logged_shards = [s3_files_module._key_shard(key=line.split('s3://{}/'.format(BUCKET_NAME))[1].split('"')[0], shard_count=3) for line in lines]
+    assert logged_shards == sorted(logged_shards)     # The log of every shard is appended as a whole
+
+    assert new_manifest(module=s3_files_module, spec=spec).implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+
+
+def _fail_upload_part(manifest: object, fail_at_call: int):
+    # Wraps the S3 client of the manifest, so that one part upload fails in the shard worker that uploads the parts
+    original_get_boto3_s3_client = manifest._get_boto3_s3_client
+    calls = list()
+
+    def get_boto3_s3_client(**kwargs):
+        client = original_get_boto3_s3_client(**kwargs)
+        if getattr(client, 'test_wrapped', False) is False:
+            original_upload_part = client.upload_part
+
+            def upload_part(**parameters):
+                calls.append(parameters['PartNumber'])
+                if len(calls) == fail_at_call:
+                    raise Exception('Simulated connection failure')
+                return original_upload_part(**parameters)
+
+            client.upload_part = upload_part
+            client.test_wrapped = True
+        return client
+
+    manifest._get_boto3_s3_client = get_boto3_s3_client
+
+
+@pytest.mark.parametrize('sync_mode', ['plan', 'streaming'])
+def test_resumed_shard_keeps_the_uploads_of_other_shards(s3_files_module, s3_server_client, tmp_path, sync_mode):
+    part_size = 5 * 1024 * 1024
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    large_file_content = os.urandom(part_size * 2 + 1234)
+    with open(str(tmp_path / 'source' / 'large.bin'), 'wb') as f:
+        f.write(large_file_content)
+    shard_index = s3_files_module._key_shard(key='large.bin', shard_count=2)
+    other_key = [key for key in ('other-{}.bin'.format(idx) for idx in range(100)) if s3_files_module._key_shard(key=key, shard_count=2) != shard_index][0]
+    spec = new_spec(
+        source_directory=str(tmp_path / 'source'),
+        staging_directory=str(tmp_path / 'staging'),
+        syncMode=sync_mode,
+        onError='exception',
+        resumableSync=True,
+        maxConcurrency=1,
+        multipartUpload={'partSize': part_size, 'concurrency': 1, 'threshold': part_size},
+        actionExtraFilesOnS3='Keep',
+        sharding={'shardCount': 2, 'shardIndexes': [shard_index,]}
+    )
+
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    _fail_upload_part(manifest=manifest, fail_at_call=3)
+    with pytest.raises(Exception, match='Failed to synchronize shards'):
+        manifest.apply_manifest(variable_cache=new_variable_cache())
+    assert [upload['Key'] for upload in s3_server_client.list_multipart_uploads(Bucket=BUCKET_NAME).get('Uploads', list())] == ['large.bin',]
+
+    # Meanwhile another host uploads a file of the other shard
+    other_upload_id = s3_server_client.create_multipart_upload(Bucket=BUCKET_NAME, Key=other_key)['UploadId']
+    s3_server_client.upload_part(Bucket=BUCKET_NAME, Key=other_key, UploadId=other_upload_id, PartNumber=1, Body=b'x' * part_size)
+
+    variable_cache = new_variable_cache()
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert s3_server_client.get_object(Bucket=BUCKET_NAME, Key='large.bin')['Body'].read() == large_file_content
+    assert [(upload['Key'], upload['UploadId']) for upload in s3_server_client.list_multipart_uploads(Bucket=BUCKET_NAME).get('Uploads', list())] == [(other_key, other_upload_id),]
+    shard_keys = [key for key in list(files.keys()) + ['large.bin',] if s3_files_module._key_shard(key=key, shard_count=2) == shard_index]
+    assert list_keys(client=s3_server_client) == sorted(shard_keys)
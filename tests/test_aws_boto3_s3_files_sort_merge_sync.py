@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from conftest import BUCKET_NAME, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+@pytest.mark.parametrize('sync_mode', ['plan', 'streaming'])
+def test_sort_merge_sync(s3_files_module, s3_client, tmp_path, sync_mode):
+    files = write_source_tree(directory=str(tmp_path / 'source'))
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='dir1/extra.txt', Body=b'extra')
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='zzz.txt', Body=b'extra')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), syncMode=sync_mode, diffEngine='sortMerge')
+
+    variable_cache = new_variable_cache()
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert list_keys(client=s3_client) == sorted(files.keys())
+
+    with open(str(tmp_path / 'source' / 'dir2' / 'file4.txt'), 'wb') as f:
+        f.write(b'changed')
+    os.remove(str(tmp_path / 'source' / 'dir0' / 'file0.txt'))
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir2/file4.txt')['Body'].read() == b'changed'
+    assert 'dir0/file0.txt' not in list_keys(client=s3_client)
+    assert new_manifest(module=s3_files_module, spec=spec).implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+
+
+def test_sort_merge_diff_decides_in_batches(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'))
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), diffEngine='sortMerge', checksumCache=False)
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    for key in ('dir0/file2.txt', 'dir1/file7.txt', 'dir2/file9.txt'):
+        with open(str(tmp_path / 'source' / key), 'wb') as f:
+            f.write(b'changed')
+
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    batch_sizes = list()
+    original_get_s3_key_checksums = manifest._get_s3_key_checksums
+    manifest._get_s3_key_checksums = lambda keys, **kwargs: batch_sizes.append(len(keys)) or original_get_s3_key_checksums(keys=keys, **kwargs)
+    sync_plan = s3_files_module._new_sync_plan()
+    os.makedirs(str(tmp_path / 'work'))
+    manifest._sort_merge_diff(sync_plan=sync_plan, work_dir=str(tmp_path / 'work'), variable_cache=new_variable_cache(), batch_size=7)
+    assert max(batch_sizes) <= 7
+    assert sum(batch_sizes) == len(files)
+    assert sorted(sync_plan['Keys']) == ['dir0/file2.txt', 'dir1/file7.txt', 'dir2/file9.txt']
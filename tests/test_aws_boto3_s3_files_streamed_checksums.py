@@ -0,0 +1,73 @@
+import collections
+import gzip
+import hashlib
+import os
+
+import pytest
+
+from conftest import BUCKET_NAME, count_s3_requests, new_variable_cache, new_spec, new_manifest, write_source_tree, get_variable
+
+
+def _new_manifest(module: object, tmp_path: object, counts: object=None, **spec_updates):
+    manifest = new_manifest(module=module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), **spec_updates))
+    if counts is not None:
+        count_s3_requests(manifest=manifest, counts=counts)
+    return manifest
+
+
+@pytest.mark.parametrize('checksum_download, get_requests', [
+    (None, 1),
+    ({'concurrency': 4, 'rangeSize': 1024}, 10),
+    ({'concurrency': 2, 'rangeSize': 20000}, 1),
+])
+def test_checksum_of_the_streamed_content(s3_files_module, s3_client, tmp_path, checksum_download, get_requests):
+    content = os.urandom(10000)
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='data.bin', Body=content)
+    counts = collections.Counter()
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, counts=counts, checksumDownload=checksum_download)
+    assert manifest._get_streamed_s3_key_checksum(key='data.bin', variable_cache=new_variable_cache()) == hashlib.sha256(content).hexdigest()
+    assert counts['GetObject'] == get_requests
+
+
+@pytest.mark.parametrize('concurrency', [1, 3])
+def test_empty_objects(s3_files_module, s3_client, tmp_path, concurrency):
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='empty.txt', Body=b'')
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, checksumDownload={'concurrency': concurrency})
+    assert manifest._get_streamed_s3_key_checksum(key='empty.txt', variable_cache=new_variable_cache()) == hashlib.sha256(b'').hexdigest()
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+def test_gzip_encoded_objects_are_hashed_uncompressed(s3_files_module, s3_client, tmp_path, concurrency):
+    content = b''.join([os.urandom(64) * 50 for idx in range(100)])
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='data.bin', Body=gzip.compress(content), ContentEncoding='gzip')
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, checksumDownload={'concurrency': concurrency, 'rangeSize': 4096})
+    assert manifest._get_streamed_s3_key_checksum(key='data.bin', variable_cache=new_variable_cache()) == hashlib.sha256(content).hexdigest()
+
+
+def test_missing_objects_have_no_checksum(s3_files_module, s3_client, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, checksumDownload={'concurrency': 2})
+    assert manifest._get_streamed_s3_key_checksum(key='missing.bin', variable_cache=new_variable_cache()) is None
+
+
+def test_invalid_checksum_download_settings_use_the_defaults(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, checksumDownload={'concurrency': 'many', 'rangeSize': -1})
+    assert manifest._get_checksum_download_setting(setting_name='concurrency', default_value=1) == 1
+    assert manifest._get_checksum_download_setting(setting_name='rangeSize', default_value=8388608) == 8388608
+
+
+@pytest.mark.parametrize('sync_mode', ['plan', 'streaming'])
+def test_nothing_is_written_to_the_staging_directory(s3_files_module, s3_client, tmp_path, sync_mode):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    for key, content in files.items():
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=content)     # Without a recorded checksum
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='dir0/file2.txt', Body=b'changed')
+    counts = collections.Counter()
+    variable_cache = new_variable_cache()
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, counts=counts, syncMode=sync_mode, checksumCache=False, ifFileExists={'overWrite': False})
+    manifest.apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert get_variable(variable_cache=variable_cache, name='CHECKSUM_DIFFERENCES_DETECTED') is True
+    assert counts['GetObject'] == len(files)
+    assert counts['PutObject'] == 1
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir0/file2.txt')['Body'].read() == files['dir0/file2.txt']
+    assert os.listdir(str(tmp_path / 'staging')) == list()
@@ -0,0 +1,75 @@
+import pytest
+
+from conftest import BUCKET_NAME, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+def test_streaming_sync_uploads_and_deletes(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'))
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='extra.txt', Body=b'extra')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), syncMode='streaming')
+
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is True
+    variable_cache = new_variable_cache()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    manifest.apply_manifest(variable_cache=variable_cache)
+
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
+    assert list_keys(client=s3_client) == sorted(files.keys())
+    for key, content in files.items():
+        assert s3_client.get_object(Bucket=BUCKET_NAME, Key=key)['Body'].read() == content
+    assert new_manifest(module=s3_files_module, spec=spec).implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is False
+
+
+def test_streaming_sync_uses_the_listing_instead_of_head_requests(s3_files_module, s3_client, tmp_path):
+    # Checksums are not part of the listing, but a size comparison only needs the listing
+    write_source_tree(directory=str(tmp_path / 'source'))
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), syncMode='streaming')
+    spec['sources'][0].update({'verifyChecksums': False, 'comparePolicy': 'size'})
+    new_manifest(module=s3_files_module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    with open(str(tmp_path / 'source' / 'dir0' / 'file1.txt'), 'wb') as f:
+        f.write(b'changed')
+
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    head_requests = list()
+    original_head_s3_key = manifest._head_s3_key
+    manifest._head_s3_key = lambda **kwargs: head_requests.append(kwargs['key']) or original_head_s3_key(**kwargs)
+    manifest.apply_manifest(variable_cache=new_variable_cache())
+    assert head_requests == list()
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir0/file1.txt')['Body'].read() == b'changed'
+
+
+def _failing_remote_checksum(**kwargs):
+    raise Exception('Simulated AccessDenied error while reading the remote checksum')
+
+
+def test_streaming_sync_counts_failed_compares(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='dir0/file1.txt', Body=b'stale content without a recorded checksum')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), syncMode='streaming')
+
+    variable_cache = new_variable_cache()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    manifest._get_s3_key_checksum = _failing_remote_checksum
+    manifest.apply_manifest(variable_cache=variable_cache)
+
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'NOT_OK'
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir0/file1.txt')['Body'].read() != files['dir0/file1.txt']
+    assert list_keys(client=s3_client) == sorted(files.keys())
+
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    manifest._get_s3_key_checksum = _failing_remote_checksum
+    assert manifest.implemented_manifest_differ_from_this_manifest(variable_cache=new_variable_cache()) is True
+
+
+def test_streaming_sync_halts_on_failed_compares(s3_files_module, s3_client, tmp_path):
+    write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=3)
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='dir0/file1.txt', Body=b'stale content without a recorded checksum')
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), syncMode='streaming', onError='exception')
+
+    variable_cache = new_variable_cache()
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+    manifest._get_s3_key_checksum = _failing_remote_checksum
+    with pytest.raises(Exception, match='dir0/file1.txt'):
+        manifest.apply_manifest(variable_cache=variable_cache)
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'NOT_OK'
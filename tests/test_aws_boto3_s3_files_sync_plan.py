@@ -0,0 +1,55 @@
+import hashlib
+import sys
+
+
+def _key_data(key: str, size: int, content_checksum_sha256: str=None, checksum_mismatch: bool=False)->dict:
+    key_data = {'Key': key, 'LocalFullPath': '/source/{}'.format(key), 'Size': size, 'ContentChecksumSha256': content_checksum_sha256}
+    if checksum_mismatch is True:
+        key_data['ChecksumMismatch'] = True
+    return key_data
+
+
+def test_upload_jobs_are_largest_first(s3_files_module):
+    sync_plan = s3_files_module._new_sync_plan()
+    for key, size in (('small.txt', 10), ('large.txt', 5000), ('medium.txt', 300), ('empty.txt', 0)):
+        s3_files_module._sync_plan_add_upload(sync_plan=sync_plan, key_data=_key_data(key=key, size=size))
+    jobs = list(s3_files_module._sync_plan_upload_jobs(sync_plan=sync_plan))
+    assert [job['Key'] for job in jobs] == ['large.txt', 'medium.txt', 'small.txt', 'empty.txt']
+    assert jobs[0] == {'Action': 'UPLOAD', 'Key': 'large.txt', 'LocalFullPath': '/source/large.txt', 'ContentChecksumSha256': None}
+
+
+def test_checksums_round_trip_through_the_plan(s3_files_module):
+    checksums = [hashlib.sha256('file{}'.format(idx).encode('utf-8')).hexdigest() for idx in range(3)]
+    sync_plan = s3_files_module._new_sync_plan()
+    s3_files_module._sync_plan_add_upload(sync_plan=sync_plan, key_data=_key_data(key='a.txt', size=3, content_checksum_sha256=checksums[0]))
+    s3_files_module._sync_plan_add_upload(sync_plan=sync_plan, key_data=_key_data(key='b.txt', size=2))
+    s3_files_module._sync_plan_add_upload(sync_plan=sync_plan, key_data=_key_data(key='c.txt', size=1, content_checksum_sha256=checksums[2]))
+    assert len(sync_plan['Digests']) == 3 * 32
+    assert {job['Key']: job['ContentChecksumSha256'] for job in s3_files_module._sync_plan_upload_jobs(sync_plan=sync_plan)} == {'a.txt': checksums[0], 'b.txt': None, 'c.txt': checksums[2]}
+
+
+def test_copy_sources_become_copy_jobs(s3_files_module):
+    sync_plan = s3_files_module._new_sync_plan()
+    s3_files_module._sync_plan_add_upload(sync_plan=sync_plan, key_data=_key_data(key='a.txt', size=1))
+    s3_files_module._sync_plan_add_upload(sync_plan=sync_plan, key_data=_key_data(key='b.txt', size=2))
+    sync_plan['CopySources'][0] = 'old/a.txt'
+    jobs = {job['Key']: job for job in s3_files_module._sync_plan_upload_jobs(sync_plan=sync_plan)}
+    assert jobs['a.txt'] == {'Action': 'COPY', 'Key': 'a.txt', 'CopySource': 'old/a.txt', 'LocalFullPath': '/source/a.txt', 'Size': 1, 'ContentChecksumSha256': None}
+    assert jobs['b.txt']['Action'] == 'UPLOAD'
+
+
+def test_checksum_differences_are_detected(s3_files_module):
+    sync_plan = s3_files_module._new_sync_plan()
+    assert s3_files_module._sync_plan_checksum_differences_detected(sync_plan=sync_plan) is False
+    s3_files_module._sync_plan_add_upload(sync_plan=sync_plan, key_data=_key_data(key='a.txt', size=1, content_checksum_sha256=hashlib.sha256(b'a').hexdigest()))
+    assert s3_files_module._sync_plan_checksum_differences_detected(sync_plan=sync_plan) is False
+    s3_files_module._sync_plan_add_upload(sync_plan=sync_plan, key_data=_key_data(key='b.txt', size=1, checksum_mismatch=True))
+    assert s3_files_module._sync_plan_checksum_differences_detected(sync_plan=sync_plan) is True
+
+
+def test_delete_keys_are_interned(s3_files_module):
+    sync_plan = s3_files_module._new_sync_plan()
+    key = ''.join(['dir/', 'extra.txt'])
+    s3_files_module._sync_plan_add_delete(sync_plan=sync_plan, key=key)
+    assert sync_plan['DeleteKeys'] == ['dir/extra.txt',]
+    assert sync_plan['DeleteKeys'][0] is sys.intern('dir/extra.txt')
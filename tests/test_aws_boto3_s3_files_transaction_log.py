@@ -0,0 +1,60 @@
+import concurrent.futures
+import json
+import time
+
+from conftest import BUCKET_NAME, new_variable_cache, new_spec, new_manifest, write_source_tree
+
+
+def _new_manifest(module: object, tmp_path: object, transfer_log_format: str='jsonl'):
+    return new_manifest(module=module, spec=new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), transferLogFile=str(tmp_path / 'transfer.log'), transferLogFormat=transfer_log_format))
+
+
+def _read_lines(tmp_path: object)->list:
+    with open(str(tmp_path / 'transfer.log'), 'r') as f:
+        return f.read().splitlines()
+
+
+def _entry(manifest: object, key: str)->dict:
+    return manifest._transaction_log_entry(message='UPLOAD "{}"'.format(key), action='UPLOAD', succeeded=True, bucket_name=BUCKET_NAME, key=key, size=1, duration=0.1)
+
+
+def test_lines_from_many_threads_are_all_written(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path)
+    manifest._open_transaction_log()
+    keys = ['key{:04d}'.format(idx) for idx in range(2000)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lambda key: manifest._write_transaction_log(message=_entry(manifest=manifest, key=key)), keys))
+    manifest._close_transaction_log()
+    records = [json.loads(line) for line in _read_lines(tmp_path=tmp_path)]
+    assert sorted([record['Key'] for record in records]) == keys
+    assert set(records[0].keys()) == {'Timestamp', 'Message', 'Action', 'Result', 'Bucket', 'Key', 'LocalFile', 'Bytes', 'DurationSeconds'}
+
+
+def test_buffered_lines_are_written_on_close(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path, transfer_log_format='text')
+    manifest._open_transaction_log(flush_bytes=1048576, flush_interval=60.0)
+    manifest._write_transaction_log(messages=[_entry(manifest=manifest, key='a.txt'), _entry(manifest=manifest, key='b.txt')])
+    time.sleep(0.2)
+    assert _read_lines(tmp_path=tmp_path) == list()
+    manifest._close_transaction_log()
+    lines = _read_lines(tmp_path=tmp_path)
+    assert [line.split('   ', 1)[1] for line in lines] == ['UPLOAD "a.txt"', 'UPLOAD "b.txt"']
+    assert manifest.transaction_log is None
+
+
+def test_lines_are_written_directly_without_the_writer(s3_files_module, tmp_path):
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path)
+    manifest._write_transaction_log(message=_entry(manifest=manifest, key='a.txt'))
+    assert [json.loads(line)['Key'] for line in _read_lines(tmp_path=tmp_path)] == ['a.txt',]
+
+
+def test_sync_writes_one_record_per_transfer(s3_files_module, s3_client, tmp_path):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=2, files_per_directory=3)
+    manifest = _new_manifest(module=s3_files_module, tmp_path=tmp_path)
+    manifest.apply_manifest(variable_cache=new_variable_cache())
+    assert manifest.transaction_log is None
+    records = [json.loads(line) for line in _read_lines(tmp_path=tmp_path)]
+    uploads = {record['Key']: record for record in records if record['Action'] == 'UPLOAD'}
+    assert sorted(uploads.keys()) == sorted(files.keys())
+    assert uploads['dir1/file2.txt']['Result'] == 'SUCCESS'
+    assert uploads['dir1/file2.txt']['Bytes'] == len(files['dir1/file2.txt'])
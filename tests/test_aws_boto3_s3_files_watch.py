@@ -0,0 +1,142 @@
+import collections
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from conftest import BUCKET_NAME, count_s3_requests, new_variable_cache, new_spec, new_manifest, write_source_tree, list_keys, get_variable
+
+
+def test_watch_directories_end_on_symbolic_link_cycles(s3_files_module, tmp_path):
+    write_source_tree(directory=str(tmp_path / 'source'), directories=2, files_per_directory=1)
+    os.symlink(str(tmp_path / 'source'), str(tmp_path / 'source' / 'dir0' / 'loop'))
+    spec = new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'))
+    manifest = new_manifest(module=s3_files_module, spec=spec)
+
+    directories = list(manifest._iterate_watch_directories())
+    assert sorted(directories) == sorted([str(tmp_path / 'source'), str(tmp_path / 'source' / 'dir0'), str(tmp_path / 'source' / 'dir1')])
+
+    directories = list(manifest._iterate_watch_directories(root_directory=str(tmp_path / 'source' / 'dir0')))
+    assert directories[0] == str(tmp_path / 'source' / 'dir0')
+    assert len(directories) == len(set(os.path.realpath(directory) for directory in directories))
+
+
+def _watch_spec(tmp_path: object, **spec_updates)->dict:
+    return new_spec(source_directory=str(tmp_path / 'source'), staging_directory=str(tmp_path / 'staging'), **spec_updates)
+
+
+def _synced_manifest(module: object, tmp_path: object, **spec_updates):
+    files = write_source_tree(directory=str(tmp_path / 'source'), directories=2, files_per_directory=3)
+    spec = _watch_spec(tmp_path=tmp_path, **spec_updates)
+    new_manifest(module=module, spec=spec).apply_manifest(variable_cache=new_variable_cache())
+    manifest = new_manifest(module=module, spec=spec)
+    manifest._reset_run_cache()
+    manifest._init_rate_limiting()
+    return manifest, files
+
+
+def test_watched_changes_become_uploads_and_deletes(s3_files_module, s3_client, tmp_path):
+    manifest, files = _synced_manifest(module=s3_files_module, tmp_path=tmp_path)
+    source = tmp_path / 'source'
+    (source / 'dir0' / 'new.txt').write_bytes(b'created')
+    (source / 'dir0' / 'file1.txt').write_bytes(b'modified')
+    os.remove(str(source / 'dir1' / 'file0.txt'))
+    os.rename(str(source / 'dir1' / 'file2.txt'), str(source / 'dir0' / 'moved.txt'))
+    (source / 'dir0' / 'file2.txt').write_bytes(files['dir0/file2.txt'])    # Touched, but not changed
+    changed_paths = {str(source / 'dir0' / name) for name in ('new.txt', 'file1.txt', 'moved.txt', 'file2.txt')}
+    changed_paths |= {str(source / 'dir1' / name) for name in ('file0.txt', 'file2.txt')}
+    changed_paths.add(str(tmp_path / 'elsewhere.txt'))     # Not part of the sources
+
+    counts = collections.Counter()
+    count_s3_requests(manifest=manifest, counts=counts)
+    results = manifest._sync_watched_changes(changed_paths=changed_paths, removed_directories=set(), variable_cache=new_variable_cache())
+    assert results['Failed'] == 0
+    assert counts['PutObject'] == 3
+    assert counts['DeleteObjects'] == 1
+    assert counts['ListObjectsV2'] == 0
+    expected_keys = set(files.keys()) - {'dir1/file0.txt', 'dir1/file2.txt'} | {'dir0/new.txt', 'dir0/moved.txt'}
+    assert list_keys(client=s3_client) == sorted(expected_keys)
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir0/file1.txt')['Body'].read() == b'modified'
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir0/moved.txt')['Body'].read() == files['dir1/file2.txt']
+
+
+def test_keys_under_a_removed_directory_are_deleted(s3_files_module, s3_client, tmp_path):
+    manifest, files = _synced_manifest(module=s3_files_module, tmp_path=tmp_path)
+    s3_client.put_object(Bucket=BUCKET_NAME, Key='dir1-other/keep.txt', Body=b'keep')
+    shutil.rmtree(str(tmp_path / 'source' / 'dir1'))
+    results = manifest._sync_watched_changes(changed_paths=set(), removed_directories={str(tmp_path / 'source' / 'dir1')}, variable_cache=new_variable_cache())
+    assert results['Failed'] == 0
+    assert list_keys(client=s3_client) == sorted([key for key in files.keys() if key.startswith('dir0/')] + ['dir1-other/keep.txt'])
+
+
+def test_watched_changes_keep_extra_remote_keys(s3_files_module, s3_client, tmp_path):
+    manifest, files = _synced_manifest(module=s3_files_module, tmp_path=tmp_path, actionExtraFilesOnS3='Keep')
+    os.remove(str(tmp_path / 'source' / 'dir0' / 'file0.txt'))
+    shutil.rmtree(str(tmp_path / 'source' / 'dir1'))
+    manifest._sync_watched_changes(changed_paths={str(tmp_path / 'source' / 'dir0' / 'file0.txt')}, removed_directories={str(tmp_path / 'source' / 'dir1')}, variable_cache=new_variable_cache())
+    assert list_keys(client=s3_client) == sorted(files.keys())
+
+
+@pytest.mark.parametrize('on_error, halted', [('warn', False), ('exception', True)])
+def test_failed_compares_do_not_stop_the_batch(s3_files_module, s3_client, tmp_path, on_error, halted):
+    manifest, files = _synced_manifest(module=s3_files_module, tmp_path=tmp_path, onError=on_error)
+    source = tmp_path / 'source'
+    (source / 'dir0' / 'file0.txt').write_bytes(b'denied')
+    (source / 'dir0' / 'file1.txt').write_bytes(b'modified')
+    original_head_s3_key = manifest._head_s3_key
+
+    def head_s3_key(key: str, **kwargs):
+        if key == 'dir0/file0.txt':
+            raise Exception('Simulated AccessDenied')
+        return original_head_s3_key(key=key, **kwargs)
+
+    manifest._head_s3_key = head_s3_key
+    shutil.rmtree(str(source / 'dir1'))
+    count_s3_requests(manifest=manifest, counts=collections.Counter(), fail_operation='ListObjectsV2')
+    results = manifest._sync_watched_changes(changed_paths={str(source / 'dir0' / 'file0.txt'), str(source / 'dir0' / 'file1.txt')}, removed_directories={str(source / 'dir1')}, variable_cache=new_variable_cache())
+    assert results['Failed'] == 2
+    assert sorted(results['FailedKeys']) == ['dir0/file0.txt', 'dir1/']
+    assert results['Halted'] is halted
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir0/file1.txt')['Body'].read() == b'modified'
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir0/file0.txt')['Body'].read() == files['dir0/file0.txt']
+
+
+def test_watch_events_are_collected_in_one_batch(s3_files_module, tmp_path):
+    write_source_tree(directory=str(tmp_path / 'source'), directories=1, files_per_directory=2)
+    manifest = new_manifest(module=s3_files_module, spec=_watch_spec(tmp_path=tmp_path))
+    watch_state = {'ChangedPaths': set(), 'RemovedDirectories': set(), 'FullSyncRequired': False, 'FirstEvent': None, 'LastEvent': None}
+    changed_file = str(tmp_path / 'source' / 'dir0' / 'file0.txt')
+    manifest._record_watch_events(watcher=None, events=[(changed_file, s3_files_module._IN_MODIFY), (changed_file, s3_files_module._IN_CLOSE_WRITE)], watch_state=watch_state)
+    first_event = watch_state['FirstEvent']
+    assert first_event is not None
+    manifest._record_watch_events(watcher=None, events=[(changed_file, s3_files_module._IN_MODIFY)], watch_state=watch_state)
+    assert watch_state['ChangedPaths'] == {changed_file,}
+    assert watch_state['FirstEvent'] == first_event
+    assert watch_state['LastEvent'] >= first_event
+    manifest._record_watch_events(watcher=None, events=[(None, s3_files_module._IN_Q_OVERFLOW)], watch_state=watch_state)
+    assert watch_state['FullSyncRequired'] is True
+
+
+def test_repeated_changes_are_uploaded_once(s3_files_module, s3_client, tmp_path):
+    manifest, files = _synced_manifest(module=s3_files_module, tmp_path=tmp_path, watch={'enabled': True, 'debounceSeconds': 0.5, 'maxRunSeconds': 3.0})
+    counts = collections.Counter()
+    count_s3_requests(manifest=manifest, counts=counts)
+    changed_file = str(tmp_path / 'source' / 'dir0' / 'file0.txt')
+
+    def change_file():
+        time.sleep(0.5)
+        for idx in range(5):
+            with open(changed_file, 'wb') as f:
+                f.write('version {}'.format(idx).encode('utf-8'))
+            time.sleep(0.05)
+
+    changing_thread = threading.Thread(target=change_file)
+    changing_thread.start()
+    variable_cache = new_variable_cache()
+    manifest._watch_local_sources(variable_cache=variable_cache)
+    changing_thread.join()
+    assert counts['PutObject'] == 1
+    assert s3_client.get_object(Bucket=BUCKET_NAME, Key='dir0/file0.txt')['Body'].read() == b'version 4'
+    assert get_variable(variable_cache=variable_cache, name='SYNC_RESULT') == 'ALL_OK'
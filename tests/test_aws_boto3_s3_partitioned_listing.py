@@ -0,0 +1,149 @@
+import logging
+import threading
+
+import pytest
+
+from conftest import BUCKET_NAME, new_variable_cache
+
+
+class CountingClient:
+    # Counts the list_objects_v2 requests and optionally fails one of the requests of a worker thread
+
+    def __init__(self, client: object, fail_worker_request: int=None):
+        self.client = client
+        self.fail_worker_request = fail_worker_request
+        self.lock = threading.Lock()
+        self.requests = list()
+        self.worker_requests = 0
+
+    def list_objects_v2(self, **parameters):
+        with self.lock:
+            self.requests.append(parameters)
+            if threading.current_thread() is not threading.main_thread():
+                self.worker_requests += 1
+                if self.worker_requests == self.fail_worker_request:
+                    raise Exception('Simulated listing failure')
+        return self.client.list_objects_v2(**parameters)
+
+
+@pytest.fixture(params=['s3_files_module', 's3_bucket_module'])
+def listing_module(request):
+    # Both implementations carry their own copy of the partitioned listing
+    return request.getfixturevalue(request.param)
+
+
+def _put_keys(client: object, keys: list):
+    for key in keys:
+        client.put_object(Bucket=BUCKET_NAME, Key=key, Body=b'')
+
+
+def _listed_keys(client: object)->list:
+    keys = list()
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket=BUCKET_NAME):
+        keys += [key_data['Key'] for key_data in page.get('Contents', list())]
+    return keys
+
+
+def _partitioned_keys(module: object, client: object, **kwargs)->list:
+    return [key_data['Key'] for key_data in module._list_s3_keys_partitioned(client=client, bucket_name=BUCKET_NAME, **kwargs)]
+
+
+@pytest.fixture
+def split_segments(listing_module, monkeypatch):
+    # Records the number of ranges every split created
+    splits = list()
+    original_split_listing_segment = listing_module._split_listing_segment
+
+    def split_listing_segment(**kwargs)->list:
+        children = original_split_listing_segment(**kwargs)
+        splits.append(len(children))
+        return children
+
+    monkeypatch.setattr(listing_module, '_split_listing_segment', split_listing_segment)
+    return splits
+
+
+def test_keys_are_listed_in_listing_order(listing_module, s3_client):
+    keys = ['docs/{}.md'.format(name) for name in ('a', 'B', 'c-1', 'c.1', 'c_1', 'z~')]
+    keys += ['img/{:02d}/photo{:02d}.jpg'.format(idx % 5, idx) for idx in range(40)]
+    keys += ['readme.txt', 'setup.py', 'src/main.py', 'src/lib/util.py', 'src-old/main.py', 'Z.txt', '-first']
+    _put_keys(client=s3_client, keys=keys)
+    expected_keys = _listed_keys(client=s3_client)
+    assert sorted(expected_keys) == sorted(keys)
+    for page_size in (3, 7, 1000):
+        client = CountingClient(client=s3_client)
+        assert _partitioned_keys(module=listing_module, client=client, max_workers=4, page_size=page_size, split_after_pages=2) == expected_keys
+        assert len({(request['Prefix'], request.get('StartAfter', None)) for request in client.requests if 'ContinuationToken' not in request}) > 1
+
+
+def test_one_large_prefix_is_split(listing_module, s3_client, split_segments):
+    keys = ['big/{}{:03d}'.format(letter, idx) for letter in 'abcdefgh' for idx in range(40)]
+    keys += ['small/one.txt', 'small/two.txt', 'top.txt']
+    _put_keys(client=s3_client, keys=keys)
+    client = CountingClient(client=s3_client)
+    assert _partitioned_keys(module=listing_module, client=client, max_workers=4, page_size=10, split_after_pages=2) == _listed_keys(client=s3_client)
+    assert max(split_segments) > 1
+    assert len([request for request in client.requests if request['Prefix'] == 'big/' and 'StartAfter' in request]) > 1
+
+
+@pytest.mark.parametrize('page_size', [2, 3, 5, 8])
+def test_direct_keys_mixed_with_prefixes(listing_module, s3_client, page_size):
+    keys = ['k{:03d}'.format(idx) for idx in range(60)]
+    keys += ['k{:03d}/nested{}.txt'.format(idx, nested) for idx in range(0, 60, 3) for nested in range(2)]
+    keys += ['k{:03d}x/file.txt'.format(idx) for idx in range(0, 60, 7)]
+    _put_keys(client=s3_client, keys=keys)
+    assert _partitioned_keys(module=listing_module, client=s3_client, max_workers=3, page_size=page_size, split_after_pages=2) == _listed_keys(client=s3_client)
+
+
+def test_prefix_listing(listing_module, s3_client):
+    _put_keys(client=s3_client, keys=['a/1', 'a/b/2', 'a/c/3', 'ab/4', 'b/5'])
+    assert _partitioned_keys(module=listing_module, client=s3_client, prefix='a/', max_workers=2, page_size=1) == ['a/1', 'a/b/2', 'a/c/3']
+    assert _partitioned_keys(module=listing_module, client=s3_client, prefix='c/', max_workers=2) == list()
+
+
+def test_worker_errors_are_raised_to_the_consumer(listing_module, s3_client):
+    _put_keys(client=s3_client, keys=['dir{}/file{:02d}'.format(directory, idx) for directory in range(4) for idx in range(20)])
+    client = CountingClient(client=s3_client, fail_worker_request=3)
+    thread_count = threading.active_count()
+    with pytest.raises(Exception, match='Simulated listing failure'):
+        _partitioned_keys(module=listing_module, client=client, max_workers=4, page_size=5, split_after_pages=100)
+    assert threading.active_count() == thread_count     # The listing workers were stopped
+
+
+def _new_bucket_manifest(module: object, **spec_updates):
+    spec = {'awsBoto3Session': 'test-session', 'name': BUCKET_NAME, 'deleteStrategy': 'EMPTY_BUCKET_FIRST'}
+    spec.update(spec_updates)
+    manifest = module.AwsBoto3S3Bucket(logger=logging.getLogger('test'))
+    manifest.parse_manifest(manifest_data={'kind': 'AwsBoto3S3Bucket', 'version': 'v1', 'metadata': {'name': 'test-bucket', 'environments': ['default']}, 'spec': spec})
+    return manifest
+
+
+def test_bucket_is_emptied_with_listing_workers(s3_bucket_module, s3_client):
+    _put_keys(client=s3_client, keys=['dir{}/file{:04d}'.format(idx % 3, idx) for idx in range(1200)])
+    manifest = _new_bucket_manifest(module=s3_bucket_module, listWorkers=4)
+    assert len(manifest._get_s3_keys(variable_cache=new_variable_cache())) == 1200
+    manifest.delete_manifest(variable_cache=new_variable_cache())
+    assert BUCKET_NAME not in [bucket['Name'] for bucket in s3_client.list_buckets()['Buckets']]
+
+
+@pytest.mark.parametrize('list_workers', [1, 4])
+def test_bucket_listing_errors_are_raised(s3_bucket_module, s3_client, list_workers):
+    _put_keys(client=s3_client, keys=['dir{}/file{:04d}'.format(idx % 3, idx) for idx in range(1200)])
+    manifest = _new_bucket_manifest(module=s3_bucket_module, listWorkers=list_workers)
+    original_get_boto3_s3_client = manifest._get_boto3_s3_client
+    requests = list()
+
+    def fail_second_listing(params, **kwargs):
+        requests.append(params)
+        if len(requests) == 2:
+            raise Exception('Simulated listing failure')
+
+    def get_boto3_s3_client(**kwargs):
+        client = original_get_boto3_s3_client(**kwargs)
+        client.meta.events.register('before-call.s3.ListObjectsV2', fail_second_listing)
+        return client
+
+    manifest._get_boto3_s3_client = get_boto3_s3_client
+    with pytest.raises(Exception, match='Failed to list the keys in bucket'):
+        manifest._get_s3_keys(variable_cache=new_variable_cache())
+    assert manifest._get_s3_keys(variable_cache=new_variable_cache(), max_keys=10) == [{'Key': key} for key in _listed_keys(client=s3_client)[:10]]